@@ -1,7 +1,10 @@
 from payments.mtn_api import MtnPaymentHelper, auth_keys
+from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.views import APIView
+from app_api.models import PaymentRequest
+from utils.idempotency import idempotent
 from .serializers import PaymentSerializer
 from .services import PaymentService
 import logging
@@ -9,7 +12,25 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+def payment_scope(request):
+    """
+    Idempotency keys are per authenticated caller. Anonymous callers get
+    None, and so cannot use keys: a scope taken from the request body would
+    let anyone replay another client's payment.
+    """
+    if request.user and request.user.is_authenticated:
+        return str(request.user.pk)
+    return None
+
+
 class PaymentView(APIView):
+    # A failed payment may still have reached MoMo, so its error is replayed
+    # rather than letting a retry send a second request-to-pay.
+    @idempotent(
+        scope=payment_scope,
+        lock_timeout=lambda: PaymentService.max_processing_time() + 30,
+        replay_errors=True,
+    )
     def post(self, request, *args, **kwargs):
         serializer = PaymentSerializer(data=request.data)
         if serializer.is_valid():
@@ -26,10 +47,54 @@ class PaymentView(APIView):
                 {
                     "transaction_id": str(transaction.id),
                     "reference": str(transaction.reference_number),
-                    "message": "Payment created successfully",
+                    "message": "Payment request accepted",
                     "status": payment_status,
                     "transaction_ref": transaction_ref,
                 },
-                status=status.HTTP_201_CREATED,
+                status=status.HTTP_202_ACCEPTED,
             )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class PaymentCallbackView(APIView):
+    """
+    Receives MTN's request-to-pay callbacks (``MOMO_CALLBACK_URL``).
+
+    The callback is unauthenticated, so its body only says which payment to
+    look at; the status itself is re-read from MoMo before it is applied.
+    Resolved payments and ones checked within
+    ``PaymentService.CALLBACK_CHECK_INTERVAL`` are not re-read, so callbacks
+    cannot be used to flood MoMo.
+    """
+
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def put(self, request, *args, **kwargs):
+        external_id = request.data.get("externalId")
+        payment_request = (
+            PaymentRequest.objects.filter(transaction__reference_number=external_id)
+            .select_related("transaction")
+            .first()
+        )
+        if not external_id or payment_request is None:
+            return Response(
+                {"error": "Unknown payment"}, status=status.HTTP_404_NOT_FOUND
+            )
+
+        if payment_request.resolved_at is None and not (
+            PaymentService.checked_recently(payment_request)
+        ):
+            try:
+                payment_request = PaymentService.refresh_payment(payment_request)
+            except Exception as e:
+                logger.error(f"Error handling payment callback: {e}")
+                return Response(
+                    {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                )
+        return Response(
+            {"status": payment_request.transaction.status}, status=status.HTTP_200_OK
+        )
+
+    def post(self, request, *args, **kwargs):
+        return self.put(request, *args, **kwargs)
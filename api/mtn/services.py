@@ -1,12 +1,33 @@
-from payments.mtn_api import MtnPaymentHelper, auth_keys
+from payments.gateway import get_gateway_client
+from payments.mtn_api import MtnCredentialManager, MtnPaymentHelper, auth_keys
+from utils.errors import PaymentUnconfirmedError
 import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from django.db import transaction as db_transaction
+from django.utils import timezone
+from app_api.models import PaymentRequest
 from sales.models import Transaction
 
 logger = logging.getLogger(__name__)
 
 
 class PaymentService:
+    # MoMo request-to-pay statuses that settle a payment.
+    PROVIDER_STATUSES = {
+        "SUCCESSFUL": Transaction.STATUS_COMPLETED,
+        "FAILED": Transaction.STATUS_FAILED,
+        "REJECTED": Transaction.STATUS_FAILED,
+        "TIMEOUT": Transaction.STATUS_FAILED,
+    }
+    POLL_BASE_DELAY = timedelta(seconds=5)
+    POLL_MAX_DELAY = timedelta(minutes=10)
+    POLL_CLAIM_TIMEOUT = timedelta(minutes=1)
+    PAYMENT_EXPIRY = timedelta(hours=24)
+    # Callbacks are unauthenticated; they trigger at most one check this often.
+    CALLBACK_CHECK_INTERVAL = timedelta(seconds=5)
+
     @staticmethod
     def create_payment(validated_data):
         return Transaction.objects.create(
@@ -34,7 +55,7 @@ class PaymentService:
         return api_user, api_key
 
     @staticmethod
-    def initiate_payment(transaction, api_user, api_key):
+    def initiate_payment(transaction, api_user, api_key, reference_id=None):
         party_id = "46733123453"
         external_id = str(transaction.reference_number)
         payment_helper = MtnPaymentHelper(api_user_id=api_user, api_key=api_key)
@@ -45,6 +66,7 @@ class PaymentService:
                 currency="EUR",
                 party_id=party_id,
                 external_id=external_id,
+                reference_id=reference_id,
             )
             if not transaction_ref:
                 logger.error("Failed to initiate payment request.")
@@ -52,6 +74,8 @@ class PaymentService:
 
             logger.info(f"Payment initiated. Transaction reference: {transaction_ref}")
             return transaction_ref
+        except PaymentUnconfirmedError:
+            raise
         except Exception as e:
             logger.error(f"Error during payment initiation: {e}")
             return None
@@ -71,25 +95,174 @@ class PaymentService:
             return None
 
     @staticmethod
-    @db_transaction.atomic
+    def max_processing_time():
+        """
+        Seconds ``process_payment`` can spend on MoMo before every call times
+        out: a credentials refresh and a token refresh (or the waits for
+        another process's), then the request-to-pay, whose connection may be
+        retried.
+        """
+        client = get_gateway_client()
+        connect, read = client.timeout_for("request_to_pay")
+        refresh = MtnCredentialManager().lock_timeout
+        return 2 * refresh + (client.retries + 1) * connect + read
+
+    @staticmethod
     def process_payment(validated_data):
-        transaction = PaymentService.create_payment(validated_data)
+        """
+        Record a PENDING transaction and send MoMo the request-to-pay.
+
+        No database transaction is held across the MoMo calls; the final
+        status arrives later through ``resolve_payment``. The transaction is
+        deleted only if the request-to-pay certainly never reached MoMo; if
+        it may have (a read timeout or a 5xx), it stays PENDING for the
+        poller to settle by its reference id.
+        """
+        with db_transaction.atomic():
+            transaction = PaymentService.create_payment(validated_data)
+            payment_request = PaymentRequest.objects.create(
+                transaction=transaction,
+                next_check_at=timezone.now() + PaymentService.POLL_BASE_DELAY,
+            )
 
         api_user, api_key = PaymentService.authenticate()
         if not api_user or not api_key:
+            transaction.delete()
             raise Exception("Failed to obtain API keys")
 
-        transaction_ref = PaymentService.initiate_payment(
-            transaction, api_user, api_key
-        )
+        try:
+            transaction_ref = PaymentService.initiate_payment(
+                transaction, api_user, api_key, payment_request.reference_id
+            )
+        except PaymentUnconfirmedError as e:
+            logger.warning(f"{e}; leaving it to the poller.")
+            return transaction, str(payment_request.reference_id), transaction.status
         if not transaction_ref:
+            transaction.delete()
             raise Exception("Failed to initiate payment request")
 
+        return transaction, transaction_ref, transaction.status
+
+    @staticmethod
+    def next_check_delay(attempts):
+        delay = min(
+            PaymentService.POLL_BASE_DELAY * 2 ** max(attempts - 1, 0),
+            PaymentService.POLL_MAX_DELAY,
+        )
+        return delay * random.uniform(1, 1.25)
+
+    @staticmethod
+    def resolve_payment(payment_request, details, scheduled=True):
+        """
+        Apply MoMo's view of a request-to-pay to its transaction.
+
+        A final status completes or fails the transaction, which posts it to
+        the ledger; anything else schedules the next check with exponential
+        backoff until ``PAYMENT_EXPIRY`` fails it. ``details`` is None when
+        MoMo could not be reached, and the request then stays pending, even
+        past its expiry. Checks that were not ``scheduled`` by the poller
+        (callbacks) leave the backoff alone. Safe to call from the callback
+        and the poller at once: the request row is locked and a resolved
+        request is left alone.
+        """
+        now = timezone.now()
+        with db_transaction.atomic():
+            payment_request = (
+                PaymentRequest.objects.select_for_update()
+                .select_related("transaction")
+                .get(pk=payment_request.pk)
+            )
+            if payment_request.resolved_at is not None:
+                return payment_request
+
+            payment_request.last_checked_at = now
+            if scheduled:
+                payment_request.attempts += 1
+            provider_status = (details or {}).get("status", "")
+            status = PaymentService.PROVIDER_STATUSES.get(provider_status)
+            expired = now - payment_request.created_at >= PaymentService.PAYMENT_EXPIRY
+            if status is None and (details is None or not expired):
+                if details is not None:
+                    payment_request.provider_status = provider_status
+                if scheduled:
+                    payment_request.next_check_at = (
+                        now + PaymentService.next_check_delay(payment_request.attempts)
+                    )
+                payment_request.save()
+                return payment_request
+
+            if status is None:
+                status = Transaction.STATUS_FAILED
+                details = {"reason": "Payment request expired"}
+            payment_request.provider_status = provider_status
+            payment_request.reason = str(details.get("reason") or "")[:255]
+            payment_request.resolved_at = now
+            payment_request.save()
+
+            transaction = payment_request.transaction
+            if transaction.status == Transaction.STATUS_PENDING:
+                transaction.status = status
+                transaction.save()
+        logger.info(
+            f"Payment {payment_request.reference_id} resolved as {transaction.status}"
+        )
+        return payment_request
+
+    @staticmethod
+    def claim_due_payments(limit):
+        """Lease up to ``limit`` due requests so concurrent pollers split them."""
+        now = timezone.now()
+        with db_transaction.atomic():
+            due = list(
+                PaymentRequest.objects.select_for_update(skip_locked=True)
+                .filter(resolved_at__isnull=True, next_check_at__lte=now)
+                .order_by("next_check_at")[:limit]
+            )
+            PaymentRequest.objects.filter(pk__in=[r.pk for r in due]).update(
+                next_check_at=now + PaymentService.POLL_CLAIM_TIMEOUT
+            )
+        return due
+
+    @staticmethod
+    def poll_payments(limit=100, concurrency=8):
+        """Check every due request in one batch; returns how many were checked."""
+        due = PaymentService.claim_due_payments(limit)
+        if not due:
+            return 0
+
+        api_user, api_key = PaymentService.authenticate()
+        if not api_user or not api_key:
+            logger.error("Skipping payment status poll: no API keys.")
+            return 0
+
         payment_helper = MtnPaymentHelper(api_user_id=api_user, api_key=api_key)
-        payment_status = PaymentService.check_payment_status(
-            payment_helper, transaction_ref
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(
+                executor.map(
+                    lambda r: payment_helper.payment_details(str(r.reference_id)),
+                    due,
+                )
+            )
+        for payment_request, details in zip(due, results):
+            PaymentService.resolve_payment(payment_request, details)
+        return len(due)
+
+    @staticmethod
+    def checked_recently(payment_request):
+        last_checked_at = payment_request.last_checked_at
+        return last_checked_at is not None and (
+            timezone.now() - last_checked_at < PaymentService.CALLBACK_CHECK_INTERVAL
         )
-        if not payment_status:
-            raise Exception("Failed to check payment status")
 
-        return transaction, transaction_ref, payment_status
+    @staticmethod
+    def refresh_payment(payment_request):
+        """
+        Fetch and apply the current status of one request for a callback,
+        without counting it toward the poller's backoff.
+        """
+        api_user, api_key = PaymentService.authenticate()
+        if not api_user or not api_key:
+            raise Exception("Failed to obtain API keys")
+        payment_helper = MtnPaymentHelper(api_user_id=api_user, api_key=api_key)
+        details = payment_helper.payment_details(str(payment_request.reference_id))
+        return PaymentService.resolve_payment(payment_request, details, scheduled=False)
@@ -0,0 +1,65 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from django.core.management.base import BaseCommand
+from payments.gateway import GatewayClient
+from payments.momo_stub import MomoStubServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare bare requests calls with the pooled MoMo gateway client "
+        "against a local sandbox stub"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.0,
+            help="Seconds the stub waits before answering each request",
+        )
+
+    def handle(self, *args, **options):
+        total = options["requests"]
+        concurrency = options["concurrency"]
+
+        with MomoStubServer(latency=options["latency"]) as stub:
+            url = f"{stub.base_url}/disbursement/v1_0/account/balance"
+            client = GatewayClient(pool_size=concurrency)
+
+            def bare():
+                return requests.get(url).status_code
+
+            def pooled():
+                return client.get(url, operation="balance").status_code
+
+            for name, call in (("bare requests", bare), ("pooled client", pooled)):
+                stub.calls.clear()
+                latencies, elapsed = self.run(call, total, concurrency)
+                self.report(name, latencies, elapsed, stub.calls["connections"])
+            client.close()
+
+    def run(self, call, total, concurrency):
+        def timed(_):
+            started = time.perf_counter()
+            call()
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(timed, range(total)))
+        return latencies, time.perf_counter() - started
+
+    def report(self, name, latencies, elapsed, connections):
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        self.stdout.write(
+            f"{name:<14} mean {statistics.mean(latencies) * 1000:7.2f} ms  "
+            f"p95 {p95 * 1000:7.2f} ms  "
+            f"{len(latencies) / elapsed:8.1f} req/s  "
+            f"{connections} connections"
+        )
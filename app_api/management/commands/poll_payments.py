@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand
+from api.mtn.services import PaymentService
+
+
+class Command(BaseCommand):
+    help = "Poll MoMo for the final status of pending payment requests"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds to sleep when no payment is due",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Check one batch and exit"
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        while True:
+            checked = PaymentService.poll_payments(
+                limit=batch_size, concurrency=options["concurrency"]
+            )
+            if checked:
+                self.stdout.write(f"Checked {checked} payment request(s).")
+            if options["once"]:
+                break
+            if checked < batch_size:
+                time.sleep(options["interval"])
@@ -0,0 +1,63 @@
+# Generated by Django 5.0.7 on 2026-10-18 11:26
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("sales", "0003_sales_rollups"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentRequest",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "reference_id",
+                    models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+                ),
+                ("provider_status", models.CharField(blank=True, max_length=20)),
+                ("reason", models.CharField(blank=True, max_length=255)),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("last_checked_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "next_check_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("resolved_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "transaction",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="payment_request",
+                        to="sales.transaction",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("resolved_at__isnull", True)),
+                        fields=["next_check_at"],
+                        name="payment_request_due_idx",
+                    )
+                ],
+            },
+        ),
+    ]
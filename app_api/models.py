@@ -1,3 +1,41 @@
+import uuid
 from django.db import models
+from django.utils import timezone
+from sales.models import Transaction
 
-# Create your models here.
+
+class PaymentRequest(models.Model):
+    """
+    A MoMo request-to-pay awaiting its final status.
+
+    The owning ``Transaction`` stays PENDING until MTN's callback or the
+    status poller resolves the request. ``next_check_at`` drives the
+    poller's exponential backoff.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    transaction = models.OneToOneField(
+        Transaction, on_delete=models.CASCADE, related_name="payment_request"
+    )
+    reference_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    provider_status = models.CharField(max_length=20, blank=True)
+    reason = models.CharField(max_length=255, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_checked_at = models.DateTimeField(null=True, blank=True)
+    next_check_at = models.DateTimeField(default=timezone.now)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return (
+            f"Payment request {self.reference_id} - {self.provider_status or 'PENDING'}"
+        )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["next_check_at"],
+                condition=models.Q(resolved_at__isnull=True),
+                name="payment_request_due_idx",
+            ),
+        ]
@@ -1,3 +1,588 @@
-from django.test import TestCase
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+import requests
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.response import Response
+from api.mtn.services import PaymentService
+from ledger.models import LedgerAccount
+from payments.gateway import GatewayClient
+from payments.momo_stub import MomoStubServer
+from payments.mtn_api import MtnCredentialManager, MtnPaymentHelper, auth_keys
+from sales.models import PaymentMethods, Transaction
+from users.models import Client, Merchant, User
+from utils.errors import PaymentUnconfirmedError
+from utils.idempotency import IdempotencyStore, idempotent
+from .models import PaymentRequest
 
-# Create your tests here.
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "app-api-tests",
+        }
+    }
+)
+class MomoStubTestCase(TestCase):
+    stub_options = {}
+
+    def setUp(self):
+        self.stub = MomoStubServer(**self.stub_options).start()
+        self.addCleanup(self.stub.stop)
+        environ = {"MOMO_BASE_URL": self.stub.base_url}
+        patcher = mock.patch.dict(os.environ, environ)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        os.environ.pop("MOMO_API_USER", None)
+        os.environ.pop("MOMO_API_KEY", None)
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+
+class MtnCredentialManagerTests(MomoStubTestCase):
+    def test_credentials_are_provisioned_once(self):
+        first = auth_keys()
+        second = auth_keys()
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.stub.calls["create_apiuser"], 1)
+        self.assertEqual(self.stub.calls["create_api_key"], 1)
+
+    def test_configured_credentials_skip_provisioning(self):
+        with mock.patch.dict(
+            os.environ, {"MOMO_API_USER": "user", "MOMO_API_KEY": "key"}
+        ):
+            self.assertEqual(auth_keys(), {"api_user": "user", "api_key": "key"})
+        self.assertEqual(self.stub.calls["create_apiuser"], 0)
+
+    def test_access_token_is_reused_across_helpers(self):
+        credentials = auth_keys()
+        for _ in range(3):
+            helper = MtnPaymentHelper(
+                api_user_id=credentials["api_user"], api_key=credentials["api_key"]
+            )
+            self.assertEqual(helper.balance(), "1000.00")
+
+        self.assertEqual(self.stub.calls["create_token"], 1)
+        self.assertEqual(self.stub.calls["balance"], 3)
+
+    def test_concurrent_refresh_mints_one_token(self):
+        manager = MtnCredentialManager()
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            tokens = set(
+                executor.map(
+                    lambda _: manager.get_access_token("user", "key"), range(20)
+                )
+            )
+
+        self.assertEqual(len(tokens), 1)
+        self.assertEqual(self.stub.calls["create_token"], 1)
+
+    def test_invalidated_token_is_refreshed(self):
+        manager = MtnCredentialManager()
+        token = manager.get_access_token("user", "key")
+        manager.invalidate_access_token("user")
+
+        self.assertNotEqual(manager.get_access_token("user", "key"), token)
+        self.assertEqual(self.stub.calls["create_token"], 2)
+
+    def test_rejected_token_is_dropped(self):
+        credentials = auth_keys()
+        helper = MtnPaymentHelper(
+            api_user_id=credentials["api_user"], api_key=credentials["api_key"]
+        )
+        self.stub.revoked_tokens.add(helper.get_access_token())
+
+        self.assertIsNone(helper.payment_details("missing"))
+        self.assertEqual(helper.balance(), "1000.00")
+        self.assertEqual(self.stub.calls["create_token"], 2)
+
+    def test_lock_timeout_gives_up_without_refreshing(self):
+        manager = MtnCredentialManager()
+        cache.set("mtn:access-token:user:lock", "other", 60)
+        produce = mock.Mock(return_value=("token", 60))
+
+        with mock.patch.object(
+            MtnCredentialManager, "lock_timeout", new_callable=mock.PropertyMock
+        ) as lock_timeout:
+            lock_timeout.return_value = 0.1
+            token = manager._get_or_refresh("mtn:access-token:user", produce)
+
+        self.assertIsNone(token)
+        produce.assert_not_called()
+        self.assertEqual(cache.get("mtn:access-token:user:lock"), "other")
+
+    def test_expired_lock_is_not_released_by_its_old_holder(self):
+        manager = MtnCredentialManager()
+
+        def produce():
+            # The lock timed out mid-refresh and another process took it.
+            cache.set("mtn:access-token:user:lock", "other", 60)
+            return "token", 60
+
+        self.assertEqual(
+            manager._get_or_refresh("mtn:access-token:user", produce), "token"
+        )
+        self.assertEqual(cache.get("mtn:access-token:user:lock"), "other")
+
+    def test_slow_refresh_does_not_block_other_keys(self):
+        manager = MtnCredentialManager()
+        provisioning = threading.Event()
+        release = threading.Event()
+
+        def provision():
+            provisioning.set()
+            release.wait(5)
+            return {"api_user": "user", "api_key": "key"}, None
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            credentials = executor.submit(
+                manager._get_or_refresh, manager.CREDENTIALS_CACHE_KEY, provision
+            )
+            provisioning.wait(5)
+            try:
+                token = manager._get_or_refresh(
+                    "mtn:access-token:user", lambda: ("token", 60)
+                )
+                self.assertFalse(credentials.done())
+            finally:
+                release.set()
+
+        self.assertEqual(token, "token")
+        self.assertEqual(credentials.result()["api_user"], "user")
+
+    def test_lock_outlasts_provisioning_timeouts(self):
+        with mock.patch.dict(os.environ, {"MOMO_TIMEOUT_PROVISIONING": "5,40"}):
+            self.assertGreater(MtnCredentialManager().lock_timeout, 2 * 45)
+
+
+class MtnTokenExpiryTests(MomoStubTestCase):
+    stub_options = {"token_lifetime": MtnCredentialManager.TOKEN_EXPIRY_MARGIN + 1}
+
+    def test_token_is_refreshed_before_it_expires(self):
+        manager = MtnCredentialManager()
+        token = manager.get_access_token("user", "key")
+        self.assertEqual(manager.get_access_token("user", "key"), token)
+
+        time.sleep(1.1)
+        self.assertNotEqual(manager.get_access_token("user", "key"), token)
+        self.assertEqual(self.stub.calls["create_token"], 2)
+
+
+class PaymentTestCase(MomoStubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client_user = Client.objects.get(
+            pk=User.objects.create(
+                email="client@example.com", username="client", role=User.Role.CLIENT
+            ).pk
+        )
+        self.merchant = Merchant.objects.get(
+            pk=User.objects.create(
+                email="merchant@example.com",
+                username="merchant",
+                role=User.Role.MERCHANT,
+            ).pk
+        )
+
+    def pay(self, amount="25.00", **extra):
+        return self.client.post(
+            reverse("payment"),
+            {
+                "client": str(self.client_user.pk),
+                "merchant": str(self.merchant.pk),
+                "amount": amount,
+                "payment_method": PaymentMethods.MTN_MONEY,
+            },
+            content_type="application/json",
+            **extra,
+        )
+
+    def make_due(self):
+        PaymentRequest.objects.update(next_check_at=timezone.now())
+
+    def poll(self):
+        call_command("poll_payments", "--once", stdout=StringIO())
+
+    def merchant_balance(self):
+        account = LedgerAccount.objects.filter(
+            owner=self.merchant, account_type=LedgerAccount.AccountType.MERCHANT
+        ).first()
+        return account.balance if account else Decimal("0.00")
+
+
+class PaymentServiceTests(PaymentTestCase):
+    def test_payments_reuse_credentials_and_token(self):
+        for _ in range(3):
+            PaymentService.process_payment(
+                {
+                    "client": self.client_user,
+                    "merchant": self.merchant,
+                    "amount": Decimal("25.00"),
+                    "payment_method": PaymentMethods.MTN_MONEY,
+                }
+            )
+
+        self.assertEqual(self.stub.calls["create_apiuser"], 1)
+        self.assertEqual(self.stub.calls["create_api_key"], 1)
+        self.assertEqual(self.stub.calls["create_token"], 1)
+        self.assertEqual(self.stub.calls["request_to_pay"], 3)
+
+
+class GatewayClientTests(MomoStubTestCase):
+    def helper(self):
+        return MtnPaymentHelper(api_user_id="user", api_key="key")
+
+    def test_connections_are_reused(self):
+        client = GatewayClient()
+        for _ in range(5):
+            response = client.get(
+                f"{self.stub.base_url}/disbursement/v1_0/account/balance"
+            )
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.stub.calls["connections"], 1)
+
+    def test_idempotent_gets_are_retried(self):
+        self.stub.failures["balance"] = 2
+        with mock.patch.dict(os.environ, {"MOMO_HTTP_BACKOFF": "0.01"}):
+            client = GatewayClient()
+        with mock.patch("payments.mtn_api.get_gateway_client", return_value=client):
+            self.assertEqual(self.helper().balance(), "1000.00")
+
+        self.assertEqual(self.stub.calls["balance"], 3)
+
+    def test_posts_are_not_retried(self):
+        self.stub.failures["request_to_pay"] = 1
+        with mock.patch(
+            "payments.mtn_api.get_gateway_client",
+            return_value=GatewayClient(backoff=0.01),
+        ), self.assertRaises(PaymentUnconfirmedError):
+            self.helper().request_to_pay(
+                amount=Decimal("10.00"),
+                currency="EUR",
+                external_id="TXN-1",
+                party_id="46733123453",
+            )
+
+        self.assertEqual(self.stub.calls["request_to_pay"], 1)
+
+    def test_operation_timeouts(self):
+        self.stub.latency = 0.3
+        client = GatewayClient(retries=0)
+        url = f"{self.stub.base_url}/disbursement/v1_0/account/balance"
+        with mock.patch.dict(os.environ, {"MOMO_TIMEOUT_BALANCE": "1,0.05"}):
+            self.assertEqual(client.timeout_for("balance"), (1.0, 0.05))
+            with self.assertRaises(requests.exceptions.RequestException):
+                client.get(url, operation="balance")
+        self.assertEqual(client.get(url, operation="balance").status_code, 200)
+
+
+class PaymentLifecycleTests(PaymentTestCase):
+    def test_payment_is_accepted_without_waiting_for_status(self):
+        response = self.pay()
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["status"], Transaction.STATUS_PENDING)
+        payment_request = PaymentRequest.objects.get()
+        self.assertEqual(
+            response.json()["transaction_ref"], str(payment_request.reference_id)
+        )
+        self.assertEqual(self.stub.calls["request_to_pay"], 1)
+        self.assertEqual(self.stub.calls["payment_status"], 0)
+
+    def test_poller_settles_payments_into_the_ledger(self):
+        self.pay()
+        self.pay("5.00")
+        self.poll()
+        self.assertEqual(self.stub.calls["payment_status"], 0)
+
+        self.make_due()
+        self.poll()
+
+        self.assertEqual(self.stub.calls["payment_status"], 2)
+        self.assertEqual(
+            Transaction.objects.filter(status=Transaction.STATUS_COMPLETED).count(), 2
+        )
+        self.assertEqual(self.merchant_balance(), Decimal("30.00"))
+        self.assertFalse(
+            PaymentRequest.objects.filter(resolved_at__isnull=True).exists()
+        )
+
+    def test_pending_payments_back_off(self):
+        self.stub.payment_status = "PENDING"
+        self.pay()
+
+        delays = []
+        for _ in range(3):
+            self.make_due()
+            started = timezone.now()
+            self.poll()
+            payment_request = PaymentRequest.objects.get()
+            delays.append(payment_request.next_check_at - started)
+
+        self.assertEqual(payment_request.attempts, 3)
+        self.assertLess(delays[0], delays[1])
+        self.assertLess(delays[1], delays[2])
+        self.assertEqual(Transaction.objects.get().status, Transaction.STATUS_PENDING)
+
+        self.poll()
+        self.assertEqual(self.stub.calls["payment_status"], 3)
+
+    def test_expired_payments_fail(self):
+        self.stub.payment_status = "PENDING"
+        self.pay()
+        PaymentRequest.objects.update(
+            created_at=timezone.now() - PaymentService.PAYMENT_EXPIRY,
+            next_check_at=timezone.now(),
+        )
+
+        self.poll()
+
+        self.assertEqual(Transaction.objects.get().status, Transaction.STATUS_FAILED)
+        self.assertEqual(PaymentRequest.objects.get().reason, "Payment request expired")
+
+    def test_expired_payments_stay_pending_while_momo_is_unreachable(self):
+        self.pay()
+        PaymentRequest.objects.update(
+            created_at=timezone.now() - PaymentService.PAYMENT_EXPIRY,
+            next_check_at=timezone.now(),
+        )
+        self.stub.failures["payment_status"] = 100
+
+        self.poll()
+
+        payment_request = PaymentRequest.objects.get()
+        self.assertIsNone(payment_request.resolved_at)
+        self.assertGreater(payment_request.next_check_at, timezone.now())
+        self.assertEqual(Transaction.objects.get().status, Transaction.STATUS_PENDING)
+
+    def test_expired_payments_unknown_to_momo_fail(self):
+        self.pay()
+        self.stub.requests.clear()
+        PaymentRequest.objects.update(
+            created_at=timezone.now() - PaymentService.PAYMENT_EXPIRY,
+            next_check_at=timezone.now(),
+        )
+
+        self.poll()
+
+        self.assertEqual(Transaction.objects.get().status, Transaction.STATUS_FAILED)
+
+    def test_callback_resolves_payment(self):
+        self.stub.payment_status = "FAILED"
+        transaction_id = self.pay().json()["transaction_id"]
+        transaction = Transaction.objects.get(pk=transaction_id)
+
+        response = self.client.put(
+            reverse("payment-callback"),
+            {"externalId": transaction.reference_number, "status": "SUCCESSFUL"},
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.status, Transaction.STATUS_FAILED)
+        self.assertEqual(PaymentRequest.objects.get().provider_status, "FAILED")
+
+        self.make_due()
+        self.poll()
+        self.assertEqual(self.stub.calls["payment_status"], 1)
+
+    def test_callbacks_do_not_delay_the_poller(self):
+        self.stub.payment_status = "PENDING"
+        transaction_id = self.pay().json()["transaction_id"]
+        reference = Transaction.objects.get(pk=transaction_id).reference_number
+        before = PaymentRequest.objects.get()
+
+        for _ in range(3):
+            response = self.client.post(
+                reverse("payment-callback"),
+                {"externalId": reference},
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 200)
+
+        payment_request = PaymentRequest.objects.get()
+        self.assertEqual(payment_request.attempts, 0)
+        self.assertEqual(payment_request.next_check_at, before.next_check_at)
+        self.assertEqual(payment_request.provider_status, "PENDING")
+        self.assertEqual(self.stub.calls["payment_status"], 1)
+
+    def test_callback_for_resolved_payment_does_not_call_momo(self):
+        transaction_id = self.pay().json()["transaction_id"]
+        reference = Transaction.objects.get(pk=transaction_id).reference_number
+        self.make_due()
+        self.poll()
+
+        response = self.client.post(
+            reverse("payment-callback"),
+            {"externalId": reference},
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.json()["status"], Transaction.STATUS_COMPLETED)
+        self.assertEqual(self.stub.calls["payment_status"], 1)
+
+    def test_callback_for_unknown_payment(self):
+        response = self.client.post(
+            reverse("payment-callback"),
+            {"externalId": "TXN-UNKNOWN"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_rejected_request_to_pay_leaves_no_transaction(self):
+        self.stub.failures["request_to_pay"] = 1
+        self.stub.failure_status = 400
+
+        response = self.pay()
+
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_unreachable_momo_leaves_no_transaction(self):
+        credentials = auth_keys()
+        MtnCredentialManager().get_access_token(
+            credentials["api_user"], credentials["api_key"]
+        )
+        with mock.patch.dict(os.environ, {"MOMO_BASE_URL": "http://127.0.0.1:9"}):
+            response = self.pay()
+
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_failed_request_to_pay_is_left_to_the_poller(self):
+        self.stub.failures["request_to_pay"] = 1
+
+        response = self.pay()
+
+        self.assertEqual(response.status_code, 202)
+        payment_request = PaymentRequest.objects.get()
+        self.assertEqual(
+            response.json()["transaction_ref"], str(payment_request.reference_id)
+        )
+        self.assertEqual(payment_request.transaction.status, Transaction.STATUS_PENDING)
+
+    def test_timed_out_request_to_pay_is_settled_by_the_poller(self):
+        self.stub.latency = 0.3
+        with mock.patch.dict(os.environ, {"MOMO_TIMEOUT_REQUEST_TO_PAY": "1,0.1"}):
+            response = self.pay()
+        self.stub.latency = 0
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(Transaction.objects.get().status, Transaction.STATUS_PENDING)
+
+        time.sleep(0.3)
+        self.make_due()
+        self.poll()
+        self.assertEqual(Transaction.objects.get().status, Transaction.STATUS_COMPLETED)
+
+
+class IdempotencyKeyTests(PaymentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.client_user)
+
+    def test_retries_replay_the_first_response(self):
+        first = self.pay(headers={"Idempotency-Key": "retry-1"})
+
+        # Only the session and its user are loaded.
+        with self.assertNumQueries(2):
+            second = self.pay(headers={"Idempotency-Key": "retry-1"})
+
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(second.status_code, 202)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(self.stub.calls["request_to_pay"], 1)
+
+    def test_keys_are_scoped_per_caller(self):
+        self.pay(headers={"Idempotency-Key": "shared"})
+        # Another caller sending the same body, client id included.
+        self.client.force_login(
+            User.objects.create(
+                email="other@example.com", username="other", role=User.Role.CLIENT
+            )
+        )
+        response = self.pay(headers={"Idempotency-Key": "shared"})
+
+        self.assertNotIn("Idempotent-Replayed", response.headers)
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_anonymous_callers_cannot_use_keys(self):
+        self.client.logout()
+        response = self.pay(headers={"Idempotency-Key": "shared"})
+
+        self.assertIn(response.status_code, (401, 403))
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_reused_key_with_different_body_is_rejected(self):
+        self.pay(headers={"Idempotency-Key": "retry-1"})
+        response = self.pay("30.00", headers={"Idempotency-Key": "retry-1"})
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_payment_errors_are_replayed(self):
+        self.stub.failures["request_to_pay"] = 1
+        self.stub.failure_status = 400
+        self.assertEqual(self.pay(headers={"Idempotency-Key": "k"}).status_code, 500)
+
+        response = self.pay(headers={"Idempotency-Key": "k"})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(self.stub.calls["request_to_pay"], 1)
+
+    def test_server_errors_release_the_key_by_default(self):
+        responses = iter([Response(status=503), Response(status=201)])
+        view = idempotent()(lambda view, request: next(responses))
+        request = mock.Mock(
+            headers={"Idempotency-Key": "k"}, data={}, user=AnonymousUser()
+        )
+
+        self.assertEqual(view(None, request).status_code, 503)
+        self.assertEqual(view(None, request).status_code, 201)
+
+    def test_payment_claims_outlast_the_gateway_timeouts(self):
+        with mock.patch.dict(os.environ, {"MOMO_TIMEOUT_REQUEST_TO_PAY": "3,120"}):
+            self.assertGreater(PaymentService.max_processing_time(), 120 + 2 * 36)
+
+    def test_keys_expire(self):
+        with override_settings(IDEMPOTENCY_KEY_TTL=1):
+            self.pay(headers={"Idempotency-Key": "k"})
+        time.sleep(1.1)
+        self.pay(headers={"Idempotency-Key": "k"})
+
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_concurrent_duplicates_wait_for_the_first_request(self):
+        store = IdempotencyStore()
+        self.assertIsNone(store.claim("key", "body"))
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            waiting = [executor.submit(store.claim, "key", "body") for _ in range(4)]
+            time.sleep(0.1)
+            store.complete("key", "body", mock.Mock(status_code=202, data={"ok": 1}))
+            records = [future.result() for future in waiting]
+
+        self.assertEqual(records, [("body", 202, {"ok": 1})] * 4)
+
+    def test_duplicate_of_a_stuck_request_conflicts(self):
+        store = IdempotencyStore()
+        store.claim("key", "body")
+        with mock.patch.object(IdempotencyStore, "COALESCE_TIMEOUT", 0.1):
+            record = store.claim("key", "body")
+
+        self.assertEqual(store.replay(record, "body").status_code, 409)
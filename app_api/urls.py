@@ -1,6 +1,12 @@
 from django.urls import path
 
-from api.mtn.payment_gateway import PaymentView
+from api.mtn.payment_gateway import PaymentCallbackView, PaymentView
 
-
-urlpatterns = [path("payment/", PaymentView.as_view(), name="payment")]
+urlpatterns = [
+    path("payment/", PaymentView.as_view(), name="payment"),
+    path(
+        "payment/callback/",
+        PaymentCallbackView.as_view(),
+        name="payment-callback",
+    ),
+]
@@ -0,0 +1,15 @@
+from django.contrib import admin
+from .models import Job
+from .services import JobService
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("handler", "status", "attempts", "run_at", "created_at")
+    list_filter = ("status", "handler")
+    readonly_fields = ("last_error",)
+    actions = ["retry_jobs"]
+
+    @admin.action(description="Retry selected jobs")
+    def retry_jobs(self, request, queryset):
+        JobService.requeue(queryset)
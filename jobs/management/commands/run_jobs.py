@@ -0,0 +1,58 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+from jobs.models import Job
+from jobs.services import JobService
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to sleep when no job is due",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Run one batch and exit"
+        )
+        parser.add_argument(
+            "--requeue-dead",
+            action="store_true",
+            help="Send dead-lettered jobs back to the queue and exit",
+        )
+        parser.add_argument(
+            "--purge-days",
+            type=int,
+            default=None,
+            help="Delete jobs that succeeded more than this many days ago and exit",
+        )
+
+    def handle(self, *args, **options):
+        if options["requeue_dead"]:
+            count = JobService.requeue(Job.objects.filter(status=Job.Status.DEAD))
+            self.stdout.write(self.style.SUCCESS(f"Requeued {count} dead job(s)."))
+            return
+        if options["purge_days"] is not None:
+            older_than = timezone.now() - timedelta(days=options["purge_days"])
+            count = JobService.purge(older_than)
+            self.stdout.write(self.style.SUCCESS(f"Deleted {count} finished job(s)."))
+            return
+
+        batch_size = options["batch_size"]
+        while True:
+            count = JobService.run_pending(limit=batch_size)
+            if count:
+                self.stdout.write(f"Ran {count} job(s).")
+            if options["once"]:
+                break
+            # The worker sees no request signals, so recycle stale or broken
+            # connections between batches here.
+            close_old_connections()
+            if count < batch_size:
+                time.sleep(options["interval"])
@@ -0,0 +1,117 @@
+import logging
+import traceback
+from datetime import timedelta
+from django.db import transaction as db_transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+
+class JobService:
+    RETRY_BASE_DELAY = timedelta(seconds=30)
+    RETRY_MAX_DELAY = timedelta(hours=1)
+    # A RUNNING job not finished by then is assumed lost with its worker.
+    LOCK_TIMEOUT = timedelta(minutes=10)
+
+    @staticmethod
+    def enqueue(handler, payload=None, run_at=None, max_attempts=5):
+        return Job.objects.create(
+            handler=handler,
+            payload=payload or {},
+            run_at=run_at or timezone.now(),
+            max_attempts=max_attempts,
+        )
+
+    @staticmethod
+    def enqueue_many(jobs):
+        """Enqueue ``(handler, payload)`` pairs with a single insert."""
+        now = timezone.now()
+        return Job.objects.bulk_create(
+            [
+                Job(handler=handler, payload=payload, run_at=now)
+                for handler, payload in jobs
+            ]
+        )
+
+    @staticmethod
+    def claim(limit):
+        """Mark up to ``limit`` due jobs RUNNING and return them."""
+        now = timezone.now()
+        due = Q(status=Job.Status.PENDING, run_at__lte=now) | Q(
+            status=Job.Status.RUNNING, locked_at__lt=now - JobService.LOCK_TIMEOUT
+        )
+        with db_transaction.atomic():
+            jobs = list(
+                Job.objects.select_for_update(skip_locked=True)
+                .filter(due)
+                .order_by("run_at")[:limit]
+            )
+            Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                status=Job.Status.RUNNING,
+                locked_at=now,
+                attempts=F("attempts") + 1,
+            )
+        for job in jobs:
+            job.status = Job.Status.RUNNING
+            job.locked_at = now
+            job.attempts += 1
+        return jobs
+
+    @staticmethod
+    def retry_delay(attempts):
+        return min(
+            JobService.RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0),
+            JobService.RETRY_MAX_DELAY,
+        )
+
+    @staticmethod
+    def run(job):
+        try:
+            import_string(job.handler)(**job.payload)
+        except Exception:
+            job.last_error = traceback.format_exc()
+            if job.attempts >= job.max_attempts:
+                job.status = Job.Status.DEAD
+                job.finished_at = timezone.now()
+                logger.error(f"Job {job.pk} ({job.handler}) moved to dead letter.")
+            else:
+                job.status = Job.Status.PENDING
+                job.run_at = timezone.now() + JobService.retry_delay(job.attempts)
+                logger.warning(f"Job {job.pk} ({job.handler}) failed, will retry.")
+        else:
+            job.status = Job.Status.SUCCEEDED
+            job.finished_at = timezone.now()
+        job.locked_at = None
+        job.save(
+            update_fields=["status", "run_at", "locked_at", "last_error", "finished_at"]
+        )
+        return job
+
+    @staticmethod
+    def run_pending(limit=50):
+        """Run one batch of due jobs; returns how many were run."""
+        jobs = JobService.claim(limit)
+        for job in jobs:
+            JobService.run(job)
+        return len(jobs)
+
+    @staticmethod
+    def requeue(queryset):
+        """Send jobs (typically DEAD ones) back to the queue with fresh attempts."""
+        return queryset.update(
+            status=Job.Status.PENDING,
+            attempts=0,
+            run_at=timezone.now(),
+            locked_at=None,
+            finished_at=None,
+        )
+
+    @staticmethod
+    def purge(older_than):
+        """Delete jobs that succeeded before ``older_than``."""
+        return Job.objects.filter(
+            status=Job.Status.SUCCEEDED, finished_at__lt=older_than
+        ).delete()[0]
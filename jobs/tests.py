@@ -0,0 +1,86 @@
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from .models import Job
+from .services import JobService
+
+CALLS = []
+
+
+def record_call(**payload):
+    CALLS.append(payload)
+
+
+def always_fail(**payload):
+    raise RuntimeError("boom")
+
+
+class JobServiceTests(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def run_worker(self):
+        call_command("run_jobs", "--once", stdout=StringIO())
+
+    def test_jobs_run_once(self):
+        job = JobService.enqueue("jobs.tests.record_call", {"value": 1})
+
+        self.run_worker()
+        self.run_worker()
+
+        job.refresh_from_db()
+        self.assertEqual(CALLS, [{"value": 1}])
+        self.assertEqual(job.status, Job.Status.SUCCEEDED)
+        self.assertEqual(job.attempts, 1)
+
+    def test_future_jobs_wait(self):
+        JobService.enqueue(
+            "jobs.tests.record_call", run_at=timezone.now() + timedelta(minutes=1)
+        )
+        self.run_worker()
+        self.assertEqual(CALLS, [])
+
+    def test_failures_back_off_then_dead_letter(self):
+        job = JobService.enqueue("jobs.tests.always_fail", max_attempts=3)
+
+        delays = []
+        for _ in range(3):
+            Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+            started = timezone.now()
+            self.run_worker()
+            job.refresh_from_db()
+            delays.append(job.run_at - started)
+
+        self.assertEqual(job.status, Job.Status.DEAD)
+        self.assertEqual(job.attempts, 3)
+        self.assertIn("RuntimeError: boom", job.last_error)
+        self.assertLess(delays[0], delays[1])
+
+        call_command("run_jobs", "--requeue-dead", stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.PENDING)
+        self.assertEqual(job.attempts, 0)
+
+    def test_jobs_abandoned_by_a_worker_are_reclaimed(self):
+        job = JobService.enqueue("jobs.tests.record_call")
+        JobService.claim(10)
+        self.assertEqual(JobService.claim(10), [])
+
+        Job.objects.filter(pk=job.pk).update(
+            locked_at=timezone.now() - JobService.LOCK_TIMEOUT - timedelta(seconds=1)
+        )
+        self.run_worker()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.SUCCEEDED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_purge_removes_old_succeeded_jobs(self):
+        JobService.enqueue("jobs.tests.record_call")
+        self.run_worker()
+        Job.objects.update(finished_at=timezone.now() - timedelta(days=8))
+
+        call_command("run_jobs", "--purge-days", "7", stdout=StringIO())
+        self.assertFalse(Job.objects.exists())
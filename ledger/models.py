@@ -1,13 +1,50 @@
 import uuid
+from django.conf import settings
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+
+class LedgerAccount(models.Model):
+    class AccountType(models.TextChoices):
+        MERCHANT = "MERCHANT", _("Merchant")
+        CLIENT = "CLIENT", _("Client")
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="ledger_accounts",
+    )
+    account_type = models.CharField(max_length=10, choices=AccountType.choices)
+    balance = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    sequence = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.get_account_type_display()} account {self.owner_id} - {self.balance}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "account_type"], name="unique_ledger_account"
+            ),
+        ]
+
+
 class LedgerEntry(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    transaction = models.OneToOneField(
+    account = models.ForeignKey(
+        LedgerAccount,
+        on_delete=models.CASCADE,
+        related_name="entries",
+        null=True,
+        blank=True,
+    )
+    sequence = models.PositiveBigIntegerField(null=True, blank=True)
+    transaction = models.ForeignKey(
         "sales.Transaction",
         on_delete=models.CASCADE,
-        related_name="ledger_entry",
+        related_name="ledger_entries",
         null=True,
         blank=True,
     )
@@ -22,15 +59,7 @@ class LedgerEntry(models.Model):
     description = models.CharField(max_length=255)
     debit = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     credit = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
-    balance = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
-
-    def save(self, *args, **kwargs):
-        last_entry = LedgerEntry.objects.last()
-        if last_entry:
-            self.balance = last_entry.balance + self.debit - self.credit
-        else:
-            self.balance = self.debit - self.credit
-        super().save(*args, **kwargs)
+    balance = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
 
     def __str__(self):
         return f"{self.date} - {self.description} - {self.balance}"
@@ -39,3 +68,8 @@ class LedgerEntry(models.Model):
         indexes = [
             models.Index(fields=["date"], name="ledger_entry_date_idx"),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["account", "sequence"], name="unique_ledger_entry_sequence"
+            ),
+        ]
@@ -0,0 +1,258 @@
+import uuid
+from decimal import Decimal
+from django.db import connection, transaction as db_transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from .models import LedgerAccount, LedgerEntry
+
+CENTS = Decimal("0.01")
+
+
+class LedgerService:
+    """
+    Posts transactions to per-owner running-balance accounts.
+
+    Every merchant and client has its own ``LedgerAccount``. Postings lock
+    only the accounts they touch (always in the same order, so two postings
+    can never deadlock), which keeps writers on different accounts from
+    blocking each other. Each entry carries the account's next sequence
+    number and the balance after it was applied.
+    """
+
+    @staticmethod
+    def get_account(owner_id, account_type):
+        account, _ = LedgerAccount.objects.get_or_create(
+            owner_id=owner_id, account_type=account_type
+        )
+        return account
+
+    @staticmethod
+    def transaction_legs(transaction):
+        """
+        Return the net amount each account should carry for a transaction.
+
+        Only a completed payment moves money. Pending and failed payments
+        carry nothing, so a completed payment that is later marked failed
+        has its postings reversed by an adjusting entry.
+        """
+        if transaction.status == transaction.STATUS_COMPLETED:
+            net = Decimal(str(transaction.amount)).quantize(CENTS)
+        else:
+            net = Decimal("0.00")
+        return {
+            (transaction.merchant_id, LedgerAccount.AccountType.MERCHANT): net,
+            (transaction.client_id, LedgerAccount.AccountType.CLIENT): -net,
+        }
+
+    @staticmethod
+    def posted_legs(transaction):
+        """Return the net amount already posted per account for a transaction."""
+        rows = (
+            LedgerEntry.objects.filter(transaction=transaction)
+            .values("account__owner_id", "account__account_type")
+            .annotate(net=Sum(F("debit") - F("credit")))
+        )
+        return {
+            (row["account__owner_id"], row["account__account_type"]): row["net"]
+            for row in rows
+        }
+
+    @staticmethod
+    def lock_accounts(keys):
+        """
+        Return ``{(owner_id, account_type): account}`` for ``keys``, with the
+        account rows locked until the surrounding atomic block ends.
+        """
+        ids = {key: LedgerService.get_account(*key).pk for key in keys}
+        locked = LedgerAccount.objects.select_for_update().filter(pk__in=ids.values())
+        by_pk = {account.pk: account for account in locked.order_by("pk")}
+        return {key: by_pk[pk] for key, pk in ids.items()}
+
+    @staticmethod
+    def apply_deltas(deltas, sequence_steps=None):
+        """
+        Add ``{(owner_id, account_type): delta}`` to the account balances,
+        creating missing accounts, and return ``{key: account}`` with the
+        new balances and sequences. Each sequence advances by its
+        ``sequence_steps`` entry (one per account by default).
+
+        On PostgreSQL and SQLite this is one ``INSERT ... ON CONFLICT DO
+        UPDATE ... RETURNING`` statement. Rows are written in key order, so
+        concurrent postings lock shared accounts in the same order.
+        """
+        keys = sorted(deltas, key=lambda key: (str(key[0]), key[1]))
+        if sequence_steps is None:
+            sequence_steps = dict.fromkeys(keys, 1)
+        if connection.vendor not in ("postgresql", "sqlite"):
+            accounts = LedgerService.lock_accounts(keys)
+            for key in keys:
+                account = accounts[key]
+                account.balance = account.balance + deltas[key]
+                account.sequence = account.sequence + sequence_steps[key]
+                account.save(update_fields=["balance", "sequence", "updated_at"])
+            return accounts
+
+        meta = LedgerAccount._meta
+        fields = [
+            meta.get_field(name)
+            for name in ("id", "owner", "account_type", "balance", "sequence")
+        ]
+        updated_at = meta.get_field("updated_at")
+        now = timezone.now()
+        qn = connection.ops.quote_name
+        table = qn(meta.db_table)
+        params = []
+        for owner_id, account_type in keys:
+            values = [
+                uuid.uuid4(),
+                owner_id,
+                account_type,
+                deltas[(owner_id, account_type)],
+                sequence_steps[(owner_id, account_type)],
+            ]
+            params.extend(
+                field.get_db_prep_save(value, connection)
+                for field, value in zip(fields, values)
+            )
+            params.append(updated_at.get_db_prep_save(now, connection))
+        columns = [field.column for field in fields] + [updated_at.column]
+        pk, owner, account_type, balance, sequence, updated = map(qn, columns)
+        row = "(%s)" % ", ".join(["%s"] * len(columns))
+        sql = (
+            f"INSERT INTO {table} ({', '.join(map(qn, columns))}) "
+            f"VALUES {', '.join([row] * len(keys))} "
+            f"ON CONFLICT ({owner}, {account_type}) DO UPDATE SET "
+            f"{balance} = {table}.{balance} + EXCLUDED.{balance}, "
+            f"{sequence} = {table}.{sequence} + EXCLUDED.{sequence}, "
+            f"{updated} = EXCLUDED.{updated} "
+            f"RETURNING {pk}, {owner}, {account_type}, {balance}, {sequence}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        keys_by_value = {(str(key[0]), key[1]): key for key in keys}
+        accounts = {}
+        for row_pk, row_owner, row_type, row_balance, row_sequence in rows:
+            account = LedgerAccount(
+                id=fields[0].to_python(row_pk),
+                owner_id=fields[1].to_python(row_owner),
+                account_type=row_type,
+                balance=Decimal(str(row_balance)).quantize(CENTS),
+                sequence=row_sequence,
+                updated_at=now,
+            )
+            account._state.adding = False
+            accounts[keys_by_value[(str(account.owner_id), row_type)]] = account
+        return accounts
+
+    @staticmethod
+    def post_transaction(transaction, created=False):
+        """
+        Bring the ledger in line with the transaction's current status.
+
+        Posting is idempotent: only the difference between what the status
+        calls for and what has already been posted is written, so a status
+        change appends an adjusting entry instead of rewriting history. A
+        transaction that was just created has nothing posted yet, so the
+        lookup is skipped for it. Callers must hold the transaction row
+        (``Transaction.save`` does) so two postings of it cannot interleave.
+        """
+        desired = LedgerService.transaction_legs(transaction)
+        if created:
+            posted = {}
+        else:
+            posted = LedgerService.posted_legs(transaction)
+        deltas = {
+            key: net - (posted.get(key) or Decimal("0.00"))
+            for key, net in desired.items()
+        }
+        for key, net in posted.items():
+            deltas.setdefault(key, -net)
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return []
+
+        description = (
+            f"Transaction {transaction.reference_number} - "
+            f"{transaction.get_payment_method_display()}"
+        )
+        with db_transaction.atomic(savepoint=False):
+            accounts = LedgerService.apply_deltas(deltas)
+            return LedgerEntry.objects.bulk_create(
+                LedgerEntry(
+                    account=accounts[key],
+                    sequence=accounts[key].sequence,
+                    transaction=transaction,
+                    description=description,
+                    debit=max(delta, Decimal("0.00")),
+                    credit=max(-delta, Decimal("0.00")),
+                    balance=accounts[key].balance,
+                )
+                for key, delta in deltas.items()
+            )
+
+    @staticmethod
+    def post_new_transactions(transactions):
+        """
+        Post a batch of freshly inserted transactions.
+
+        Balances and sequences are worked out in memory: one upsert moves
+        every touched account by the batch total, and each entry's running
+        balance is replayed from the account's state before the batch.
+        """
+        postings = {}
+        for transaction in transactions:
+            for key, net in LedgerService.transaction_legs(transaction).items():
+                if net:
+                    postings.setdefault(key, []).append((transaction, net))
+        if not postings:
+            return []
+
+        # Choice labels are lazy translations, slow enough to resolve that
+        # doing it for every leg shows up in large batches.
+        labels = {}
+        for transaction in transactions:
+            if transaction.payment_method not in labels:
+                labels[transaction.payment_method] = str(
+                    transaction.get_payment_method_display()
+                )
+
+        with db_transaction.atomic(savepoint=False):
+            accounts = LedgerService.apply_deltas(
+                {key: sum(net for _, net in legs) for key, legs in postings.items()},
+                sequence_steps={key: len(legs) for key, legs in postings.items()},
+            )
+            entries = []
+            for key, legs in postings.items():
+                account = accounts[key]
+                balance = account.balance - sum(net for _, net in legs)
+                sequence = account.sequence - len(legs)
+                for transaction, net in legs:
+                    balance += net
+                    sequence += 1
+                    entries.append(
+                        LedgerEntry(
+                            account=account,
+                            sequence=sequence,
+                            transaction=transaction,
+                            description=(
+                                f"Transaction {transaction.reference_number} - "
+                                f"{labels[transaction.payment_method]}"
+                            ),
+                            debit=max(net, Decimal("0.00")),
+                            credit=max(-net, Decimal("0.00")),
+                            balance=balance,
+                        )
+                    )
+            return LedgerEntry.objects.bulk_create(entries)
+
+    @staticmethod
+    def reverse_transaction(transaction):
+        """Take a transaction's postings back out of its account balances."""
+        posted = LedgerService.posted_legs(transaction)
+        reversal = {key: -net for key, net in posted.items() if net}
+        if reversal:
+            LedgerService.apply_deltas(
+                reversal, sequence_steps=dict.fromkeys(reversal, 0)
+            )
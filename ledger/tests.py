@@ -1,3 +1,221 @@
-from django.test import TestCase
+import random
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from django.db import connections
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from sales.models import Transaction
+from users.models import User
+from .models import LedgerAccount, LedgerEntry
 
-# Create your tests here.
+
+def create_user(role, index):
+    return User.objects.create(
+        email=f"{role.lower()}{index}@example.com",
+        username=f"{role.lower()}{index}",
+        role=role,
+    )
+
+
+def account_balance(owner, account_type):
+    return LedgerAccount.objects.get(owner=owner, account_type=account_type).balance
+
+
+class LedgerServiceTests(TestCase):
+    def setUp(self):
+        self.merchant = create_user(User.Role.MERCHANT, 1)
+        self.other_merchant = create_user(User.Role.MERCHANT, 2)
+        self.client_user = create_user(User.Role.CLIENT, 1)
+
+    def create_transaction(self, merchant, amount, status=Transaction.STATUS_PENDING):
+        return Transaction.objects.create(
+            client_id=self.client_user.pk,
+            merchant_id=merchant.pk,
+            amount=Decimal(amount),
+            status=status,
+        )
+
+    def test_pending_transaction_posts_nothing(self):
+        self.create_transaction(self.merchant, "10.00")
+        self.assertFalse(LedgerEntry.objects.exists())
+        self.assertFalse(LedgerAccount.objects.exists())
+
+    def test_balances_are_kept_per_merchant(self):
+        self.create_transaction(self.merchant, "10.00", Transaction.STATUS_COMPLETED)
+        self.create_transaction(self.merchant, "5.50", Transaction.STATUS_COMPLETED)
+        self.create_transaction(
+            self.other_merchant, "7.25", Transaction.STATUS_COMPLETED
+        )
+
+        merchant = LedgerAccount.AccountType.MERCHANT
+        self.assertEqual(account_balance(self.merchant, merchant), Decimal("15.50"))
+        self.assertEqual(
+            account_balance(self.other_merchant, merchant), Decimal("7.25")
+        )
+        self.assertEqual(
+            account_balance(self.client_user, LedgerAccount.AccountType.CLIENT),
+            Decimal("-22.75"),
+        )
+
+        entries = LedgerEntry.objects.filter(account__owner=self.merchant).order_by(
+            "sequence"
+        )
+        self.assertEqual([e.sequence for e in entries], [1, 2])
+        self.assertEqual(
+            [e.balance for e in entries], [Decimal("10.00"), Decimal("15.50")]
+        )
+
+    def test_status_change_appends_adjustment(self):
+        transaction = self.create_transaction(self.merchant, "20.00")
+        transaction.status = Transaction.STATUS_COMPLETED
+        transaction.save()
+        transaction.save()
+        self.assertEqual(transaction.ledger_entries.count(), 2)
+
+        transaction.status = Transaction.STATUS_FAILED
+        transaction.save()
+        self.assertEqual(transaction.ledger_entries.count(), 4)
+        self.assertEqual(
+            account_balance(self.merchant, LedgerAccount.AccountType.MERCHANT),
+            Decimal("0.00"),
+        )
+
+    def test_declined_payment_posts_nothing(self):
+        transaction = self.create_transaction(self.merchant, "20.00")
+        transaction.status = Transaction.STATUS_FAILED
+        transaction.save()
+
+        self.assertFalse(transaction.ledger_entries.exists())
+        self.assertFalse(LedgerAccount.objects.exists())
+
+    def test_delete_reverses_balance(self):
+        kept = self.create_transaction(
+            self.merchant, "3.00", Transaction.STATUS_COMPLETED
+        )
+        removed = self.create_transaction(
+            self.merchant, "4.00", Transaction.STATUS_COMPLETED
+        )
+        removed.delete()
+
+        self.assertEqual(
+            account_balance(self.merchant, LedgerAccount.AccountType.MERCHANT),
+            kept.amount,
+        )
+        self.assertEqual(
+            account_balance(self.client_user, LedgerAccount.AccountType.CLIENT),
+            -kept.amount,
+        )
+
+
+class LedgerInterleavingTests(TestCase):
+    """
+    The races ``LedgerConcurrencyTests`` runs in parallel, replayed in a fixed
+    interleaving so they also run on SQLite: every worker loaded its copy of
+    a transaction before any of them saved it.
+    """
+
+    def test_stale_copies_post_each_transaction_once(self):
+        merchants = [create_user(User.Role.MERCHANT, i) for i in range(2)]
+        client = create_user(User.Role.CLIENT, 1)
+        transactions = Transaction.objects.bulk_create(
+            Transaction(
+                client_id=client.pk,
+                merchant_id=merchants[i % 2].pk,
+                amount=Decimal(i + 1),
+                reference_number=f"TXN-INTERLEAVED-{i}",
+            )
+            for i in range(10)
+        )
+        copies = [
+            [Transaction.objects.get(pk=t.pk) for t in transactions] for _ in range(3)
+        ]
+
+        for worker in copies:
+            for transaction in worker:
+                transaction.status = Transaction.STATUS_COMPLETED
+                transaction.save()
+
+        for index, merchant in enumerate(merchants):
+            account = LedgerAccount.objects.get(
+                owner=merchant, account_type=LedgerAccount.AccountType.MERCHANT
+            )
+            expected = sum(
+                t.amount for i, t in enumerate(transactions) if i % 2 == index
+            )
+            self.assertEqual(account.balance, expected)
+            self.assertEqual(
+                list(
+                    account.entries.order_by("sequence").values_list(
+                        "sequence", flat=True
+                    )
+                ),
+                list(range(1, 6)),
+            )
+        self.assertEqual(LedgerEntry.objects.count(), 20)
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class LedgerConcurrencyTests(TransactionTestCase):
+    transactions_count = 2000
+    workers = 16
+
+    def setUp(self):
+        self.merchants = [create_user(User.Role.MERCHANT, i) for i in range(4)]
+        self.clients = [create_user(User.Role.CLIENT, i) for i in range(4)]
+        rng = random.Random(42)
+        self.transactions = Transaction.objects.bulk_create(
+            Transaction(
+                client_id=rng.choice(self.clients).pk,
+                merchant_id=rng.choice(self.merchants).pk,
+                amount=Decimal(rng.randint(100, 100000)) / 100,
+                reference_number=f"TXN-CONCURRENCY-{i}",
+            )
+            for i in range(self.transactions_count)
+        )
+        self.outcomes = {
+            t.pk: rng.choice([Transaction.STATUS_COMPLETED, Transaction.STATUS_FAILED])
+            for t in self.transactions
+        }
+
+    def complete(self, pks):
+        try:
+            for pk in pks:
+                transaction = Transaction.objects.get(pk=pk)
+                transaction.status = self.outcomes[pk]
+                transaction.save()
+        finally:
+            connections.close_all()
+
+    def test_parallel_completions_keep_balances_correct(self):
+        pks = list(self.outcomes)
+        batches = [pks[i :: self.workers] for i in range(self.workers)]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(self.complete, batches))
+
+        for merchant in self.merchants:
+            expected = Decimal("0.00")
+            for t in self.transactions:
+                if t.merchant_id != merchant.pk:
+                    continue
+                if self.outcomes[t.pk] == Transaction.STATUS_COMPLETED:
+                    expected += t.amount
+
+            account = LedgerAccount.objects.get(
+                owner=merchant, account_type=LedgerAccount.AccountType.MERCHANT
+            )
+            self.assertEqual(account.balance, expected)
+
+            entries = account.entries.order_by("sequence")
+            self.assertEqual(
+                list(entries.values_list("sequence", flat=True)),
+                list(range(1, account.sequence + 1)),
+            )
+            self.assertEqual(entries.last().balance, expected)
+
+        total = LedgerAccount.objects.aggregate(total=Sum("balance"))["total"]
+        self.assertEqual(total, Decimal("0.00"))
+        completed = sum(
+            outcome == Transaction.STATUS_COMPLETED
+            for outcome in self.outcomes.values()
+        )
+        self.assertEqual(LedgerEntry.objects.count(), completed * 2)
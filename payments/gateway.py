@@ -0,0 +1,128 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from utils.metrics import outbound
+
+# (connect, read) timeouts in seconds per gateway operation. Each can be
+# overridden with MOMO_TIMEOUT_<OPERATION>="<connect>,<read>".
+DEFAULT_TIMEOUTS = {
+    "default": (3.05, 15),
+    "provisioning": (3.05, 15),
+    "token": (3.05, 10),
+    "request_to_pay": (3.05, 30),
+    "withdraw": (3.05, 30),
+    "transfer": (3.05, 30),
+    "payment_status": (3.05, 5),
+    "transfer_status": (3.05, 5),
+    "balance": (3.05, 5),
+}
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+class GatewayClient:
+    """
+    Pooled, keep-alive HTTP client shared by every MoMo gateway call.
+
+    Each process gets one ``requests.Session`` whose adapter keeps up to
+    ``pool_size`` connections per host alive, so calls after the first skip
+    the TCP and TLS handshakes. Every request carries a (connect, read)
+    timeout for its operation. Idempotent GETs are retried on connection
+    errors and 429/5xx responses with jittered exponential backoff; POSTs
+    are never retried once they may have reached MoMo.
+    """
+
+    def __init__(self, pool_size=None, retries=None, backoff=None, timeouts=None):
+        self.pool_size = pool_size or _env_int("MOMO_HTTP_POOL_SIZE", 10)
+        self.retries = (
+            retries if retries is not None else _env_int("MOMO_HTTP_RETRIES", 3)
+        )
+        self.backoff = (
+            backoff if backoff is not None else _env_float("MOMO_HTTP_BACKOFF", 0.2)
+        )
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self._session = None
+        self._session_pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        # A forked worker must not share the parent's sockets.
+        if self._session is None or self._session_pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._session_pid != os.getpid():
+                    self._session = self.build_session()
+                    self._session_pid = os.getpid()
+        return self._session
+
+    def build_session(self):
+        retry = Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries,
+            status=self.retries,
+            allowed_methods=frozenset({"GET"}),
+            status_forcelist=RETRY_STATUSES,
+            backoff_factor=self.backoff,
+            backoff_jitter=self.backoff,
+            raise_on_status=False,
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def timeout_for(self, operation):
+        override = os.environ.get(f"MOMO_TIMEOUT_{operation.upper()}")
+        if override:
+            connect, read = (float(value) for value in override.split(","))
+            return connect, read
+        return self.timeouts.get(operation, self.timeouts["default"])
+
+    def request(self, method, url, operation="default", **kwargs):
+        kwargs.setdefault("timeout", self.timeout_for(operation))
+        with outbound("mtn"):
+            return self.session.request(method, url, **kwargs)
+
+    def get(self, url, operation="default", **kwargs):
+        return self.request("GET", url, operation=operation, **kwargs)
+
+    def post(self, url, operation="default", **kwargs):
+        return self.request("POST", url, operation=operation, **kwargs)
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+            self._session_pid = None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_gateway_client():
+    """Return the process-wide ``GatewayClient``."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GatewayClient()
+    return _client
@@ -0,0 +1,175 @@
+import json
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MomoStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without TCP_NODELAY a
+    # kept-alive connection stalls on delayed ACKs between them.
+    disable_nagle_algorithm = True
+
+    routes = [
+        ("POST", r"^/v1_0/apiuser$", "create_apiuser"),
+        ("POST", r"^/v1_0/apiuser/(?P<ref>[^/]+)/apikey$", "create_api_key"),
+        ("POST", r"^/(?P<product>collection|disbursement)/token/$", "create_token"),
+        ("POST", r"^/collection/v1_0/requesttopay$", "request_to_pay"),
+        ("GET", r"^/collection/v1_0/requesttopay/(?P<ref>[^/]+)$", "payment_status"),
+        ("POST", r"^/collection/v1_0/requesttowithdraw$", "request_to_withdraw"),
+        ("POST", r"^/disbursement/v1_0/transfer$", "transfer"),
+        ("GET", r"^/disbursement/v1_0/transfer/(?P<ref>[^/]+)$", "transfer_status"),
+        ("GET", r"^/disbursement/v1_0/account/balance$", "balance"),
+    ]
+
+    def setup(self):
+        super().setup()
+        self.server.record("connections")
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def dispatch(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        payload = json.loads(body) if body else {}
+
+        for route_method, pattern, name in self.routes:
+            match = re.match(pattern, self.path)
+            if route_method == method and match:
+                self.server.record(name)
+                if self.server.latency:
+                    time.sleep(self.server.latency)
+                if self.server.take_failure(name):
+                    return self.respond(
+                        self.server.failure_status, {"message": "Request failed"}
+                    )
+                authorization = self.headers.get("Authorization", "")
+                if authorization.removeprefix("Bearer ") in self.server.revoked_tokens:
+                    return self.respond(401, {"message": "Access token revoked"})
+                status, data = getattr(self, name)(payload, **match.groupdict())
+                return self.respond(status, data)
+        self.respond(404, {"message": "Not found"})
+
+    def respond(self, status, data=None):
+        body = json.dumps(data).encode() if data is not None else b""
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except ConnectionError:
+            # The client timed out and hung up first.
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+    def create_apiuser(self, payload):
+        return 201, None
+
+    def create_api_key(self, payload, ref):
+        return 201, {"apiKey": uuid.uuid4().hex}
+
+    def create_token(self, payload, product):
+        return 200, {
+            "access_token": uuid.uuid4().hex,
+            "token_type": "access_token",
+            "expires_in": self.server.token_lifetime,
+        }
+
+    def request_to_pay(self, payload):
+        self.server.requests[self.headers["X-Reference-Id"]] = payload
+        return 202, None
+
+    def payment_status(self, payload, ref):
+        request = self.server.requests.get(ref)
+        if request is None:
+            return 404, {"code": "RESOURCE_NOT_FOUND", "message": "Not found"}
+        return 200, {
+            "amount": request.get("amount"),
+            "currency": request.get("currency"),
+            "externalId": request.get("externalId"),
+            "payer": request.get("payer"),
+            "status": self.server.payment_status,
+        }
+
+    def request_to_withdraw(self, payload):
+        return 202, None
+
+    def transfer(self, payload):
+        self.server.requests[self.headers["X-Reference-Id"]] = payload
+        return 202, None
+
+    def transfer_status(self, payload, ref):
+        request = self.server.requests.get(ref, {})
+        return 200, {"amount": request.get("amount"), "status": "SUCCESSFUL"}
+
+    def balance(self, payload):
+        return 200, {"availableBalance": "1000.00", "currency": "EUR"}
+
+
+class MomoStubServer(ThreadingHTTPServer):
+    """
+    In-process stand-in for the MoMo sandbox, for tests and benchmarks.
+
+    Point ``MOMO_BASE_URL`` at ``base_url`` and every helper in
+    ``payments.mtn_api`` talks to it instead of MTN. ``calls`` counts the
+    requests served per route (and accepted ``connections``); set
+    ``failures[route]`` to make the next calls to a route answer
+    ``failure_status`` (503 by default), and add an access token to
+    ``revoked_tokens`` to have calls carrying it answer 401.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, token_lifetime=3600, latency=0.0, payment_status="SUCCESSFUL"):
+        super().__init__(("127.0.0.1", 0), MomoStubHandler)
+        self.token_lifetime = token_lifetime
+        self.latency = latency
+        self.payment_status = payment_status
+        self.requests = {}
+        self.calls = Counter()
+        self.failures = Counter()
+        self.failure_status = 503
+        self.revoked_tokens = set()
+        self._calls_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record(self, name):
+        with self._calls_lock:
+            self.calls[name] += 1
+
+    def take_failure(self, name):
+        with self._calls_lock:
+            if self.failures[name] > 0:
+                self.failures[name] -= 1
+                return True
+            return False
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -1,19 +1,54 @@
 import requests
+import collections
+import threading
+import time
 import uuid
 import os
 import base64
 import logging
+import math
+
+from django.core.cache import cache as default_cache
+from payments.gateway import get_gateway_client
+from urllib3.exceptions import ConnectTimeoutError
+from utils.errors import (
+    AccessTokenError,
+    PaymentUnconfirmedError,
+    TransactionError,
+    TransferRequestError,
+)
+
+
+def may_have_reached_momo(error):
+    """
+    Whether MoMo may have acted on a request that failed with ``error``: it
+    did not if the connection was never made or MoMo answered with a 4xx.
+    """
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is None or error.response.status_code >= 500
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return False
+    if isinstance(error, requests.exceptions.ConnectionError):
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return not isinstance(reason, ConnectTimeoutError)
+    return isinstance(error, requests.exceptions.Timeout)
+
+
+def momo_base_url():
+    return os.environ.get(
+        "MOMO_BASE_URL", "https://sandbox.momodeveloper.mtn.com"
+    ).rstrip("/")
 
-from utils.errors import AccessTokenError, TransactionError, TransferRequestError
 
 class MtnAPIHelper:
     def __init__(self):
-        self.endpoint = "sandbox.momodeveloper.mtn.com"
+        self.base_url = momo_base_url()
+        self.http = get_gateway_client()
 
     def get_apiuser(self):
         reference_id = str(uuid.uuid4())
 
-        url = f"https://{self.endpoint}/v1_0/apiuser"
+        url = f"{self.base_url}/v1_0/apiuser"
 
         headers = {
             "X-Reference-Id": reference_id,
@@ -28,7 +63,9 @@ class MtnAPIHelper:
         }
 
         try:
-            response = requests.post(url, headers=headers, json=data)
+            response = self.http.post(
+                url, operation="provisioning", headers=headers, json=data
+            )
             response.raise_for_status()
 
             return reference_id
@@ -37,7 +74,7 @@ class MtnAPIHelper:
             print(f"Error during API request: {e}")
 
     def create_api_key(self, reference_id):
-        url = f"https://{self.endpoint}/v1_0/apiuser/{reference_id}/apikey"
+        url = f"{self.base_url}/v1_0/apiuser/{reference_id}/apikey"
 
         headers = {
             "Content-Type": "application/json",
@@ -51,7 +88,9 @@ class MtnAPIHelper:
         }
 
         try:
-            response = requests.post(url, headers=headers, json=data)
+            response = self.http.post(
+                url, operation="provisioning", headers=headers, json=data
+            )
             response.raise_for_status()
 
             if response.text:
@@ -65,7 +104,13 @@ class MtnAPIHelper:
             return None
 
     def create_access_token(self, api_user_id, api_key):
-        url = f"https://{self.endpoint}/collection/token/"
+        token_data = self.request_access_token(api_user_id, api_key)
+        if token_data:
+            return token_data["access_token"]
+        return None
+
+    def request_access_token(self, api_user_id, api_key):
+        url = f"{self.base_url}/collection/token/"
 
         headers = {
             "Authorization": f"Basic {base64.b64encode(f'{api_user_id}:{api_key}'.encode()).decode()}",
@@ -78,11 +123,13 @@ class MtnAPIHelper:
         data = {"grant_type": "client_credentials"}
 
         try:
-            response = requests.post(url, headers=headers, json=data)
+            response = self.http.post(
+                url, operation="token", headers=headers, json=data
+            )
             response.raise_for_status()
 
             if response.status_code == 200:
-                return response.json()["access_token"]
+                return response.json()
             else:
                 return None
 
@@ -95,12 +142,15 @@ class MtnPaymentHelper:
     def __init__(self, api_user_id, api_key):
         self.api_user_id = api_user_id
         self.api_key = api_key
-        self.endpoint = "sandbox.momodeveloper.mtn.com"
+        self.base_url = momo_base_url()
+        self.http = get_gateway_client()
 
-    def request_to_pay(self, amount, currency, external_id, party_id):
-        reference_id = str(uuid.uuid4())
+    def request_to_pay(
+        self, amount, currency, external_id, party_id, reference_id=None
+    ):
+        reference_id = str(reference_id or uuid.uuid4())
 
-        url = f"https://{self.endpoint}/collection/v1_0/requesttopay"
+        url = f"{self.base_url}/collection/v1_0/requesttopay"
 
         headers = {
             "Authorization": f"Bearer {self.get_access_token()}",
@@ -112,6 +162,9 @@ class MtnPaymentHelper:
                 "f1bc2773ffec4fdbb98720b4e227884d",
             ),
         }
+        callback_url = os.environ.get("MOMO_CALLBACK_URL")
+        if callback_url:
+            headers["X-Callback-Url"] = callback_url
 
         data = {
             "amount": float(amount),
@@ -126,8 +179,11 @@ class MtnPaymentHelper:
         }
 
         try:
-            response = requests.post(url, headers=headers, json=data)
+            response = self.http.post(
+                url, operation="request_to_pay", headers=headers, json=data
+            )
 
+            self.check_authorized(response)
             response.raise_for_status()
             print(response.status_code)
             print(response.text)
@@ -136,10 +192,28 @@ class MtnPaymentHelper:
 
         except requests.exceptions.RequestException as e:
             print(f"Error during API request: {e}")
+            if may_have_reached_momo(e):
+                raise PaymentUnconfirmedError(
+                    f"Request to pay {reference_id} may have reached MoMo: {e}"
+                ) from e
             return None
 
     def check_payment_status(self, transaction_ref):
-        url = f"https://{self.endpoint}/collection/v1_0/requesttopay/{transaction_ref}"
+        data = self.payment_details(transaction_ref)
+        if data is None:
+            return None
+        if "status" in data:
+            return data["status"]
+        elif "reason" in data:
+            return data["message"]
+        logging.error("Payment status not found in the response.")
+
+    def payment_details(self, transaction_ref):
+        """
+        Return MoMo's request-to-pay record for ``transaction_ref``, ``{}`` if
+        MoMo has no such request, or None if it could not be fetched.
+        """
+        url = f"{self.base_url}/collection/v1_0/requesttopay/{transaction_ref}"
 
         headers = {
             "Authorization": f"Bearer {self.get_access_token()}",
@@ -153,28 +227,18 @@ class MtnPaymentHelper:
         }
 
         try:
-            response = requests.get(url, headers=headers)
+            response = self.http.get(url, operation="payment_status", headers=headers)
+            self.check_authorized(response)
+            if response.status_code == 404:
+                return {}
             response.raise_for_status()
-
-            data = response.json()
-            if "status" in data:
-                amount = data["amount"]
-                status = data["status"]
-
-                return status
-
-            elif "reason" in data:
-                message = data["message"]
-                return message
-            else:
-                logging.error("Balance information not found in the response.")
-
+            return response.json()
         except Exception as e:
             logging.error(f"An error {e} occurred")
 
     def transfer(self, amount, currency, external_id, payee_party_id):
         reference_id = str(uuid.uuid4())
-        url = f"https://{self.endpoint}/disbursement/v1_0/transfer"
+        url = f"{self.base_url}/disbursement/v1_0/transfer"
 
         headers = {
             "Authorization": f"Bearer {self.get_access_token()}",
@@ -201,7 +265,10 @@ class MtnPaymentHelper:
         }
 
         try:
-            response = requests.post(url, headers=headers, json=data)
+            response = self.http.post(
+                url, operation="transfer", headers=headers, json=data
+            )
+            self.check_authorized(response)
             response.raise_for_status()
 
             logging.info(
@@ -225,7 +292,7 @@ class MtnPaymentHelper:
             raise
 
     def transfer_status(self, reference_id):
-        url = f"https://{self.endpoint}/disbursement/v1_0/transfer/{reference_id}"
+        url = f"{self.base_url}/disbursement/v1_0/transfer/{reference_id}"
         headers = {
             "Authorization": f"Bearer {self.get_access_token()}",
             "X-Target-Environment": "sandbox",
@@ -237,7 +304,8 @@ class MtnPaymentHelper:
             ),
         }
         try:
-            response = requests.get(url, headers=headers)
+            response = self.http.get(url, operation="transfer_status", headers=headers)
+            self.check_authorized(response)
             response.raise_for_status()
 
             data = response.json()
@@ -259,7 +327,7 @@ class MtnPaymentHelper:
         return None
 
     def balance(self):
-        url = f"https://{self.endpoint}/disbursement/v1_0/account/balance"
+        url = f"{self.base_url}/disbursement/v1_0/account/balance"
 
         headers = {
             "Authorization": f"Bearer {self.get_access_token()}",
@@ -273,7 +341,8 @@ class MtnPaymentHelper:
         }
 
         try:
-            response = requests.get(url, headers=headers)
+            response = self.http.get(url, operation="balance", headers=headers)
+            self.check_authorized(response)
             response.raise_for_status()
 
             balance_data = response.json()
@@ -293,7 +362,7 @@ class MtnPaymentHelper:
         return None
 
     def withdraw(self, amount, currency, external_id, party_id):
-        url = f"https://{self.endpoint}/collection/v1_0/requesttowithdraw"
+        url = f"{self.base_url}/collection/v1_0/requesttowithdraw"
         reference_id = str(uuid.uuid4())
 
         headers = {
@@ -320,7 +389,10 @@ class MtnPaymentHelper:
         }
 
         try:
-            response = requests.post(url, headers=headers, json=data)
+            response = self.http.post(
+                url, operation="withdraw", headers=headers, json=data
+            )
+            self.check_authorized(response)
             response.raise_for_status()
 
             logging.info(
@@ -345,22 +417,148 @@ class MtnPaymentHelper:
                 logging.error(f"HTTP error details: {tre.response}")
             raise
 
+    def check_authorized(self, response):
+        """Forget the cached access token once MoMo stops accepting it."""
+        if response.status_code == 401:
+            MtnCredentialManager().invalidate_access_token(self.api_user_id)
+
     def get_access_token(self):
-        api_helper = MtnAPIHelper()
         try:
-            return api_helper.create_access_token(self.api_user_id, self.api_key)
+            token = MtnCredentialManager().get_access_token(
+                self.api_user_id, self.api_key
+            )
         except Exception as e:
             raise AccessTokenError(f"Error obtaining access token: {e}")
+        if token is None:
+            raise AccessTokenError("No access token available.")
+        return token
+
+
+class MtnCredentialManager:
+    """
+    Provisions the MoMo API user and key once and caches OAuth access tokens.
+
+    Both live in Django's cache, so every worker process sharing the cache
+    backend reuses them. Tokens are cached until ``TOKEN_EXPIRY_MARGIN``
+    seconds before MoMo expires them. Refreshes of a key are serialised by a
+    thread lock per key within a process and by a ``cache.add`` lock across
+    processes, so a burst of payments mints a single token, and a slow
+    provisioning run does not hold up token refreshes.
+    """
+
+    CREDENTIALS_CACHE_KEY = "mtn:credentials"
+    TOKEN_CACHE_KEY = "mtn:access-token:{api_user_id}"
+    TOKEN_EXPIRY_MARGIN = 60
+    LOCK_MARGIN = 10
+    LOCK_POLL_INTERVAL = 0.05
+
+    _local_locks = collections.defaultdict(threading.Lock)
+    _local_locks_guard = threading.Lock()
+
+    def __init__(self, api_helper=None, cache=None):
+        self.api_helper = api_helper or MtnAPIHelper()
+        self.cache = cache or default_cache
+
+    @property
+    def lock_timeout(self):
+        """
+        Seconds a refresh may hold its lock: long enough for the slowest
+        refresh, provisioning's two gateway calls, to run to their (connect,
+        read) timeouts, plus ``LOCK_MARGIN``.
+        """
+        timeouts = get_gateway_client().timeout_for("provisioning")
+        return math.ceil(2 * sum(timeouts)) + self.LOCK_MARGIN
+
+    @classmethod
+    def _local_lock(cls, key):
+        with cls._local_locks_guard:
+            return cls._local_locks[key]
+
+    def get_credentials(self):
+        api_user = os.environ.get("MOMO_API_USER")
+        api_key = os.environ.get("MOMO_API_KEY")
+        if api_user and api_key:
+            return {"api_user": api_user, "api_key": api_key}
+        return self._get_or_refresh(
+            self.CREDENTIALS_CACHE_KEY, self._provision_credentials
+        )
+
+    def get_access_token(self, api_user_id, api_key):
+        return self._get_or_refresh(
+            self.TOKEN_CACHE_KEY.format(api_user_id=api_user_id),
+            lambda: self._create_access_token(api_user_id, api_key),
+        )
+
+    def invalidate_access_token(self, api_user_id):
+        self.cache.delete(self.TOKEN_CACHE_KEY.format(api_user_id=api_user_id))
+
+    def invalidate_credentials(self):
+        self.cache.delete(self.CREDENTIALS_CACHE_KEY)
+
+    def _provision_credentials(self):
+        reference_id = self.api_helper.get_apiuser()
+        if not reference_id:
+            return None, None
+        result_hash = self.api_helper.create_api_key(reference_id) or {}
+        if not result_hash.get("api_key") or not result_hash.get("api_user"):
+            return None, None
+        return result_hash, None
+
+    def _create_access_token(self, api_user_id, api_key):
+        token_data = self.api_helper.request_access_token(api_user_id, api_key)
+        if not token_data or not token_data.get("access_token"):
+            return None, None
+        expires_in = int(token_data.get("expires_in", 3600))
+        timeout = max(expires_in - self.TOKEN_EXPIRY_MARGIN, 1)
+        return token_data["access_token"], timeout
+
+    def _get_or_refresh(self, key, produce):
+        value = self.cache.get(key)
+        if value is not None:
+            return value
+
+        with self._local_lock(key):
+            value = self.cache.get(key)
+            if value is not None:
+                return value
+
+            # The lock holds a token unique to this refresh, so a refresh
+            # that outlives the lock's timeout cannot release the lock of the
+            # one that took over from it.
+            lock_key = f"{key}:lock"
+            lock_token = uuid.uuid4().hex
+            lock_timeout = self.lock_timeout
+            deadline = time.monotonic() + lock_timeout
+            while not self.cache.add(lock_key, lock_token, lock_timeout):
+                time.sleep(self.LOCK_POLL_INTERVAL)
+                value = self.cache.get(key)
+                if value is not None:
+                    return value
+                if time.monotonic() > deadline:
+                    logging.error(f"Timed out waiting for {lock_key}.")
+                    return None
+
+            try:
+                value = self.cache.get(key)
+                if value is not None:
+                    return value
+                value, timeout = produce()
+                if value is not None:
+                    self.cache.set(key, value, timeout)
+                return value
+            finally:
+                # Django's cache has no compare-and-delete, so a lock that
+                # expires between this get and the delete below can still
+                # release its next holder's lock. That takes a refresh
+                # outliving lock_timeout by a few milliseconds, and costs at
+                # most one extra token.
+                if self.cache.get(lock_key) == lock_token:
+                    self.cache.delete(lock_key)
 
 
 def auth_keys():
-    mtn_helper = MtnAPIHelper()
-    reference_id = mtn_helper.get_apiuser()
-    result_hash = mtn_helper.create_api_key(reference_id)
-    api_key = result_hash.get("api_key", None)
-    api_user = result_hash.get("api_user", None)
-
-    if api_key and api_user:
-        return {"api_user": api_user, "api_key": api_key}
+    result_hash = MtnCredentialManager().get_credentials()
+    if result_hash:
+        return {"api_user": result_hash["api_user"], "api_key": result_hash["api_key"]}
     else:
         print("API key not found")
@@ -0,0 +1,189 @@
+"""
+Queries behind the dashboard analytics.
+
+Every figure for a day and the day before it comes out of one conditional
+aggregate over a half-open range: ``[yesterday, day + 1)`` on the rollup
+date, or ``[start of yesterday, start of day + 1)`` on
+``transaction_date`` when reading transactions directly, so the range is a
+plain index scan instead of a ``__date`` cast per row.
+"""
+
+import calendar
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import ExtractMonth
+from django.utils import timezone
+from users.models import User
+from .models import DailySalesRollup, DailySignupRollup, Transaction
+
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def sales_metrics(day, merchant_id=None):
+    """Sales figures for ``day`` and the day before, from the rollups."""
+    yesterday = day - timedelta(days=1)
+    rollups = DailySalesRollup.objects.filter(
+        date__gte=yesterday, date__lt=day + timedelta(days=1)
+    )
+    if merchant_id is not None:
+        rollups = rollups.filter(merchant_id=merchant_id)
+    today_only = Q(date=day)
+    yesterday_only = Q(date=yesterday)
+    return rollups.aggregate(
+        total_transactions=Sum("transaction_count", filter=today_only, default=0),
+        amount_made=Sum("total_amount", filter=today_only, default=Decimal("0")),
+        loss=Sum("negative_amount", filter=today_only, default=Decimal("0")),
+        total_transactions_yesterday=Sum(
+            "transaction_count", filter=yesterday_only, default=0
+        ),
+        amount_made_yesterday=Sum(
+            "total_amount", filter=yesterday_only, default=Decimal("0")
+        ),
+    )
+
+
+def transaction_metrics(day, merchant_id=None):
+    """
+    The same figures as ``sales_metrics`` read straight from transactions;
+    used to check and benchmark the rollups.
+    """
+    start = start_of_day(day)
+    transactions = Transaction.objects.filter(
+        transaction_date__gte=start_of_day(day - timedelta(days=1)),
+        transaction_date__lt=start_of_day(day + timedelta(days=1)),
+    )
+    if merchant_id is not None:
+        transactions = transactions.filter(merchant_id=merchant_id)
+    today_only = Q(transaction_date__gte=start)
+    yesterday_only = Q(transaction_date__lt=start)
+    return transactions.aggregate(
+        total_transactions=Count("id", filter=today_only),
+        amount_made=Sum("amount", filter=today_only, default=Decimal("0")),
+        loss=Sum("amount", filter=today_only & Q(amount__lt=0), default=Decimal("0")),
+        total_transactions_yesterday=Count("id", filter=yesterday_only),
+        amount_made_yesterday=Sum(
+            "amount", filter=yesterday_only, default=Decimal("0")
+        ),
+    )
+
+
+def signup_metrics(day):
+    """Users and clients who joined on ``day`` and in total up to it."""
+    return DailySignupRollup.objects.filter(date__lte=day).aggregate(
+        new_users=Sum("user_count", filter=Q(date=day), default=0),
+        new_clients=Sum(
+            "user_count", filter=Q(date=day, role=User.Role.CLIENT), default=0
+        ),
+        all_users=Sum("user_count", default=0),
+        all_clients=Sum("user_count", filter=Q(role=User.Role.CLIENT), default=0),
+    )
+
+
+def percentage_change(current, previous):
+    if previous == 0:
+        return round(100 if current > 0 else 0, 2)
+    return round(((current - previous) / previous) * 100, 2)
+
+
+def sales_summary(day, merchant_id=None):
+    """Sales figures for ``day`` with the change from the day before."""
+    sales = sales_metrics(day, merchant_id)
+    total_transactions = sales["total_transactions"]
+    total_amount_made = round(sales["amount_made"], 2)
+    loss = round(sales["loss"], 2)
+    profit = round(total_amount_made - loss, 2)
+    profit_loss = round(profit - abs(loss), 2)
+    return {
+        "date": day,
+        "merchant": merchant_id,
+        "total_transactions": total_transactions,
+        "total_transactions_percentage": percentage_change(
+            total_transactions, sales["total_transactions_yesterday"]
+        ),
+        "total_amount_made": total_amount_made,
+        "total_amount_made_percentage": percentage_change(
+            total_amount_made, round(sales["amount_made_yesterday"], 2)
+        ),
+        "profit_loss": profit_loss,
+    }
+
+
+def daily_summary(day, merchant_id=None):
+    """
+    The daily dashboard figures. ``merchant_id`` narrows the sales figures
+    to one merchant; signup figures are always platform-wide.
+    """
+    signups = signup_metrics(day)
+    all_users = signups["all_users"]
+    all_clients = signups["all_clients"]
+    users_percentage = (
+        round((signups["new_users"] / all_users) * 100, 2) if all_users > 0 else 0
+    )
+    clients_percentage = (
+        round((signups["new_clients"] / all_clients) * 100, 2) if all_clients > 0 else 0
+    )
+    return {
+        **sales_summary(day, merchant_id),
+        "new_users": signups["new_users"],
+        "new_clients": signups["new_clients"],
+        "users_percentage": users_percentage,
+        "clients_percentage": clients_percentage,
+    }
+
+
+def week_dates(day):
+    """The Sunday to Saturday week containing ``day``."""
+    start = day - timedelta(days=(day.weekday() + 1) % 7)
+    return [start + timedelta(days=i) for i in range(7)]
+
+
+def daily_sales(dates, merchant_id=None):
+    """Traffic and sales for each of the consecutive ``dates``."""
+    rollups = DailySalesRollup.objects.filter(
+        date__gte=dates[0], date__lt=dates[-1] + timedelta(days=1)
+    )
+    if merchant_id is not None:
+        rollups = rollups.filter(merchant_id=merchant_id)
+    totals = {
+        row["date"]: row
+        for row in rollups.values("date")
+        .annotate(traffic=Sum("transaction_count"), sales=Sum("total_amount"))
+        .order_by()
+    }
+    return [
+        {
+            "day": calendar.day_abbr[day.weekday()],
+            "date": day.strftime("%d %b, %Y"),
+            "traffic": totals.get(day, {}).get("traffic") or 0,
+            "sales": totals.get(day, {}).get("sales") or 0,
+        }
+        for day in dates
+    ]
+
+
+def monthly_sales(year, merchant_id=None):
+    """Traffic and sales for each month of ``year``."""
+    year_start = datetime(year, 1, 1).date()
+    rollups = DailySalesRollup.objects.filter(
+        date__gte=year_start, date__lt=year_start.replace(year=year + 1)
+    )
+    if merchant_id is not None:
+        rollups = rollups.filter(merchant_id=merchant_id)
+    totals = {
+        row["month"]: row
+        for row in rollups.annotate(month=ExtractMonth("date"))
+        .values("month")
+        .annotate(traffic=Sum("transaction_count"), sales=Sum("total_amount"))
+        .order_by()
+    }
+    return [
+        {
+            "month": calendar.month_abbr[month],
+            "traffic": totals.get(month, {}).get("traffic") or 0,
+            "sales": totals.get(month, {}).get("sales") or 0,
+        }
+        for month in range(1, 13)
+    ]
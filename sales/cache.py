@@ -0,0 +1,128 @@
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction as db_transaction
+from scanpay.routers import REPLICA, read_alias
+
+
+class AnalyticsCache:
+    """
+    Caches analytics responses per date or period in the ``analytics`` cache.
+
+    Each entry depends on a few tags, e.g. ``sales:2024-05-01`` or
+    ``signups``. A tag's version is a random token in the cache; entries are
+    stored with the versions they were computed from and a lookup fetches
+    the entry and its tag versions in one ``get_many``. Invalidating a tag
+    replaces its token once the surrounding transaction commits, which
+    makes every entry built from the old token stale. Because versions are
+    read before an entry is computed, a write that lands mid-computation
+    still invalidates it.
+    """
+
+    ALIAS = "analytics"
+    # Every entry depends on this tag, so rebuilding the rollups can drop all.
+    ROLLUPS = "rollups"
+
+    @staticmethod
+    def cache():
+        return caches[AnalyticsCache.ALIAS]
+
+    @staticmethod
+    def _tag_key(tag):
+        return f"analytics:tag:{tag}"
+
+    @staticmethod
+    def sales_tags(day):
+        return [f"sales:{day.isoformat()}", f"sales:{day.year}"]
+
+    @staticmethod
+    def signup_tags(day):
+        return [f"signups:{day.isoformat()}", "signups"]
+
+    @staticmethod
+    def get_or_compute(key, tags, compute):
+        """Return the cached value for ``key`` or compute and store it."""
+        cache = AnalyticsCache.cache()
+        tag_keys = [
+            AnalyticsCache._tag_key(tag) for tag in (AnalyticsCache.ROLLUPS, *tags)
+        ]
+        key = f"analytics:{key}"
+        found = cache.get_many([key, *tag_keys])
+        versions = []
+        for tag_key in tag_keys:
+            version = found.get(tag_key)
+            if version is None:
+                # A missing (or evicted) version gets a fresh token, so no
+                # entry stored under an older one can match it.
+                version = uuid.uuid4().hex
+                if not cache.add(tag_key, version, None):
+                    version = cache.get(tag_key, version)
+            versions.append(version)
+
+        entry = found.get(key)
+        if entry is not None and entry[0] == versions:
+            return entry[1]
+        value = compute()
+        timeout = settings.ANALYTICS_CACHE_TIMEOUT
+        if read_alias() == REPLICA:
+            # A lagging replica can return figures older than the versions
+            # read above; don't keep them for long.
+            timeout = min(timeout, settings.ANALYTICS_REPLICA_CACHE_TIMEOUT)
+        cache.set(key, (versions, value), timeout)
+        return value
+
+    @staticmethod
+    def invalidate(tags):
+        """Invalidate entries depending on ``tags`` once the write commits."""
+        tag_keys = [AnalyticsCache._tag_key(tag) for tag in tags]
+
+        def bump():
+            AnalyticsCache.cache().set_many(
+                {tag_key: uuid.uuid4().hex for tag_key in tag_keys}, None
+            )
+
+        db_transaction.on_commit(bump)
+
+    @staticmethod
+    def invalidate_sales(day):
+        AnalyticsCache.invalidate(AnalyticsCache.sales_tags(day))
+
+    @staticmethod
+    def invalidate_signups(day):
+        AnalyticsCache.invalidate(AnalyticsCache.signup_tags(day))
+
+    @staticmethod
+    def invalidate_all():
+        AnalyticsCache.invalidate([AnalyticsCache.ROLLUPS])
+
+    @staticmethod
+    def daily(day, merchant_id, compute):
+        # Compares against the day before and reports signups to date.
+        yesterday = day - timedelta(days=1)
+        return AnalyticsCache.get_or_compute(
+            f"daily:{day.isoformat()}:{merchant_id or 'all'}",
+            [f"sales:{day.isoformat()}", f"sales:{yesterday.isoformat()}", "signups"],
+            compute,
+        )
+
+    @staticmethod
+    def weekly(dates, compute):
+        return AnalyticsCache.get_or_compute(
+            f"weekly:{dates[0].isoformat()}",
+            [f"signups:{day.isoformat()}" for day in dates],
+            compute,
+        )
+
+    @staticmethod
+    def monthly(year, merchant_id, compute):
+        return AnalyticsCache.get_or_compute(
+            f"monthly:{year}:{merchant_id or 'all'}", [f"sales:{year}"], compute
+        )
+
+    @staticmethod
+    def sales(key, dates, compute):
+        """Cache ``key`` until sales on any of ``dates`` change."""
+        return AnalyticsCache.get_or_compute(
+            key, [f"sales:{day.isoformat()}" for day in dates], compute
+        )
@@ -0,0 +1,117 @@
+import csv
+import tempfile
+import openpyxl
+from django.http import FileResponse, StreamingHttpResponse
+from rest_framework import serializers
+from users.models import User
+from .filters import InvoiceFilterSerializer
+from .models import Invoice
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class InvoiceExportFilterSerializer(InvoiceFilterSerializer):
+    """Invoice list filters plus explicit IDs and the export format."""
+
+    invoice_ids = serializers.ListField(
+        child=serializers.UUIDField(), required=False, allow_empty=False
+    )
+    file_format = serializers.ChoiceField(choices=["xlsx", "csv"], default="xlsx")
+
+    def validate(self, data):
+        data = super().validate(data)
+        selectors = {"invoice_ids", "merchant", "client", "date_from", "date_to"}
+        if not selectors & data.keys():
+            raise serializers.ValidationError(
+                "Provide invoice_ids or a merchant, client or date range filter."
+            )
+        return data
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if "invoice_ids" in self.validated_data:
+            queryset = queryset.filter(id__in=self.validated_data["invoice_ids"])
+        return queryset
+
+
+class InvoiceExporter:
+    """
+    Streams invoice rows as CSV or XLSX with memory independent of row count.
+
+    Rows are read with one joined query through a chunked iterator (a
+    server-side cursor on PostgreSQL). CSV is yielded line by line; XLSX
+    goes through openpyxl's write-only mode, which spills rows to disk, and
+    the finished file is streamed back from a temporary file.
+    """
+
+    headers = ["Client", "Merchant", "Issue Date", "Due Date", "Total Amount", "Status"]
+    date_format = "%Y-%m-%d %H:%M:%S"
+
+    def __init__(self, queryset):
+        user_field = User.USERNAME_FIELD
+        self.queryset = (
+            queryset.select_related("client", "merchant")
+            .only(
+                "issue_date",
+                "due_date",
+                "total_amount",
+                "status",
+                f"client__{user_field}",
+                f"merchant__{user_field}",
+            )
+            .order_by("issue_date", "id")
+        )
+
+    def rows(self):
+        for invoice in self.queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield [
+                str(invoice.client),
+                str(invoice.merchant),
+                invoice.issue_date.strftime(self.date_format),
+                invoice.due_date.strftime(self.date_format),
+                str(invoice.total_amount),
+                invoice.get_status_display(),
+            ]
+
+    def csv_response(self, filename="invoices.csv"):
+        response = StreamingHttpResponse(self.csv_lines(), content_type="text/csv")
+        response["Content-Disposition"] = f"attachment; filename={filename}"
+        return response
+
+    def csv_lines(self):
+        buffer = _LineBuffer()
+        writer = csv.writer(buffer)
+        yield writer.writerow(self.headers)
+        for row in self.rows():
+            yield writer.writerow(row)
+
+    def xlsx_response(self, filename="invoices.xlsx"):
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet("Invoices")
+        sheet.append(self.headers)
+        for row in self.rows():
+            sheet.append(row)
+
+        output = tempfile.TemporaryFile()
+        workbook.save(output)
+        output.seek(0)
+        return FileResponse(
+            output,
+            as_attachment=True,
+            filename=filename,
+            content_type=(
+                "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            ),
+        )
+
+    def response(self, file_format):
+        if file_format == "csv":
+            return self.csv_response()
+        return self.xlsx_response()
+
+
+class _LineBuffer:
+    """File-like object whose write() hands the formatted line back."""
+
+    def write(self, value):
+        return value
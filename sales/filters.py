@@ -0,0 +1,94 @@
+from datetime import datetime, time, timedelta
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from rest_framework import serializers
+from .models import Invoice, PaymentMethods, Transaction
+
+
+class AnalyticsDateSerializer(serializers.Serializer):
+    date = serializers.DateField(required=False)
+
+
+class AnalyticsFilterSerializer(AnalyticsDateSerializer):
+    merchant = serializers.UUIDField(required=False)
+
+
+class DateRangeFilterSerializer(serializers.Serializer):
+    """
+    Validates list filters from the query string and applies them.
+
+    ``date_from`` and ``date_to`` are inclusive calendar days, applied as a
+    half-open timestamp range on ``date_field`` so the column's index can be
+    used directly.
+    """
+
+    date_field = None
+
+    merchant = serializers.UUIDField(required=False)
+    client = serializers.UUIDField(required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+    def validate(self, data):
+        date_from = data.get("date_from")
+        date_to = data.get("date_to")
+        if date_from and date_to and date_from > date_to:
+            raise serializers.ValidationError("date_from must not be after date_to.")
+        return data
+
+    @staticmethod
+    def start_of_day(day):
+        return timezone.make_aware(datetime.combine(day, time.min))
+
+    def filter_queryset(self, queryset):
+        data = self.validated_data
+        if "merchant" in data:
+            queryset = queryset.filter(merchant_id=data["merchant"])
+        if "client" in data:
+            queryset = queryset.filter(client_id=data["client"])
+        if "status" in data:
+            queryset = queryset.filter(status=data["status"])
+        if "date_from" in data:
+            queryset = queryset.filter(
+                **{f"{self.date_field}__gte": self.start_of_day(data["date_from"])}
+            )
+        if "date_to" in data:
+            end = self.start_of_day(data["date_to"] + timedelta(days=1))
+            queryset = queryset.filter(**{f"{self.date_field}__lt": end})
+        return queryset
+
+
+class TransactionFilterSerializer(DateRangeFilterSerializer):
+    date_field = "transaction_date"
+
+    status = serializers.ChoiceField(choices=Transaction.STATUS_CHOICES, required=False)
+    payment_method = serializers.ChoiceField(
+        choices=PaymentMethods.choices, required=False
+    )
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if "payment_method" in self.validated_data:
+            queryset = queryset.filter(
+                payment_method=self.validated_data["payment_method"]
+            )
+        return queryset
+
+
+class InvoiceFilterSerializer(DateRangeFilterSerializer):
+    date_field = "issue_date"
+
+    status = serializers.ChoiceField(choices=Invoice.STATUS_CHOICES, required=False)
+    payment_method = serializers.ChoiceField(
+        choices=PaymentMethods.choices, required=False
+    )
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if "payment_method" in self.validated_data:
+            paid_with = Invoice.transactions.through.objects.filter(
+                invoice_id=OuterRef("pk"),
+                transaction__payment_method=self.validated_data["payment_method"],
+            )
+            queryset = queryset.filter(Exists(paid_with))
+        return queryset
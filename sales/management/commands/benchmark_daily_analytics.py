@@ -0,0 +1,161 @@
+import random
+import statistics
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction as db_transaction
+from django.db.models import Count, Q, Sum
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from sales import analytics
+from sales.models import PaymentMethods, Transaction
+from sales.services import SalesRollupService
+from users.models import User
+
+
+def per_metric_queries(day, merchant_id=None):
+    """The figures as the view used to compute them: one query each."""
+    transactions = Transaction.objects.all()
+    if merchant_id is not None:
+        transactions = transactions.filter(merchant_id=merchant_id)
+    today = transactions.filter(transaction_date__date=day)
+    yesterday = transactions.filter(transaction_date__date=day - timedelta(days=1))
+    return {
+        "total_transactions": today.count(),
+        "amount_made": today.aggregate(total=Sum("amount"))["total"],
+        "loss": today.filter(amount__lt=0).aggregate(loss=Sum("amount"))["loss"],
+        "total_transactions_yesterday": yesterday.count(),
+        "amount_made_yesterday": yesterday.aggregate(total=Sum("amount"))["total"],
+        "new_users": User.objects.filter(date_joined__date=day).count(),
+        "new_clients": User.objects.filter(
+            date_joined__date=day, role=User.Role.CLIENT
+        ).count(),
+        "all_users": User.objects.count(),
+        "all_clients": User.objects.filter(role=User.Role.CLIENT).count(),
+    }
+
+
+def single_aggregate(day, merchant_id=None):
+    return {
+        **analytics.transaction_metrics(day, merchant_id),
+        **User.objects.aggregate(
+            new_users=Count("id", filter=Q(date_joined__date=day)),
+            new_clients=Count(
+                "id", filter=Q(date_joined__date=day, role=User.Role.CLIENT)
+            ),
+            all_users=Count("id"),
+            all_clients=Count("id", filter=Q(role=User.Role.CLIENT)),
+        ),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a transactions table and time the daily analytics queries: "
+        "one query per metric, one conditional aggregate, and the rollups. "
+        "Everything seeded is rolled back unless --keep is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--days", type=int, default=90)
+        parser.add_argument("--merchants", type=int, default=200)
+        parser.add_argument("--clients", type=int, default=5000)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--keep", action="store_true")
+
+    def handle(self, *args, **options):
+        with db_transaction.atomic():
+            merchant_ids = self.seed(options)
+            day = timezone.now().date()
+            merchant_id = merchant_ids[0]
+            strategies = (
+                ("per-metric queries", per_metric_queries),
+                ("single aggregate", single_aggregate),
+                ("rollups", analytics.daily_summary),
+            )
+            for scope, scope_merchant in (("all", None), ("merchant", merchant_id)):
+                self.stdout.write(f"Scope: {scope}")
+                for name, strategy in strategies:
+                    self.time(name, lambda: strategy(day, scope_merchant), options)
+            if not options["keep"]:
+                db_transaction.set_rollback(True)
+
+    def seed(self, options):
+        run = uuid.uuid4().hex[:8]
+
+        def users(role, count):
+            return User.objects.bulk_create(
+                [
+                    User(
+                        email=f"bench-{run}-{role.lower()}{index}@example.com",
+                        username=f"bench-{run}-{role.lower()}{index}",
+                        role=role,
+                    )
+                    for index in range(count)
+                ],
+                batch_size=options["batch_size"],
+            )
+
+        merchant_ids = [
+            user.pk for user in users(User.Role.MERCHANT, options["merchants"])
+        ]
+        client_ids = [user.pk for user in users(User.Role.CLIENT, options["clients"])]
+
+        now = timezone.now()
+        rows = options["rows"]
+        batch_size = options["batch_size"]
+        started = time.perf_counter()
+        # bulk_create dates every row now (transaction_date is auto_now_add),
+        # so each row's reference carries how many days back it belongs and
+        # one update per day moves the rows there.
+        for start in range(0, rows, batch_size):
+            Transaction.objects.bulk_create(
+                [
+                    Transaction(
+                        client_id=random.choice(client_ids),
+                        merchant_id=random.choice(merchant_ids),
+                        amount=Decimal(random.randint(-5000, 100000)) / 100,
+                        status=random.choice(
+                            [choice for choice, _ in Transaction.STATUS_CHOICES]
+                        ),
+                        payment_method=random.choice(PaymentMethods.values),
+                        reference_number=(
+                            f"BENCH-{run}-{random.randint(0, options['days'])}-{index}"
+                        ),
+                    )
+                    for index in range(start, min(start + batch_size, rows))
+                ]
+            )
+        for days_back in range(options["days"] + 1):
+            Transaction.objects.filter(
+                reference_number__startswith=f"BENCH-{run}-{days_back}-"
+            ).update(transaction_date=now - timedelta(days=days_back))
+        SalesRollupService.rebuild(
+            start_date=(now - timedelta(days=options["days"] + 1)).date()
+        )
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+        self.stdout.write(
+            f"Seeded {rows} transactions in {time.perf_counter() - started:.1f} s."
+        )
+        return merchant_ids
+
+    def time(self, name, call, options):
+        call()  # Warm up.
+        timings = []
+        for _ in range(options["repeat"]):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                call()
+                timings.append(time.perf_counter() - started)
+        timings.sort()
+        p95 = timings[max(int(len(timings) * 0.95) - 1, 0)]
+        self.stdout.write(
+            f"  {name:<20} mean {statistics.mean(timings) * 1000:9.2f} ms  "
+            f"p95 {p95 * 1000:9.2f} ms  {len(queries)} queries"
+        )
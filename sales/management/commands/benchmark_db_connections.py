@@ -0,0 +1,64 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+
+class Command(BaseCommand):
+    help = (
+        "Time simulated requests that each run one query, first with a new "
+        "connection per request and then with the configured connection "
+        "management (DB_CONNECTION_MODE)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+
+    def handle(self, *args, **options):
+        settings_dict = connection.settings_dict
+        configured = (
+            settings_dict["CONN_MAX_AGE"],
+            settings_dict["CONN_HEALTH_CHECKS"],
+        )
+        cases = (
+            ("connection per request", 0, False),
+            (
+                f"max age {configured[0]}s, health checks {configured[1]}",
+                *configured,
+            ),
+        )
+        opened = []
+
+        def count(sender, connection, **kwargs):
+            opened.append(connection.alias)
+
+        connection_created.connect(count)
+        try:
+            for name, conn_max_age, health_checks in cases:
+                settings_dict["CONN_MAX_AGE"] = conn_max_age
+                settings_dict["CONN_HEALTH_CHECKS"] = health_checks
+                connection.close()
+                opened.clear()
+                timings = [self.request() for _ in range(options["requests"])]
+                timings.sort()
+                p95 = timings[max(int(len(timings) * 0.95) - 1, 0)]
+                self.stdout.write(
+                    f"{name:<40} mean {statistics.mean(timings) * 1000:8.2f} ms  "
+                    f"p95 {p95 * 1000:8.2f} ms  {len(opened)} connections opened"
+                )
+        finally:
+            connection_created.disconnect(count)
+            settings_dict["CONN_MAX_AGE"], settings_dict["CONN_HEALTH_CHECKS"] = (
+                configured
+            )
+            connection.close()
+
+    def request(self):
+        started = time.perf_counter()
+        request_started.send(sender=self.__class__)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        request_finished.send(sender=self.__class__)
+        return time.perf_counter() - started
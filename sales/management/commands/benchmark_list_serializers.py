@@ -0,0 +1,185 @@
+import gzip
+import random
+import statistics
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+from rest_framework.renderers import JSONRenderer
+from sales.models import Invoice, Transaction
+from sales.serializers import (
+    InvoiceListSerializer,
+    InvoiceSerializer,
+    TransactionListSerializer,
+    TransactionSerializer,
+)
+from sales.services import TransactionIngestService
+from users.models import Address, Client, Company, Merchant, User
+from users.serializers import (
+    ClientListSerializer,
+    ClientSerializer,
+    MerchantListSerializer,
+    MerchantSerializer,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed users, transactions and invoices, then compare serialization "
+        "time and payload size, plain and gzipped as the list views send it, "
+        "of the model serializers with the lean list serializers. Everything "
+        "seeded is rolled back unless --keep is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5000)
+        parser.add_argument("--merchants", type=int, default=500)
+        parser.add_argument("--clients", type=int, default=2000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--keep", action="store_true")
+
+    def handle(self, *args, **options):
+        with db_transaction.atomic():
+            self.seed(options)
+            rows = options["rows"]
+            cases = (
+                (
+                    "transactions",
+                    lambda: list(Transaction.objects.all()[:rows]),
+                    lambda page: TransactionSerializer(page, many=True).data,
+                    lambda: list(
+                        TransactionListSerializer.get_queryset(
+                            Transaction.objects.all()
+                        )[:rows]
+                    ),
+                    lambda page: TransactionListSerializer(page).data,
+                ),
+                (
+                    "invoices",
+                    lambda: list(
+                        Invoice.objects.select_related(
+                            "merchant__company", "client"
+                        ).prefetch_related("transactions")[:rows]
+                    ),
+                    lambda page: InvoiceSerializer(page, many=True).data,
+                    lambda: list(
+                        InvoiceListSerializer.get_queryset(Invoice.objects.all())[:rows]
+                    ),
+                    lambda page: InvoiceListSerializer(page).data,
+                ),
+                (
+                    "merchants",
+                    lambda: list(Merchant.all_merchants()),
+                    lambda page: MerchantSerializer(page, many=True).data,
+                    lambda: list(
+                        MerchantListSerializer.get_queryset(Merchant.all_merchants())
+                    ),
+                    lambda page: MerchantListSerializer(page).data,
+                ),
+                (
+                    "clients",
+                    lambda: list(Client.objects.all()),
+                    lambda page: ClientSerializer(page, many=True).data,
+                    lambda: list(
+                        ClientListSerializer.get_queryset(Client.objects.all())
+                    ),
+                    lambda page: ClientListSerializer(page).data,
+                ),
+            )
+            for name, fetch, serialize, lean_fetch, lean_serialize in cases:
+                before = self.measure(fetch, serialize, options["repeat"])
+                after = self.measure(lean_fetch, lean_serialize, options["repeat"])
+                self.report(name, before, after)
+            if not options["keep"]:
+                db_transaction.set_rollback(True)
+
+    def seed(self, options):
+        run = uuid.uuid4().hex[:8]
+        companies = Company.objects.bulk_create(
+            [
+                Company(
+                    name=f"Bench {run} {index}",
+                    address=address,
+                    phone_number="+260970000000",
+                )
+                for index, address in enumerate(
+                    Address.objects.bulk_create(
+                        [
+                            Address(
+                                street=f"{index} Bench Road",
+                                city="Lusaka",
+                                province="Lusaka",
+                                postal_code="10101",
+                                country="Zambia",
+                            )
+                            for index in range(options["merchants"])
+                        ]
+                    )
+                )
+            ]
+        )
+
+        def users(role, count, **fields):
+            return User.objects.bulk_create(
+                [
+                    User(
+                        email=f"bench-{run}-{role.lower()}{index}@example.com",
+                        username=f"bench-{run}-{role.lower()}{index}",
+                        first_name="Bench",
+                        last_name=f"{role.title()} {index}",
+                        role=role,
+                        password="!",
+                        mfa_token=uuid.uuid4().hex,
+                        **{name: value(index) for name, value in fields.items()},
+                    )
+                    for index in range(count)
+                ]
+            )
+
+        merchants = users(
+            User.Role.MERCHANT,
+            options["merchants"],
+            company=lambda index: companies[index],
+            qr_code=lambda index: f"qr_codes/{run}-{index}.png",
+        )
+        clients = users(User.Role.CLIENT, options["clients"])
+        TransactionIngestService.ingest(
+            [
+                {
+                    "client": random.choice(clients).pk,
+                    "merchant": random.choice(merchants).pk,
+                    "amount": f"{random.randint(100, 100000) / 100:.2f}",
+                    "status": random.choice(["PENDING", "COMPLETED", "FAILED"]),
+                    "description": "Benchmark transaction",
+                }
+                for _ in range(options["rows"])
+            ]
+        )
+
+    def measure(self, fetch, serialize, repeat):
+        timings = []
+        for _ in range(repeat):
+            page = fetch()
+            started = time.perf_counter()
+            data = serialize(page)
+            timings.append(time.perf_counter() - started)
+        body = JSONRenderer().render(data)
+        return (
+            len(data),
+            statistics.median(timings),
+            len(body),
+            len(gzip.compress(body, compresslevel=6)),
+        )
+
+    def report(self, name, before, after):
+        rows, before_time, before_size, _ = before
+        _, after_time, after_size, after_gzip = after
+        self.stdout.write(
+            f"{name:<13} {rows:>6} rows  "
+            f"{before_time * 1000:8.1f} -> {after_time * 1000:7.1f} ms "
+            f"({before_time / max(after_time, 1e-9):5.1f}x)  "
+            f"{before_size / 1024:8.1f} -> {after_size / 1024:7.1f} KiB "
+            f"({before_size / max(after_size, 1):4.1f}x), "
+            f"{after_gzip / 1024:6.1f} KiB gzipped "
+            f"({before_size / max(after_gzip, 1):4.1f}x)"
+        )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from sales.services import InvoicingService
+
+
+class Command(BaseCommand):
+    help = (
+        "Finalize billing-period invoices whose period has ended and mark "
+        "unpaid invoices past their due date overdue; run it on a schedule"
+    )
+
+    def handle(self, *args, **options):
+        closed, overdue = InvoicingService.close_invoices()
+        self.stdout.write(
+            self.style.SUCCESS(f"Closed {closed} invoice(s), marked {overdue} overdue.")
+        )
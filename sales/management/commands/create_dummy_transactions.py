@@ -1,26 +1,29 @@
 import random
 import uuid
-from datetime import timedelta
+from decimal import Decimal
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from sales.models import PaymentMethods, Transaction
+from sales.models import PaymentMethods
+from sales.services import TransactionIngestService
 from users.models import Client, Merchant
 
 
 class Command(BaseCommand):
     help = "Generate dummy transactions"
 
-    def handle(self, *args, **kwargs):
-        clients = Client.objects.all()
-        merchants = Merchant.objects.all()
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=100)
 
-        if not clients.exists():
+    def handle(self, *args, **options):
+        client_ids = list(Client.objects.values_list("pk", flat=True))
+        merchant_ids = list(Merchant.objects.values_list("pk", flat=True))
+
+        if not client_ids:
             self.stdout.write(
                 self.style.ERROR("No clients found. Please create some clients first.")
             )
             return
 
-        if not merchants.exists():
+        if not merchant_ids:
             self.stdout.write(
                 self.style.ERROR(
                     "No merchants found. Please create some merchants first."
@@ -28,29 +31,24 @@ class Command(BaseCommand):
             )
             return
 
-        for _ in range(100):
-            client = random.choice(clients)
-            merchant = random.choice(merchants)
-            amount = round(
-                random.uniform(10.00, 1000.00), 2
-            )  # Random amount between 10 and 1000
-            transaction_date = timezone.now() - timedelta(days=random.randint(0, 30))
-            status = random.choice(["PENDING", "COMPLETED", "FAILED"])
-            payment_method = random.choice(PaymentMethods.values)
-            reference_number = str(uuid.uuid4())
-            description = "Dummy transaction description"
-
-            Transaction.objects.create(
-                client=client,
-                merchant=merchant,
-                amount=amount,
-                transaction_date=transaction_date,
-                status=status,
-                payment_method=payment_method,
-                reference_number=reference_number,
-                description=description,
-            )
+        count = options["count"]
+        rows = [
+            {
+                "client": str(random.choice(client_ids)),
+                "merchant": str(random.choice(merchant_ids)),
+                # Random amount between 10 and 1000
+                "amount": str(
+                    Decimal(random.uniform(10.00, 1000.00)).quantize(Decimal("0.01"))
+                ),
+                "status": random.choice(["PENDING", "COMPLETED", "FAILED"]),
+                "payment_method": random.choice(PaymentMethods.values),
+                "reference_number": str(uuid.uuid4()),
+                "description": "Dummy transaction description",
+            }
+            for _ in range(count)
+        ]
+        TransactionIngestService.ingest(rows)
 
         self.stdout.write(
-            self.style.SUCCESS("Successfully created 100 dummy transactions.")
+            self.style.SUCCESS(f"Successfully created {count} dummy transactions.")
         )
@@ -0,0 +1,22 @@
+from datetime import date
+from django.core.management.base import BaseCommand
+from sales.services import SalesRollupService
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily sales and signup rollups from history"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--start-date",
+            type=date.fromisoformat,
+            default=None,
+            help="Only rebuild rollups from this date (YYYY-MM-DD) onwards",
+        )
+
+    def handle(self, *args, **options):
+        start_date = options["start_date"]
+        SalesRollupService.rebuild(start_date=start_date)
+
+        scope = f"from {start_date}" if start_date else "from all history"
+        self.stdout.write(self.style.SUCCESS(f"Successfully rebuilt rollups {scope}."))
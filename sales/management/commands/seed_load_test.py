@@ -0,0 +1,358 @@
+import itertools
+import math
+import multiprocessing
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction as db_transaction
+from django.utils import timezone
+from ledger.services import LedgerService
+from sales.models import Invoice, PaymentMethods, Transaction
+from sales.services import InvoicingService, SalesRollupService
+from users.models import Address, Company, User
+
+STATUSES = [status for status, _ in Transaction.STATUS_CHOICES]
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """Let bulk_create keep the values it is given for auto_now_add fields."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def cum_weights(value, choices):
+    """Parse ``NAME=WEIGHT,...`` into cumulative weights over ``choices``."""
+    given = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in choices:
+            raise CommandError(f"{name!r} is not one of {', '.join(choices)}.")
+        try:
+            given[name] = float(weight)
+        except ValueError:
+            raise CommandError(f"{item!r} is not NAME=WEIGHT.") from None
+    if sum(given.values()) <= 0:
+        raise CommandError(f"{value!r} gives no weight to any choice.")
+    return list(itertools.accumulate(given.get(name, 0) for name in choices))
+
+
+def zipf_cum_weights(count, skew):
+    """Cumulative weights making the n-th item 1 / n**skew times as likely."""
+    return list(itertools.accumulate(1 / rank**skew for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed clients, merchants, companies, transactions, invoices and "
+        "ledger entries for load testing, with bulk_create in chunks and one "
+        "password hash for every user. Transactions are spread over --days, "
+        "merchants' popularity follows a Zipf distribution and statuses and "
+        "payment methods follow the given weights. Rollups are rebuilt once "
+        "at the end. Invoices follow INVOICING_PERIOD; billing-period "
+        "invoicing updates one invoice per merchant/client pair and is much "
+        "slower to seed than the default per-transaction invoices."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=10_000)
+        parser.add_argument("--merchants", type=int, default=1_000)
+        parser.add_argument(
+            "--companies",
+            type=int,
+            default=None,
+            help="Companies to spread merchants over (default: one per merchant)",
+        )
+        parser.add_argument("--transactions", type=int, default=1_000_000)
+        parser.add_argument(
+            "--days", type=int, default=365, help="Spread dates over this many days"
+        )
+        parser.add_argument(
+            "--status-weights",
+            default="COMPLETED=85,PENDING=10,FAILED=5",
+        )
+        parser.add_argument(
+            "--payment-method-weights",
+            default="MTN_MONEY=45,AIRTEL_MONEY=35,ZAMTEL_KWACHA=10,CREDIT_CARD=10",
+        )
+        parser.add_argument(
+            "--merchant-skew",
+            type=float,
+            default=1.0,
+            help="Zipf exponent of merchant popularity; 0 makes it uniform",
+        )
+        parser.add_argument(
+            "--median-amount",
+            type=float,
+            default=150,
+            help="Median of the log-normal transaction amounts",
+        )
+        parser.add_argument("--password", default="loadtest-password")
+        parser.add_argument("--chunk-size", type=int, default=2_000)
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Insert transactions from this many processes (PostgreSQL only)",
+        )
+        parser.add_argument("--no-invoices", action="store_true")
+        parser.add_argument("--no-ledger", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["merchants"] < 1 or options["clients"] < 1:
+            raise CommandError("Seed at least one merchant and one client.")
+        if options["workers"] > 1 and connection.vendor != "postgresql":
+            raise CommandError("--workers needs PostgreSQL.")
+        self.random = random.Random(options["seed"])
+        # Not drawn from the seeded generator, so reruns never collide.
+        self.run = uuid.uuid4().hex[:8]
+        self.chunk_size = options["chunk_size"]
+        self.now = timezone.now()
+        self.start = self.now - timedelta(days=options["days"])
+        started = time.perf_counter()
+
+        merchant_ids, client_ids = self.seed_users(options)
+        self.seed_transactions(merchant_ids, client_ids, options)
+
+        self.stdout.write("Rebuilding rollups...")
+        SalesRollupService.rebuild()
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeded {len(client_ids)} clients, {len(merchant_ids)} merchants "
+                f"and {options['transactions']} transactions in "
+                f"{time.perf_counter() - started:.1f} s."
+            )
+        )
+
+    def chunks(self, indexes):
+        for start in range(indexes.start, indexes.stop, self.chunk_size):
+            yield range(start, min(start + self.chunk_size, indexes.stop))
+
+    def random_moment(self):
+        return self.start + (self.now - self.start) * self.random.random()
+
+    def seed_users(self, options):
+        merchants = options["merchants"]
+        companies = options["companies"] or merchants
+        # Hashing is deliberately slow; every seeded user shares one hash.
+        password = make_password(options["password"])
+        company_ids = []
+        for chunk in self.chunks(range(companies)):
+            addresses = [
+                Address(
+                    street=f"{self.random.randint(1, 999)} Load Test Road",
+                    city=self.random.choice(
+                        ("Lusaka", "Ndola", "Kitwe", "Livingstone")
+                    ),
+                    province="Load Test",
+                    postal_code=f"{self.random.randint(10000, 99999)}",
+                    country="Zambia",
+                )
+                for _ in chunk
+            ]
+            company_rows = [
+                Company(
+                    name=f"Load Test {self.run} Company {index}",
+                    address=address,
+                    tpin=self.random.randint(1_000_000_000, 2_147_483_647),
+                    status=Company.Status.APPROVED,
+                )
+                for index, address in zip(chunk, addresses)
+            ]
+            with db_transaction.atomic():
+                Address.objects.bulk_create(addresses)
+                Company.objects.bulk_create(company_rows)
+            company_ids.extend(company.pk for company in company_rows)
+
+        def users(role, count, company_ids=None):
+            ids = []
+            prefix = f"load-{self.run}-{role.lower()}"
+            for chunk in self.chunks(range(count)):
+                rows = [
+                    User(
+                        email=f"{prefix}{index}@example.com",
+                        username=f"{prefix}{index}",
+                        password=password,
+                        first_name=role.title(),
+                        last_name=str(index),
+                        role=role,
+                        date_joined=self.random_moment(),
+                        company_id=(
+                            company_ids[index % len(company_ids)]
+                            if company_ids
+                            else None
+                        ),
+                    )
+                    for index in chunk
+                ]
+                User.objects.bulk_create(rows)
+                ids.extend(user.pk for user in rows)
+            self.stdout.write(f"Created {count} {role.lower()}s.")
+            return ids
+
+        merchant_ids = users(User.Role.MERCHANT, merchants, company_ids)
+        client_ids = users(User.Role.CLIENT, options["clients"])
+        return merchant_ids, client_ids
+
+    def seed_transactions(self, merchant_ids, client_ids, options):
+        count = options["transactions"]
+        self.merchant_weights = zipf_cum_weights(
+            len(merchant_ids), options["merchant_skew"]
+        )
+        self.status_weights = cum_weights(options["status_weights"], STATUSES)
+        self.method_weights = cum_weights(
+            options["payment_method_weights"], PaymentMethods.values
+        )
+        self.span = (self.now - self.start) / max(count, 1)
+        if options["workers"] == 1:
+            self.seed_slice(merchant_ids, client_ids, options, range(count))
+            return
+
+        # Each worker inserts a contiguous range of transactions, and so a
+        # contiguous stretch of dates, over its own connection.
+        size = math.ceil(count / options["workers"])
+        context = multiprocessing.get_context("fork")
+        connections.close_all()
+        self.stdout.flush()
+        workers = []
+        for number, start in enumerate(range(0, count, size)):
+            if options["seed"] is not None:
+                self.random = random.Random(f"{options['seed']}-{number}")
+            else:
+                self.random = random.Random()
+            worker = context.Process(
+                target=self.seed_worker,
+                args=(
+                    merchant_ids,
+                    client_ids,
+                    options,
+                    range(start, min(start + size, count)),
+                    f"worker {number + 1}: ",
+                ),
+            )
+            worker.start()
+            workers.append(worker)
+        for worker in workers:
+            worker.join()
+        failed = sum(1 for worker in workers if worker.exitcode)
+        if failed:
+            raise CommandError(f"{failed} of {len(workers)} workers failed.")
+
+    def seed_worker(self, *args):
+        try:
+            self.seed_slice(*args)
+        finally:
+            connections.close_all()
+
+    def seed_slice(self, merchant_ids, client_ids, options, indexes, label=""):
+        mu = math.log(options["median_amount"])
+        # None when invoices are not seeded at all.
+        per_transaction_invoices = (
+            None
+            if options["no_invoices"]
+            else InvoicingService.period() == "transaction"
+        )
+        due = timedelta(days=settings.INVOICE_DUE_DAYS)
+        draw = self.random
+
+        started = time.perf_counter()
+        reported = started
+        with explicit_dates(
+            Transaction._meta.get_field("transaction_date"),
+            Invoice._meta.get_field("issue_date"),
+        ):
+            for chunk in self.chunks(indexes):
+                size = len(chunk)
+                # Each chunk covers its own slice of the date range, in date
+                # order, so ledger sequences and running balances do too.
+                offsets = sorted(draw.random() for _ in range(size))
+                merchants = draw.choices(
+                    merchant_ids, cum_weights=self.merchant_weights, k=size
+                )
+                statuses = draw.choices(
+                    STATUSES, cum_weights=self.status_weights, k=size
+                )
+                methods = draw.choices(
+                    PaymentMethods.values, cum_weights=self.method_weights, k=size
+                )
+                transactions = [
+                    Transaction(
+                        client_id=client_ids[draw.randrange(len(client_ids))],
+                        merchant_id=merchant_id,
+                        amount=Decimal(
+                            f"{min(max(draw.lognormvariate(mu, 1.0), 1), 999_999):.2f}"
+                        ),
+                        transaction_date=self.start
+                        + self.span * (chunk.start + size * offset),
+                        status=status,
+                        payment_method=method,
+                        reference_number=f"LOAD-{self.run}-{index}",
+                    )
+                    for index, offset, merchant_id, status, method in zip(
+                        chunk, offsets, merchants, statuses, methods
+                    )
+                ]
+                with db_transaction.atomic():
+                    Transaction.objects.bulk_create(transactions)
+                    if per_transaction_invoices:
+                        self.invoice(transactions, due)
+                    elif per_transaction_invoices is not None:
+                        InvoicingService.invoice_new_transactions(transactions)
+                    if not options["no_ledger"]:
+                        LedgerService.post_new_transactions(transactions)
+
+                done = chunk.stop - indexes.start
+                if time.perf_counter() - reported > 10 or chunk.stop == indexes.stop:
+                    reported = time.perf_counter()
+                    rate = done / (reported - started)
+                    self.stdout.write(
+                        f"{label}{done}/{len(indexes)} transactions "
+                        f"({rate:,.0f} per second)"
+                    )
+        self.stdout.flush()
+
+    def invoice(self, transactions, due):
+        """One invoice per transaction, issued and settled as it would have been."""
+        invoices = []
+        for transaction in transactions:
+            due_date = transaction.transaction_date + due
+            if transaction.status == Transaction.STATUS_COMPLETED:
+                status = Invoice.STATUS_PAID
+            elif due_date < self.now:
+                status = Invoice.STATUS_OVERDUE
+            else:
+                status = Invoice.STATUS_PENDING
+            invoices.append(
+                Invoice(
+                    client_id=transaction.client_id,
+                    merchant_id=transaction.merchant_id,
+                    issue_date=transaction.transaction_date,
+                    due_date=due_date,
+                    total_amount=transaction.amount,
+                    status=status,
+                )
+            )
+        Invoice.objects.bulk_create(invoices)
+        Invoice.transactions.through.objects.bulk_create(
+            [
+                Invoice.transactions.through(
+                    invoice_id=invoice.pk, transaction_id=transaction.pk
+                )
+                for invoice, transaction in zip(invoices, transactions)
+            ]
+        )
@@ -0,0 +1,115 @@
+# Generated by Django 5.0.7 on 2026-10-18 11:17
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0002_alter_invoice_status_alter_transaction_status_and_more"),
+        ("users", "0009_alter_company_status"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailySignupRollup",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("date", models.DateField()),
+                (
+                    "role",
+                    models.CharField(
+                        choices=[
+                            ("ADMIN", "Admin"),
+                            ("CLIENT", "Client"),
+                            ("MERCHANT", "Merchant"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("user_count", models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="DailySalesRollup",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("date", models.DateField()),
+                (
+                    "payment_method",
+                    models.CharField(
+                        choices=[
+                            ("MTN_MONEY", "Mtn"),
+                            ("AIRTEL_MONEY", "Airtel"),
+                            ("ZAMTEL_KWACHA", "Zamtel"),
+                            ("CREDIT_CARD", "Credit Card"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("PENDING", "Pending"),
+                            ("COMPLETED", "Completed"),
+                            ("FAILED", "Failed"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("transaction_count", models.IntegerField(default=0)),
+                (
+                    "total_amount",
+                    models.DecimalField(decimal_places=2, default=0.0, max_digits=14),
+                ),
+                (
+                    "negative_amount",
+                    models.DecimalField(decimal_places=2, default=0.0, max_digits=14),
+                ),
+                (
+                    "merchant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_sales",
+                        to="users.merchant",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="dailysignuprollup",
+            constraint=models.UniqueConstraint(
+                fields=("date", "role"), name="unique_daily_signup_rollup"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="dailysalesrollup",
+            index=models.Index(fields=["date"], name="daily_sales_date_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="dailysalesrollup",
+            constraint=models.UniqueConstraint(
+                fields=("date", "merchant", "payment_method", "status"),
+                name="unique_daily_sales_rollup",
+            ),
+        ),
+    ]
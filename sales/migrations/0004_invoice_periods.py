@@ -0,0 +1,49 @@
+# Generated by Django 5.0.7 on 2026-10-18 11:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0003_sales_rollups"),
+        ("users", "0009_alter_company_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="invoice",
+            name="closed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="invoice",
+            name="period_end",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="invoice",
+            name="period_start",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(
+                condition=models.Q(
+                    ("closed_at__isnull", True), ("period_end__isnull", False)
+                ),
+                fields=["period_end"],
+                name="invoice_open_period_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="invoice",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(
+                    ("closed_at__isnull", True), ("period_start__isnull", False)
+                ),
+                fields=("merchant", "client", "period_start"),
+                name="unique_open_invoice_period",
+            ),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.0.7 on 2026-10-18 11:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("sales", "0004_invoice_periods"),
+        ("users", "0009_alter_company_status"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="dailysalesrollup",
+            name="merchant",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="daily_sales",
+                to="users.merchant",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="transaction",
+            name="client",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="client_transactions",
+                to="users.client",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="transaction",
+            name="merchant",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="merchant_transactions",
+                to="users.merchant",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="dailysalesrollup",
+            index=models.Index(
+                fields=["merchant", "date"], name="daily_sales_merchant_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["merchant", "-transaction_date"], name="txn_merchant_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["merchant", "status", "-transaction_date"],
+                name="txn_merchant_status_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["client", "-transaction_date"], name="txn_client_date_idx"
+            ),
+        ),
+    ]
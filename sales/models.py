@@ -1,11 +1,11 @@
 import uuid
 import random
 import string
-from django.db import models
+from django.db import models, transaction as db_transaction
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from ledger.models import LedgerEntry
-from users.models import Client, Merchant
+from ledger.services import LedgerService
+from users.models import Client, Merchant, User
 
 
 class PaymentMethods(models.TextChoices):
@@ -22,6 +22,12 @@ class PaymentMethods(models.TextChoices):
     CREDIT_CARD = "CREDIT_CARD", _("Credit Card")
 
 
+# Fields that decide what a transaction posts to the ledger.
+LEDGER_FIELDS = {"status", "amount", "merchant", "client"}
+# Fields whose changes the ledger, rollups and invoices apply as diffs.
+DIFFED_FIELDS = LEDGER_FIELDS | {"payment_method", "transaction_date"}
+
+
 class Transaction(models.Model):
     STATUS_PENDING = "PENDING"
     STATUS_COMPLETED = "COMPLETED"
@@ -34,11 +40,18 @@ class Transaction(models.Model):
     ]
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # Indexed through the composite indexes in Meta, which lead with them.
     client = models.ForeignKey(
-        Client, on_delete=models.CASCADE, related_name="client_transactions"
+        Client,
+        on_delete=models.CASCADE,
+        related_name="client_transactions",
+        db_index=False,
     )
     merchant = models.ForeignKey(
-        Merchant, on_delete=models.CASCADE, related_name="merchant_transactions"
+        Merchant,
+        on_delete=models.CASCADE,
+        related_name="merchant_transactions",
+        db_index=False,
     )
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     transaction_date = models.DateTimeField(auto_now_add=True)
@@ -60,6 +73,17 @@ class Transaction(models.Model):
         indexes = [
             models.Index(fields=["payment_method"], name="payment_method_idx"),
             models.Index(fields=["-transaction_date"], name="transaction_date_idx"),
+            models.Index(
+                fields=["merchant", "-transaction_date"],
+                name="txn_merchant_date_idx",
+            ),
+            models.Index(
+                fields=["merchant", "status", "-transaction_date"],
+                name="txn_merchant_status_date_idx",
+            ),
+            models.Index(
+                fields=["client", "-transaction_date"], name="txn_client_date_idx"
+            ),
         ]
 
     def generate_reference_number(self):
@@ -70,27 +94,95 @@ class Transaction(models.Model):
         )
         return f"TXN-{now}-{random_str}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    @property
+    def loaded_values(self):
+        """Field values as last read from or written to the database."""
+        return getattr(self, "_loaded_values", None)
+
+    def changed_fields(self):
+        """
+        Names of fields whose value differs from ``loaded_values``, or None
+        when the instance was not loaded from the database.
+        """
+        loaded = self.loaded_values
+        if loaded is None:
+            return None
+        return [
+            field.name
+            for field in self._meta.concrete_fields
+            if field.attname in loaded
+            and getattr(self, field.attname) != loaded[field.attname]
+        ]
+
+    def lock_stored_values(self, keep):
+        """
+        Lock this row until the surrounding atomic block ends and make its
+        stored values the new ``loaded_values``. Fields other than ``keep``
+        also take their stored values, so the instance shows the row as it
+        will be once this save has been written.
+        """
+        attnames = [field.attname for field in self._meta.concrete_fields]
+        stored = (
+            type(self)
+            ._base_manager.select_for_update()
+            .filter(pk=self.pk)
+            .values(*attnames)
+            .first()
+        )
+        if stored is None:
+            return
+        keep = {self._meta.get_field(name).attname for name in keep}
+        for field in self._meta.concrete_fields:
+            value = stored[field.attname]
+            if field.attname in keep or getattr(self, field.attname) == value:
+                continue
+            setattr(self, field.attname, value)
+            if field.is_relation and field.is_cached(self):
+                field.delete_cached_value(self)
+        self._loaded_values = stored
+
     def save(self, *args, **kwargs):
+        """
+        Save only the fields changed since the instance was loaded.
+
+        An instance loaded from the database and left unchanged is not
+        written at all and, as with ``save(update_fields=[])``, sends no
+        ``pre_save`` or ``post_save`` signals. A save that writes one of
+        ``DIFFED_FIELDS`` locks and re-reads the row first. The rollups,
+        invoices and ledger then diff against what is stored, not against a
+        copy that another save may have overtaken, which would count that
+        save's change twice. Other saves, such as a description edit, write
+        only their fields and skip the lock.
+        """
         if not self.reference_number:
             self.reference_number = self.generate_reference_number()
-        super().save(*args, **kwargs)
-        description = (
-            f"Transaction {self.reference_number} - {self.get_payment_method_display()}"
+        created = self._state.adding
+        changed = None if created else self.changed_fields()
+        derive_update_fields = (
+            changed is not None and "update_fields" not in kwargs and not args
         )
-        if self.status == self.STATUS_COMPLETED:
-            LedgerEntry.objects.create(
-                transaction=self,
-                description=description,
-                debit=self.amount,  # Amount paid by client
-                credit=0.00,  # No credit for a completed transaction
-            )
-        elif self.status == self.STATUS_FAILED:
-            LedgerEntry.objects.create(
-                transaction=self,
-                description=description,
-                debit=0.00,
-                credit=self.amount,  # Refund or unsuccessful payment
-            )
+        if derive_update_fields and not changed:
+            return
+        with db_transaction.atomic(savepoint=False):
+            written = kwargs.get("update_fields") or changed
+            if changed is not None and DIFFED_FIELDS.intersection(written):
+                self.lock_stored_values(written)
+                changed = self.changed_fields()
+            if derive_update_fields:
+                kwargs["update_fields"] = changed
+            super().save(*args, **kwargs)
+            if changed is None or LEDGER_FIELDS.intersection(changed):
+                LedgerService.post_transaction(self, created=created)
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+        }
 
 
 class Invoice(models.Model):
@@ -120,6 +212,10 @@ class Invoice(models.Model):
     transactions = models.ManyToManyField(
         Transaction, related_name="invoices", blank=True
     )
+    # Set on billing-period invoices; per-transaction invoices leave them empty.
+    period_start = models.DateTimeField(null=True, blank=True)
+    period_end = models.DateTimeField(null=True, blank=True)
+    closed_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"Invoice {self.id} - {self.total_amount} {self.get_status_display()}"
@@ -128,4 +224,70 @@ class Invoice(models.Model):
         indexes = [
             models.Index(fields=["status"], name="invoice_status_idx"),
             models.Index(fields=["-issue_date"], name="issue_date_idx"),
+            models.Index(
+                fields=["period_end"],
+                name="invoice_open_period_idx",
+                condition=models.Q(closed_at__isnull=True, period_end__isnull=False),
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["merchant", "client", "period_start"],
+                name="unique_open_invoice_period",
+                condition=models.Q(closed_at__isnull=True, period_start__isnull=False),
+            ),
+        ]
+
+
+class DailySalesRollup(models.Model):
+    """Per-day transaction counts and sums for one merchant, method and status."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    date = models.DateField()
+    merchant = models.ForeignKey(
+        Merchant,
+        on_delete=models.CASCADE,
+        related_name="daily_sales",
+        db_index=False,
+    )
+    payment_method = models.CharField(max_length=20, choices=PaymentMethods.choices)
+    status = models.CharField(max_length=20, choices=Transaction.STATUS_CHOICES)
+    transaction_count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    negative_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+
+    def __str__(self):
+        return f"{self.date} - {self.merchant_id} - {self.transaction_count}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "merchant", "payment_method", "status"],
+                name="unique_daily_sales_rollup",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["date"], name="daily_sales_date_idx"),
+            models.Index(
+                fields=["merchant", "date"], name="daily_sales_merchant_date_idx"
+            ),
+        ]
+
+
+class DailySignupRollup(models.Model):
+    """Per-day count of users who joined with a given role."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    date = models.DateField()
+    role = models.CharField(max_length=10, choices=User.Role.choices)
+    user_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.date} - {self.role} - {self.user_count}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "role"], name="unique_daily_signup_rollup"
+            ),
         ]
@@ -0,0 +1,9 @@
+from utils.pagination import KeysetPagination
+
+
+class TransactionPagination(KeysetPagination):
+    ordering_field = "transaction_date"
+
+
+class InvoicePagination(KeysetPagination):
+    ordering_field = "issue_date"
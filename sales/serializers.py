@@ -1,6 +1,21 @@
+from django.utils import timezone
 from rest_framework import serializers
 from users.serializers import ClientSerializer, MerchantSerializer
-from .models import Transaction, Invoice
+from utils.serializers import ValuesSerializer
+from .models import PaymentMethods, Transaction, Invoice
+
+format_datetime = serializers.DateTimeField().to_representation
+
+
+def format_amount(value):
+    # Amounts come from two-decimal columns, so there is nothing to round.
+    return f"{value:.2f}"
+
+
+def format_timestamp(value, zone):
+    """``value`` in ``zone``, as DRF writes it."""
+    value = value.astimezone(zone).isoformat()
+    return value[:-6] + "Z" if value.endswith("+00:00") else value
 
 
 class TransactionSerializer(serializers.ModelSerializer):
@@ -22,3 +37,105 @@ class InvoiceSerializer(serializers.ModelSerializer):
         representation = super().to_representation(instance)
         representation["issue_date"] = instance.issue_date.strftime("%d %B, %Y")
         return representation
+
+
+class BulkTransactionSerializer(serializers.Serializer):
+    """One row of a bulk import; references are checked by the ingest service."""
+
+    client = serializers.UUIDField()
+    merchant = serializers.UUIDField()
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    status = serializers.ChoiceField(
+        choices=Transaction.STATUS_CHOICES, default=Transaction.STATUS_PENDING
+    )
+    payment_method = serializers.ChoiceField(
+        choices=PaymentMethods.choices, default=PaymentMethods.AIRTEL
+    )
+    reference_number = serializers.CharField(max_length=100, required=False)
+    description = serializers.CharField(
+        required=False, allow_blank=True, allow_null=True
+    )
+    transaction_date = serializers.DateTimeField(required=False)
+
+
+class TransactionListSerializer(ValuesSerializer):
+    """``TransactionSerializer``'s output, formatted straight from ``values()``."""
+
+    fields = (
+        "id",
+        "client",
+        "merchant",
+        "amount",
+        "transaction_date",
+        "status",
+        "payment_method",
+        "reference_number",
+        "description",
+    )
+    formatters = {
+        "id": str,
+        "client": str,
+        "merchant": str,
+        "amount": format_amount,
+    }
+
+    def __init__(self, rows):
+        super().__init__(rows)
+        # Looking the time zone up once instead of per row (as localtime()
+        # does) is most of the difference in formatting a date.
+        zone = timezone.get_current_timezone()
+        self.formatters = {
+            **self.formatters,
+            "transaction_date": lambda value: format_timestamp(value, zone),
+        }
+
+
+class InvoiceListSerializer(ValuesSerializer):
+    """
+    Invoice rows with the parties' ids and names and the ids of the
+    invoiced transactions, instead of fully nested users and transactions.
+    """
+
+    fields = (
+        "id",
+        "issue_date",
+        "due_date",
+        "total_amount",
+        "status",
+        "client",
+        "client__email",
+        "merchant",
+        "merchant__email",
+        "merchant__company__name",
+    )
+    formatters = {
+        "id": str,
+        "client": str,
+        "merchant": str,
+        "issue_date": lambda value: value.strftime("%d %B, %Y"),
+        "due_date": format_datetime,
+        "total_amount": format_amount,
+    }
+
+    def to_representation(self, row):
+        row = super().to_representation(row)
+        row["client"] = {"id": row["client"], "email": row.pop("client__email")}
+        row["merchant"] = {
+            "id": row["merchant"],
+            "email": row.pop("merchant__email"),
+            "company": row.pop("merchant__company__name"),
+        }
+        row["transactions"] = self.transaction_ids.get(row["id"], [])
+        return row
+
+    @property
+    def data(self):
+        links = Invoice.transactions.through.objects.filter(
+            invoice_id__in=[row["id"] for row in self.rows]
+        ).values_list("invoice_id", "transaction_id")
+        self.transaction_ids = {}
+        for invoice_id, transaction_id in links:
+            self.transaction_ids.setdefault(str(invoice_id), []).append(
+                str(transaction_id)
+            )
+        return super().data
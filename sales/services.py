@@ -1,13 +1,528 @@
-from .models import Transaction, Invoice
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from rest_framework.exceptions import ValidationError
+from ledger.services import LedgerService
+from .cache import AnalyticsCache
+from .models import DailySalesRollup, DailySignupRollup, Transaction, Invoice
+from .serializers import BulkTransactionSerializer
 from django.utils import timezone
+from users.models import Client, Merchant, User
 
-def create_invoice_for_transaction(transaction):
-    invoice = Invoice.objects.create(
-        client=transaction.client,
-        merchant=transaction.merchant,
-        due_date=timezone.now() + timezone.timedelta(days=30),
+
+def build_invoice_for_transaction(transaction):
+    return Invoice(
+        client_id=transaction.client_id,
+        merchant_id=transaction.merchant_id,
+        due_date=timezone.now() + timedelta(days=settings.INVOICE_DUE_DAYS),
         total_amount=transaction.amount,
         status="PENDING",
     )
+
+
+def create_invoice_for_transaction(transaction):
+    invoice = build_invoice_for_transaction(transaction)
+    invoice.save()
     invoice.transactions.add(transaction)
     return invoice
+
+
+class InvoicingService:
+    """
+    Attaches transactions to invoices according to ``INVOICING_PERIOD``.
+
+    In ``transaction`` mode every transaction gets its own invoice. In
+    ``daily`` and ``monthly`` mode each merchant/client pair has one open
+    invoice per billing period; transactions are linked to it and its
+    ``total_amount`` is moved with an ``F()`` update, so the invoice table
+    grows with billing periods rather than with payments. ``close_invoices``
+    finalizes invoices whose period has ended and marks unpaid ones overdue.
+    """
+
+    PERIODS = ("transaction", "daily", "monthly")
+
+    @staticmethod
+    def period():
+        period = settings.INVOICING_PERIOD
+        if period not in InvoicingService.PERIODS:
+            raise ImproperlyConfigured(
+                f"INVOICING_PERIOD must be one of {', '.join(InvoicingService.PERIODS)}."
+            )
+        return period
+
+    @staticmethod
+    def period_bounds(moment, period):
+        """Return the local ``[start, end)`` billing period containing ``moment``."""
+        day = timezone.localtime(moment).date()
+        if period == "monthly":
+            start = day.replace(day=1)
+            end = (start + timedelta(days=32)).replace(day=1)
+        else:
+            start = day
+            end = day + timedelta(days=1)
+        return (
+            timezone.make_aware(datetime.combine(start, time.min)),
+            timezone.make_aware(datetime.combine(end, time.min)),
+        )
+
+    @staticmethod
+    def _open_invoices():
+        return Invoice.objects.filter(
+            closed_at__isnull=True, period_start__isnull=False
+        )
+
+    @staticmethod
+    def _period_invoice(key, period_end, amount):
+        """Add ``amount`` to the open invoice for ``key``; returns its pk."""
+        merchant_id, client_id, period_start = key
+        lookup = {
+            "merchant_id": merchant_id,
+            "client_id": client_id,
+            "period_start": period_start,
+        }
+        invoices = InvoicingService._open_invoices().filter(**lookup)
+        pk = invoices.values_list("pk", flat=True).first()
+        if pk is None:
+            try:
+                with db_transaction.atomic():
+                    return Invoice.objects.create(
+                        **lookup,
+                        period_end=period_end,
+                        due_date=period_end + timedelta(days=settings.INVOICE_DUE_DAYS),
+                        total_amount=amount,
+                        status=Invoice.STATUS_PENDING,
+                    ).pk
+            except IntegrityError:
+                pk = invoices.values_list("pk", flat=True).get()
+        Invoice.objects.filter(pk=pk).update(total_amount=F("total_amount") + amount)
+        return pk
+
+    @staticmethod
+    def _group(transactions, period):
+        groups = {}
+        for transaction in transactions:
+            start, end = InvoicingService.period_bounds(
+                transaction.transaction_date, period
+            )
+            key = (transaction.merchant_id, transaction.client_id, start)
+            _, total, members = groups.get(key, (end, Decimal("0.00"), []))
+            members.append(transaction)
+            groups[key] = (end, total + Decimal(str(transaction.amount)), members)
+        return groups
+
+    @staticmethod
+    def invoice_transaction(transaction):
+        """Invoice one newly created transaction."""
+        period = InvoicingService.period()
+        if period == "transaction":
+            create_invoice_for_transaction(transaction)
+            return
+        with db_transaction.atomic(savepoint=False):
+            for key, (end, total, _) in InvoicingService._group(
+                [transaction], period
+            ).items():
+                pk = InvoicingService._period_invoice(key, end, total)
+                Invoice.transactions.through.objects.create(
+                    invoice_id=pk, transaction_id=transaction.pk
+                )
+
+    @staticmethod
+    def invoice_new_transactions(transactions):
+        """Invoice a batch of inserted transactions with bulk inserts."""
+        period = InvoicingService.period()
+        if period == "transaction":
+            invoices = Invoice.objects.bulk_create(
+                [build_invoice_for_transaction(t) for t in transactions]
+            )
+            links = [(invoice.pk, t) for invoice, t in zip(invoices, transactions)]
+        else:
+            links = []
+            groups = InvoicingService._group(transactions, period)
+            for key, (end, total, members) in groups.items():
+                pk = InvoicingService._period_invoice(key, end, total)
+                links.extend((pk, transaction) for transaction in members)
+        Invoice.transactions.through.objects.bulk_create(
+            [
+                Invoice.transactions.through(
+                    invoice_id=invoice_id, transaction_id=transaction.pk
+                )
+                for invoice_id, transaction in links
+            ]
+        )
+
+    @staticmethod
+    def adjust_transaction(transaction, delta):
+        """Move the open period invoices of ``transaction`` by ``delta``."""
+        if delta and InvoicingService.period() != "transaction":
+            InvoicingService._open_invoices().filter(transactions=transaction).update(
+                total_amount=F("total_amount") + delta
+            )
+
+    @staticmethod
+    def close_invoices(now=None):
+        """
+        Finalize period invoices whose period has ended and mark pending
+        invoices past their due date overdue. Returns both counts.
+        """
+        now = now or timezone.now()
+        with db_transaction.atomic():
+            closed = Invoice.objects.filter(
+                closed_at__isnull=True, period_end__lte=now
+            ).update(closed_at=now)
+            overdue = Invoice.objects.filter(
+                status=Invoice.STATUS_PENDING, due_date__lt=now
+            ).update(status=Invoice.STATUS_OVERDUE)
+        return closed, overdue
+
+
+class SalesRollupService:
+    """
+    Keeps ``DailySalesRollup`` and ``DailySignupRollup`` in step with the
+    transaction and user tables so the analytics views never scan them.
+    """
+
+    TRANSACTION_FIELDS = (
+        "transaction_date",
+        "merchant_id",
+        "payment_method",
+        "status",
+        "amount",
+    )
+    USER_FIELDS = ("date_joined", "role")
+    REBUILD_BATCH_SIZE = 1000
+
+    @staticmethod
+    def _current(instance, fields):
+        return {name: getattr(instance, name) for name in fields}
+
+    @staticmethod
+    def _previous(instance, fields):
+        loaded = instance.loaded_values
+        if loaded is None:
+            return None
+        return {name: loaded.get(name, getattr(instance, name)) for name in fields}
+
+    @staticmethod
+    def _bump(model, key, **deltas):
+        changes = {name: F(name) + delta for name, delta in deltas.items()}
+        if model.objects.filter(**key).update(**changes):
+            return
+        try:
+            with db_transaction.atomic():
+                model.objects.create(**key, **deltas)
+        except IntegrityError:
+            model.objects.filter(**key).update(**changes)
+
+    @staticmethod
+    def _bump_sales(values, sign):
+        amount = Decimal(str(values["amount"]))
+        day = timezone.localtime(values["transaction_date"]).date()
+        AnalyticsCache.invalidate_sales(day)
+        SalesRollupService._bump(
+            DailySalesRollup,
+            {
+                "date": day,
+                "merchant_id": values["merchant_id"],
+                "payment_method": values["payment_method"],
+                "status": values["status"],
+            },
+            transaction_count=sign,
+            total_amount=amount * sign,
+            negative_amount=min(amount, Decimal("0.00")) * sign,
+        )
+
+    @staticmethod
+    def _bump_signups(values, sign):
+        day = timezone.localtime(values["date_joined"]).date()
+        AnalyticsCache.invalidate_signups(day)
+        SalesRollupService._bump(
+            DailySignupRollup,
+            {
+                "date": day,
+                "role": values["role"],
+            },
+            user_count=sign,
+        )
+
+    @staticmethod
+    def _record(instance, created, fields, bump):
+        current = SalesRollupService._current(instance, fields)
+        previous = None
+        if not created:
+            previous = SalesRollupService._previous(instance, fields)
+            # Without a snapshot of the stored row there is nothing to diff
+            # against; ``rebuild_sales_rollups`` reconciles such updates.
+            if previous is None or previous == current:
+                return
+        with db_transaction.atomic(savepoint=False):
+            if previous is not None:
+                bump(previous, -1)
+            bump(current, 1)
+
+    @staticmethod
+    def _remove(instance, fields, bump):
+        values = SalesRollupService._previous(instance, fields)
+        bump(values or SalesRollupService._current(instance, fields), -1)
+
+    @staticmethod
+    def record_transaction(transaction, created):
+        SalesRollupService._record(
+            transaction,
+            created,
+            SalesRollupService.TRANSACTION_FIELDS,
+            SalesRollupService._bump_sales,
+        )
+
+    @staticmethod
+    def record_new_transactions(transactions):
+        """Roll up a batch of inserted transactions, one bump per group."""
+        groups = {}
+        for transaction in transactions:
+            values = SalesRollupService._current(
+                transaction, SalesRollupService.TRANSACTION_FIELDS
+            )
+            key = (
+                timezone.localtime(values["transaction_date"]).date(),
+                values["merchant_id"],
+                values["payment_method"],
+                values["status"],
+            )
+            count, total, negative = groups.get(
+                key, (0, Decimal("0.00"), Decimal("0.00"))
+            )
+            amount = Decimal(str(values["amount"]))
+            groups[key] = (
+                count + 1,
+                total + amount,
+                negative + min(amount, Decimal("0.00")),
+            )
+        with db_transaction.atomic(savepoint=False):
+            for (date, merchant_id, method, status), group in groups.items():
+                count, total, negative = group
+                AnalyticsCache.invalidate_sales(date)
+                SalesRollupService._bump(
+                    DailySalesRollup,
+                    {
+                        "date": date,
+                        "merchant_id": merchant_id,
+                        "payment_method": method,
+                        "status": status,
+                    },
+                    transaction_count=count,
+                    total_amount=total,
+                    negative_amount=negative,
+                )
+
+    @staticmethod
+    def remove_transaction(transaction):
+        SalesRollupService._remove(
+            transaction,
+            SalesRollupService.TRANSACTION_FIELDS,
+            SalesRollupService._bump_sales,
+        )
+
+    @staticmethod
+    def record_user(user, created):
+        SalesRollupService._record(
+            user,
+            created,
+            SalesRollupService.USER_FIELDS,
+            SalesRollupService._bump_signups,
+        )
+
+    @staticmethod
+    def remove_user(user):
+        SalesRollupService._remove(
+            user, SalesRollupService.USER_FIELDS, SalesRollupService._bump_signups
+        )
+
+    @staticmethod
+    def rebuild(start_date=None):
+        """Recompute the rollup tables from history, from ``start_date`` on."""
+        transactions = Transaction.objects.annotate(date=TruncDate("transaction_date"))
+        users = User.objects.annotate(date=TruncDate("date_joined"))
+        sales_rollups = DailySalesRollup.objects.all()
+        signup_rollups = DailySignupRollup.objects.all()
+        if start_date:
+            start = timezone.make_aware(datetime.combine(start_date, time.min))
+            transactions = transactions.filter(transaction_date__gte=start)
+            users = users.filter(date_joined__gte=start)
+            sales_rollups = sales_rollups.filter(date__gte=start_date)
+            signup_rollups = signup_rollups.filter(date__gte=start_date)
+
+        sales_rows = (
+            transactions.values("date", "merchant_id", "payment_method", "status")
+            .annotate(
+                transaction_count=Count("id"),
+                total_amount=Sum("amount"),
+                negative_amount=Sum("amount", filter=Q(amount__lt=0), default=0),
+            )
+            .order_by()
+        )
+        signup_rows = (
+            users.values("date", "role").annotate(user_count=Count("id")).order_by()
+        )
+
+        with db_transaction.atomic():
+            AnalyticsCache.invalidate_all()
+            sales_rollups.delete()
+            signup_rollups.delete()
+            DailySalesRollup.objects.bulk_create(
+                (DailySalesRollup(**row) for row in sales_rows.iterator()),
+                batch_size=SalesRollupService.REBUILD_BATCH_SIZE,
+            )
+            DailySignupRollup.objects.bulk_create(
+                (DailySignupRollup(**row) for row in signup_rows.iterator()),
+                batch_size=SalesRollupService.REBUILD_BATCH_SIZE,
+            )
+
+
+class TransactionIngestService:
+    """
+    Validates and inserts large batches of transactions.
+
+    Rows are validated up front with a handful of set-based queries, then
+    written chunk by chunk: transactions, invoice links and ledger entries
+    each go in with one ``bulk_create`` (as do the invoices themselves in
+    per-transaction mode, while period invoices get one update per
+    merchant/client pair), and the ledger balances for a chunk are computed
+    in memory. ``bulk_create``
+    sends no signals, so the work the per-row signal handlers do is done
+    here in bulk instead. The whole batch commits or rolls back as one.
+    """
+
+    CHUNK_SIZE = 1000
+
+    @staticmethod
+    def _chunks(items, size):
+        for start in range(0, len(items), size):
+            yield items[start : start + size]
+
+    @staticmethod
+    def _existing(queryset, field, values):
+        found = set()
+        values = list(values)
+        for chunk in TransactionIngestService._chunks(
+            values, TransactionIngestService.CHUNK_SIZE
+        ):
+            rows = queryset.filter(**{f"{field}__in": chunk}).order_by()
+            found.update(str(value) for value in rows.values_list(field, flat=True))
+        return found
+
+    @staticmethod
+    def validate(rows):
+        """
+        Return the validated rows or raise ``ValidationError`` mapping the
+        position of every rejected row to its field errors.
+        """
+        if not isinstance(rows, list):
+            raise ValidationError(
+                {"non_field_errors": ["Expected a list of transactions."]}
+            )
+        if not rows:
+            raise ValidationError({"non_field_errors": ["No transactions given."]})
+
+        # One serializer checks every row, as a ListSerializer's child does;
+        # building one per row costs more than validating the row.
+        serializer = BulkTransactionSerializer()
+        errors = {}
+        valid = []
+        for index, row in enumerate(rows):
+            try:
+                valid.append((index, serializer.run_validation(row)))
+            except ValidationError as exc:
+                errors[index] = exc.detail
+
+        clients = TransactionIngestService._existing(
+            Client.objects, "pk", {row["client"] for _, row in valid}
+        )
+        merchants = TransactionIngestService._existing(
+            Merchant.objects, "pk", {row["merchant"] for _, row in valid}
+        )
+        taken = TransactionIngestService._existing(
+            Transaction.objects,
+            "reference_number",
+            {row["reference_number"] for _, row in valid if "reference_number" in row},
+        )
+        seen = set()
+        for index, row in valid:
+            row_errors = {}
+            if str(row["client"]) not in clients:
+                row_errors["client"] = ["Unknown client."]
+            if str(row["merchant"]) not in merchants:
+                row_errors["merchant"] = ["Unknown merchant."]
+            reference = row.get("reference_number")
+            if reference is not None:
+                if reference in taken or reference in seen:
+                    row_errors["reference_number"] = [
+                        "Transaction with this reference number already exists."
+                    ]
+                seen.add(reference)
+            if row_errors:
+                errors[index] = row_errors
+
+        if errors:
+            raise ValidationError({index: errors[index] for index in sorted(errors)})
+        return [row for _, row in valid]
+
+    @staticmethod
+    def _build(rows):
+        transactions = []
+        references = set()
+        for row in rows:
+            transaction = Transaction(
+                client_id=row["client"],
+                merchant_id=row["merchant"],
+                amount=row["amount"],
+                status=row["status"],
+                payment_method=row["payment_method"],
+                reference_number=row.get("reference_number"),
+                description=row.get("description"),
+                transaction_date=row.get("transaction_date"),
+            )
+            while (
+                not transaction.reference_number
+                or transaction.reference_number in references
+            ):
+                transaction.reference_number = transaction.generate_reference_number()
+            references.add(transaction.reference_number)
+            transactions.append(transaction)
+        return transactions
+
+    @staticmethod
+    def ingest(rows):
+        """Validate ``rows`` and create them; returns the created transactions."""
+        data = TransactionIngestService.validate(rows)
+        created = []
+        with db_transaction.atomic():
+            for chunk in TransactionIngestService._chunks(
+                TransactionIngestService._build(data),
+                TransactionIngestService.CHUNK_SIZE,
+            ):
+                created.extend(TransactionIngestService._insert(chunk))
+        return created
+
+    @staticmethod
+    def _insert(transactions):
+        dated = [
+            (transaction, transaction.transaction_date)
+            for transaction in transactions
+            if transaction.transaction_date is not None
+        ]
+        transactions = Transaction.objects.bulk_create(transactions)
+        if dated:
+            # bulk_create stamps auto_now_add fields with the current time;
+            # rows that came with a date get it back in one more statement.
+            for transaction, transaction_date in dated:
+                transaction.transaction_date = transaction_date
+            Transaction.objects.bulk_update(
+                [transaction for transaction, _ in dated], ["transaction_date"]
+            )
+        InvoicingService.invoice_new_transactions(transactions)
+        LedgerService.post_new_transactions(transactions)
+        SalesRollupService.record_new_transactions(transactions)
+        return transactions
@@ -1,37 +1,57 @@
-from django.db.models.signals import pre_save, post_delete, post_save
+from decimal import Decimal
+from django.db.models.signals import pre_delete, post_delete, post_save
 from django.dispatch import receiver
-from django.db import transaction
+from ledger.services import LedgerService
+from users.models import Client, Merchant, User
 from .models import Invoice, Transaction
-from .services import create_invoice_for_transaction
+from .services import InvoicingService, SalesRollupService
 
 
 @receiver(post_save, sender=Transaction)
 def create_invoice(sender, instance, created, **kwargs):
     if created:
-        create_invoice_for_transaction(instance)
-
-
-@receiver(pre_save, sender=Transaction)
-def update_transaction_ledger(sender, instance, **kwargs):
-    if instance.pk:
-        try:
-            previous = Transaction.objects.get(pk=instance.pk)
-            if previous.status != instance.status:
-                if instance.ledger_entry:
-                    if instance.status == Transaction.STATUS_COMPLETED:
-                        instance.ledger_entry.debit = instance.amount
-                        instance.ledger_entry.credit = 0.00
-                    elif instance.status == Transaction.STATUS_FAILED:
-                        instance.ledger_entry.debit = 0.00
-                        instance.ledger_entry.credit = instance.amount
-                    instance.ledger_entry.save()
-        except Transaction.DoesNotExist:
-            pass
+        InvoicingService.invoice_transaction(instance)
+    elif instance.loaded_values is not None:
+        previous = instance.loaded_values.get("amount", instance.amount)
+        InvoicingService.adjust_transaction(
+            instance, Decimal(str(instance.amount)) - Decimal(str(previous))
+        )
+
+
+@receiver(post_save, sender=Transaction)
+def update_sales_rollup(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        SalesRollupService.record_transaction(instance, created)
+
 
 @receiver(post_delete, sender=Transaction)
-def delete_transaction_ledger(sender, instance, **kwargs):
-    if instance.ledger_entry:
-        instance.ledger_entry.delete()
+def remove_sales_rollup(sender, instance, **kwargs):
+    SalesRollupService.remove_transaction(instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=Merchant)
+def update_signup_rollup(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        SalesRollupService.record_user(instance, created)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=Merchant)
+def remove_signup_rollup(sender, instance, **kwargs):
+    SalesRollupService.remove_user(instance)
+
+
+@receiver(pre_delete, sender=Transaction)
+def reverse_transaction_ledger(sender, instance, **kwargs):
+    LedgerService.reverse_transaction(instance)
+
+
+@receiver(pre_delete, sender=Transaction)
+def remove_from_invoice(sender, instance, **kwargs):
+    InvoicingService.adjust_transaction(instance, -instance.amount)
 
 
 @receiver(post_delete, sender=Invoice)
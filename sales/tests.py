@@ -1,3 +1,1065 @@
-from django.test import TestCase
+from datetime import timedelta
+import gzip
+from decimal import Decimal
+from io import BytesIO, StringIO
+import json
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlparse
+import openpyxl
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import F, Sum
+from django.db.models.signals import post_save, pre_save
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+from ledger.models import LedgerAccount, LedgerEntry
+from users.models import User
+from . import analytics
+from .cache import AnalyticsCache
+from .serializers import TransactionListSerializer, TransactionSerializer
+from .services import InvoicingService, TransactionIngestService
+from .models import (
+    DailySalesRollup,
+    DailySignupRollup,
+    Invoice,
+    PaymentMethods,
+    Transaction,
+)
+from .views import (
+    DailyAnalyticsView,
+    ExportInvoicesToExcel,
+    InvoiceListCreateAPIView,
+    MerchantDailySalesView,
+    MerchantMonthlySalesView,
+    MerchantWeeklySalesView,
+    MonthlyTrafficSalesView,
+    TransactionBulkCreateAPIView,
+    TransactionListCreateAPIView,
+    WeeklyActiveUsersView,
+)
 
-# Create your tests here.
+
+def create_user(role, index, **extra_fields):
+    return User.objects.create(
+        email=f"{role.lower()}{index}@example.com",
+        username=f"{role.lower()}{index}",
+        role=role,
+        **extra_fields,
+    )
+
+
+class SalesTestCase(TestCase):
+    def setUp(self):
+        AnalyticsCache.cache().clear()
+        self.merchant = create_user(User.Role.MERCHANT, 1)
+        self.client_user = create_user(User.Role.CLIENT, 1)
+        self.admin = create_user(User.Role.ADMIN, 1, is_staff=True)
+
+    def create_transaction(self, amount, **extra_fields):
+        return Transaction.objects.create(
+            client_id=self.client_user.pk,
+            merchant_id=self.merchant.pk,
+            amount=Decimal(amount),
+            **extra_fields,
+        )
+
+    def get(self, view_class, params=None, user=None):
+        request = APIRequestFactory().get("/", params)
+        force_authenticate(request, user=user or self.admin)
+        return view_class.as_view()(request)
+
+
+class SalesRollupTests(SalesTestCase):
+    def rollup(self, **filters):
+        return DailySalesRollup.objects.get(merchant=self.merchant, **filters)
+
+    def test_transactions_are_rolled_up_incrementally(self):
+        self.create_transaction("10.00")
+        transaction = self.create_transaction("-2.50")
+
+        rollup = self.rollup(status=Transaction.STATUS_PENDING)
+        self.assertEqual(rollup.transaction_count, 2)
+        self.assertEqual(rollup.total_amount, Decimal("7.50"))
+        self.assertEqual(rollup.negative_amount, Decimal("-2.50"))
+
+        transaction.status = Transaction.STATUS_COMPLETED
+        transaction.save()
+        self.assertEqual(
+            self.rollup(status=Transaction.STATUS_PENDING).transaction_count, 1
+        )
+        self.assertEqual(
+            self.rollup(status=Transaction.STATUS_COMPLETED).total_amount,
+            Decimal("-2.50"),
+        )
+
+        transaction.delete()
+        self.assertEqual(
+            self.rollup(status=Transaction.STATUS_COMPLETED).transaction_count, 0
+        )
+
+    def test_stale_copies_do_not_double_count(self):
+        transaction = self.create_transaction("10.00")
+        first = Transaction.objects.get(pk=transaction.pk)
+        second = Transaction.objects.get(pk=transaction.pk)
+
+        first.status = Transaction.STATUS_COMPLETED
+        first.save()
+        second.status = Transaction.STATUS_COMPLETED
+        second.amount = Decimal("12.00")
+        second.save()
+
+        self.assertEqual(
+            self.rollup(status=Transaction.STATUS_PENDING).transaction_count, 0
+        )
+        rollup = self.rollup(status=Transaction.STATUS_COMPLETED)
+        self.assertEqual(rollup.transaction_count, 1)
+        self.assertEqual(rollup.total_amount, Decimal("12.00"))
+
+    def test_stale_copies_keep_fields_they_did_not_change(self):
+        transaction = self.create_transaction("10.00")
+        stale = Transaction.objects.get(pk=transaction.pk)
+        transaction.status = Transaction.STATUS_COMPLETED
+        transaction.save()
+
+        stale.description = "Updated"
+        stale.save()
+
+        self.assertEqual(
+            Transaction.objects.get(pk=transaction.pk).status,
+            Transaction.STATUS_COMPLETED,
+        )
+        self.assertEqual(
+            self.rollup(status=Transaction.STATUS_COMPLETED).transaction_count, 1
+        )
+
+    def test_signups_follow_role_changes(self):
+        user = create_user(User.Role.CLIENT, 2)
+        user.role = User.Role.MERCHANT
+        user.save()
+
+        counts = dict(DailySignupRollup.objects.values_list("role", "user_count"))
+        self.assertEqual(counts[User.Role.CLIENT], 1)
+        self.assertEqual(counts[User.Role.MERCHANT], 2)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.create_transaction("10.00", payment_method=PaymentMethods.MTN_MONEY)
+        self.create_transaction("5.00", status=Transaction.STATUS_FAILED)
+        expected_sales = sorted(
+            DailySalesRollup.objects.values_list(
+                "date", "payment_method", "status", "transaction_count", "total_amount"
+            )
+        )
+        expected_signups = sorted(
+            DailySignupRollup.objects.values_list("date", "role", "user_count")
+        )
+
+        DailySalesRollup.objects.all().delete()
+        DailySignupRollup.objects.all().delete()
+        call_command("rebuild_sales_rollups", stdout=StringIO())
+
+        self.assertEqual(
+            sorted(
+                DailySalesRollup.objects.values_list(
+                    "date",
+                    "payment_method",
+                    "status",
+                    "transaction_count",
+                    "total_amount",
+                )
+            ),
+            expected_sales,
+        )
+        self.assertEqual(
+            sorted(DailySignupRollup.objects.values_list("date", "role", "user_count")),
+            expected_signups,
+        )
+
+
+class TransactionQueryCountTests(SalesTestCase):
+    """
+    Pins the queries behind each Transaction write. The steady-state costs
+    are: insert, invoice + link, rollup bump and, once settled, one ledger
+    account upsert plus one entry insert.
+    """
+
+    def setUp(self):
+        super().setUp()
+        # Warm the rollup rows and ledger accounts the writes below touch.
+        for status in (Transaction.STATUS_PENDING, Transaction.STATUS_COMPLETED):
+            self.create_transaction("1.00", status=status)
+
+    def test_create(self):
+        with self.assertNumQueries(4):
+            self.create_transaction("10.00")
+
+    def test_create_completed(self):
+        with self.assertNumQueries(6):
+            self.create_transaction("10.00", status=Transaction.STATUS_COMPLETED)
+
+    def test_status_change(self):
+        transaction = Transaction.objects.get(pk=self.create_transaction("10.00").pk)
+        transaction.status = Transaction.STATUS_COMPLETED
+        with self.assertNumQueries(7):
+            transaction.save()
+
+    def test_unchanged_save(self):
+        transaction = self.create_transaction("10.00")
+        with self.assertNumQueries(0):
+            transaction.save()
+
+    def test_unchanged_save_sends_no_signals(self):
+        transaction = self.create_transaction("10.00")
+        receiver = mock.Mock()
+        for signal in (pre_save, post_save):
+            signal.connect(receiver, sender=Transaction)
+            self.addCleanup(signal.disconnect, receiver, sender=Transaction)
+
+        transaction.save()
+
+        receiver.assert_not_called()
+
+    def test_description_change_skips_the_lock_and_the_ledger(self):
+        transaction = self.create_transaction("10.00")
+        transaction.description = "Updated"
+        with self.assertNumQueries(1):
+            transaction.save()
+
+    def test_delete(self):
+        transaction = self.create_transaction(
+            "10.00", status=Transaction.STATUS_COMPLETED
+        )
+        with self.assertNumQueries(7):
+            transaction.delete()
+
+
+class AnalyticsViewTests(SalesTestCase):
+    def test_daily_analytics(self):
+        self.create_transaction("10.00")
+        self.create_transaction("-4.00")
+        yesterday = timezone.now().date() - timedelta(days=1)
+        DailySalesRollup.objects.create(
+            date=yesterday,
+            merchant=self.merchant,
+            payment_method=PaymentMethods.AIRTEL,
+            status=Transaction.STATUS_COMPLETED,
+            transaction_count=1,
+            total_amount=Decimal("3.00"),
+        )
+
+        with self.assertNumQueries(2):
+            response = self.get(DailyAnalyticsView)
+
+        self.assertEqual(response.data["total_transactions"], 2)
+        self.assertEqual(response.data["total_transactions_percentage"], 100)
+        self.assertEqual(response.data["total_amount_made"], Decimal("6.00"))
+        self.assertEqual(response.data["total_amount_made_percentage"], 100)
+        self.assertEqual(response.data["profit_loss"], Decimal("6.00"))
+        self.assertEqual(response.data["new_users"], 3)
+        self.assertEqual(response.data["new_clients"], 1)
+
+    def test_daily_analytics_for_a_date_and_merchant(self):
+        other_merchant = create_user(User.Role.MERCHANT, 2)
+        self.create_transaction("10.00")
+        Transaction.objects.create(
+            client_id=self.client_user.pk,
+            merchant_id=other_merchant.pk,
+            amount=Decimal("7.00"),
+        )
+        today = timezone.now().date()
+        tomorrow = today + timedelta(days=1)
+
+        response = self.get(DailyAnalyticsView, {"merchant": str(self.merchant.pk)})
+        self.assertEqual(response.data["total_amount_made"], Decimal("10.00"))
+
+        response = self.get(DailyAnalyticsView, {"date": tomorrow.isoformat()})
+        self.assertEqual(response.data["date"], tomorrow)
+        self.assertEqual(response.data["total_transactions"], 0)
+        self.assertEqual(response.data["total_transactions_percentage"], -100)
+        self.assertEqual(response.data["new_users"], 0)
+
+        response = self.get(DailyAnalyticsView, {"date": "not-a-date"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_merchants_only_see_their_own_figures(self):
+        other_merchant = create_user(User.Role.MERCHANT, 2)
+        self.create_transaction("10.00")
+
+        response = self.get(DailyAnalyticsView, user=other_merchant)
+        self.assertEqual(response.data["merchant"], other_merchant.pk)
+        self.assertEqual(response.data["total_transactions"], 0)
+
+        response = self.get(
+            DailyAnalyticsView, {"merchant": str(self.merchant.pk)}, user=other_merchant
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_clients_cannot_pick_a_merchant(self):
+        self.create_transaction("10.00")
+
+        response = self.get(
+            DailyAnalyticsView,
+            {"merchant": str(self.merchant.pk)},
+            user=self.client_user,
+        )
+        self.assertEqual(response.status_code, 403)
+
+        response = self.get(DailyAnalyticsView, user=self.client_user)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data["merchant"])
+
+    def test_rollups_match_transactions(self):
+        for amount, status in (
+            ("10.00", Transaction.STATUS_COMPLETED),
+            ("-2.50", Transaction.STATUS_FAILED),
+            ("4.00", Transaction.STATUS_PENDING),
+        ):
+            self.create_transaction(amount, status=status)
+        today = timezone.now().date()
+
+        for merchant_id in (None, self.merchant.pk):
+            self.assertEqual(
+                analytics.sales_metrics(today, merchant_id),
+                analytics.transaction_metrics(today, merchant_id),
+            )
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command(
+            "benchmark_daily_analytics",
+            rows=50,
+            merchants=2,
+            clients=3,
+            repeat=1,
+            stdout=out,
+        )
+        self.assertIn("rollups", out.getvalue())
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_weekly_active_users(self):
+        today = timezone.now().date()
+        sunday = today - timedelta(days=today.weekday() + 1)
+        DailySignupRollup.objects.create(
+            date=sunday, role=User.Role.CLIENT, user_count=5
+        )
+
+        with self.assertNumQueries(1):
+            response = self.get(WeeklyActiveUsersView)
+
+        self.assertEqual(len(response.data), 7)
+        self.assertEqual(response.data[0]["users"], 5)
+
+    def test_monthly_traffic_sales(self):
+        self.create_transaction("10.00")
+        self.create_transaction("2.50")
+
+        with self.assertNumQueries(1):
+            response = self.get(MonthlyTrafficSalesView)
+
+        month = response.data[timezone.now().month - 1]
+        self.assertEqual(month["traffic"], 2)
+        self.assertEqual(month["sales"], Decimal("12.50"))
+
+
+class MerchantAnalyticsTests(SalesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_merchant = create_user(User.Role.MERCHANT, 2)
+        self.create_transaction("10.00")
+        self.create_transaction("-2.00")
+        Transaction.objects.create(
+            client_id=self.client_user.pk,
+            merchant_id=self.other_merchant.pk,
+            amount=Decimal("99.00"),
+        )
+
+    def test_only_merchants_are_allowed(self):
+        for view_class in (
+            MerchantDailySalesView,
+            MerchantWeeklySalesView,
+            MerchantMonthlySalesView,
+        ):
+            self.assertEqual(self.get(view_class).status_code, 403)
+            self.assertEqual(
+                self.get(view_class, user=self.client_user).status_code, 403
+            )
+
+    def test_daily(self):
+        with self.assertNumQueries(1):
+            response = self.get(MerchantDailySalesView, user=self.merchant)
+        self.assertEqual(response.data["merchant"], self.merchant.pk)
+        self.assertEqual(response.data["total_transactions"], 2)
+        self.assertEqual(response.data["total_amount_made"], Decimal("8.00"))
+        self.assertNotIn("new_users", response.data)
+
+    def test_weekly(self):
+        today = timezone.now().date()
+        response = self.get(
+            MerchantWeeklySalesView, {"date": today.isoformat()}, user=self.merchant
+        )
+        self.assertEqual(len(response.data), 7)
+        row = next(
+            row for row in response.data if row["date"] == today.strftime("%d %b, %Y")
+        )
+        self.assertEqual((row["traffic"], row["sales"]), (2, Decimal("8.00")))
+        self.assertEqual(sum(row["traffic"] for row in response.data), 2)
+
+    def test_monthly(self):
+        response = self.get(MerchantMonthlySalesView, user=self.other_merchant)
+        month = response.data[timezone.now().month - 1]
+        self.assertEqual((month["traffic"], month["sales"]), (1, Decimal("99.00")))
+        self.assertEqual(
+            self.get(MonthlyTrafficSalesView).data[timezone.now().month - 1]["traffic"],
+            3,
+        )
+
+    @skipUnless(connection.vendor == "postgresql", "Needs PostgreSQL plans.")
+    def test_merchant_queries_use_composite_indexes(self):
+        # On tables this small a sort costs next to nothing, so without
+        # these the planner may pick either merchant index for either query.
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("SET LOCAL enable_sort = off")
+        transactions = Transaction.objects.filter(merchant=self.merchant)
+        plans = {
+            "txn_merchant_date_idx": transactions.order_by("-transaction_date"),
+            "txn_merchant_status_date_idx": transactions.filter(
+                status=Transaction.STATUS_COMPLETED
+            ).order_by("-transaction_date"),
+            "txn_client_date_idx": Transaction.objects.filter(
+                client=self.client_user
+            ).order_by("-transaction_date"),
+        }
+        for index, queryset in plans.items():
+            self.assertIn(index, queryset.explain())
+
+
+class AnalyticsCacheTests(SalesTestCase):
+    @override_settings(ANALYTICS_REPLICA_CACHE_TIMEOUT=60)
+    def test_entries_computed_on_the_replica_expire_quickly(self):
+        cache = AnalyticsCache.cache()
+        with mock.patch("sales.cache.read_alias", return_value="replica"):
+            with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+                AnalyticsCache.get_or_compute("replica-test", [], lambda: 1)
+
+        self.assertEqual(cache_set.call_args.args[2], 60)
+
+    def test_repeat_requests_are_cache_hits(self):
+        for view_class in (
+            DailyAnalyticsView,
+            WeeklyActiveUsersView,
+            MonthlyTrafficSalesView,
+        ):
+            first = self.get(view_class).data
+            with self.assertNumQueries(0):
+                self.assertEqual(self.get(view_class).data, first)
+
+    def test_transaction_writes_invalidate_sales_entries(self):
+        self.get(DailyAnalyticsView)
+        self.get(MonthlyTrafficSalesView)
+        self.get(WeeklyActiveUsersView)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_transaction("10.00")
+
+        self.assertEqual(self.get(DailyAnalyticsView).data["total_transactions"], 1)
+        month = self.get(MonthlyTrafficSalesView).data[timezone.now().month - 1]
+        self.assertEqual(month["traffic"], 1)
+        # Signup figures do not depend on transactions.
+        with self.assertNumQueries(0):
+            self.get(WeeklyActiveUsersView)
+
+    def test_signups_invalidate_user_entries(self):
+        self.get(DailyAnalyticsView)
+        self.get(MonthlyTrafficSalesView)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_user(User.Role.CLIENT, 2)
+
+        self.assertEqual(self.get(DailyAnalyticsView).data["new_clients"], 2)
+        with self.assertNumQueries(0):
+            self.get(MonthlyTrafficSalesView)
+
+    def test_unrelated_dates_keep_entries(self):
+        self.get(DailyAnalyticsView)
+        with self.captureOnCommitCallbacks(execute=True):
+            AnalyticsCache.invalidate_sales(timezone.now().date() - timedelta(days=3))
+        with self.assertNumQueries(0):
+            self.get(DailyAnalyticsView)
+
+    def test_bulk_ingest_and_rebuild_invalidate(self):
+        self.get(DailyAnalyticsView)
+        row = {
+            "client": str(self.client_user.pk),
+            "merchant": str(self.merchant.pk),
+            "amount": "1.00",
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            TransactionIngestService.ingest([row, row])
+        self.assertEqual(self.get(DailyAnalyticsView).data["total_transactions"], 2)
+
+        DailySalesRollup.objects.update(transaction_count=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("rebuild_sales_rollups", stdout=StringIO())
+        self.assertEqual(self.get(DailyAnalyticsView).data["total_transactions"], 2)
+
+
+class ListPaginationTests(SalesTestCase):
+    def list(self, view_class, params=None):
+        request = APIRequestFactory().get("/", params or {})
+        force_authenticate(request, user=self.admin)
+        return view_class.as_view()(request)
+
+    def follow(self, view_class, params):
+        seen = []
+        response = self.list(view_class, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            seen.extend(row["id"] for row in response.data["results"])
+            if not response.data["next"]:
+                return seen, response
+            cursor = parse_qs(urlparse(response.data["next"]).query)["cursor"][0]
+            response = self.list(view_class, {**params, "cursor": cursor})
+
+    def test_transactions_are_paged_without_gaps_on_timestamp_ties(self):
+        transactions = [self.create_transaction("1.00") for _ in range(7)]
+        tied = timezone.now()
+        Transaction.objects.filter(pk__in=[t.pk for t in transactions[:4]]).update(
+            transaction_date=tied
+        )
+
+        seen, last = self.follow(TransactionListCreateAPIView, {"page_size": 3})
+
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(set(seen), {str(t.pk) for t in transactions})
+        self.assertIsNotNone(last.data["previous"])
+
+    def test_previous_link_returns_earlier_page(self):
+        for _ in range(5):
+            self.create_transaction("1.00")
+        first = self.list(TransactionListCreateAPIView, {"page_size": 2})
+        cursor = parse_qs(urlparse(first.data["next"]).query)["cursor"][0]
+        second = self.list(
+            TransactionListCreateAPIView, {"page_size": 2, "cursor": cursor}
+        )
+        cursor = parse_qs(urlparse(second.data["previous"]).query)["cursor"][0]
+        back = self.list(
+            TransactionListCreateAPIView, {"page_size": 2, "cursor": cursor}
+        )
+
+        self.assertEqual(back.data["results"], first.data["results"])
+        self.assertIsNone(back.data["previous"])
+
+    def test_transaction_filters(self):
+        self.create_transaction("1.00", payment_method=PaymentMethods.MTN_MONEY)
+        self.create_transaction("2.00", status=Transaction.STATUS_FAILED)
+        old = self.create_transaction("3.00")
+        Transaction.objects.filter(pk=old.pk).update(
+            transaction_date=timezone.now() - timedelta(days=40)
+        )
+
+        response = self.list(
+            TransactionListCreateAPIView,
+            {"payment_method": PaymentMethods.MTN_MONEY},
+        )
+        self.assertEqual(len(response.data["results"]), 1)
+
+        response = self.list(
+            TransactionListCreateAPIView,
+            {"status": Transaction.STATUS_FAILED, "merchant": str(self.merchant.pk)},
+        )
+        self.assertEqual(len(response.data["results"]), 1)
+
+        since = (timezone.now() - timedelta(days=60)).date().isoformat()
+        response = self.list(TransactionListCreateAPIView, {"date_from": since})
+        self.assertEqual(len(response.data["results"]), 3)
+
+        response = self.list(TransactionListCreateAPIView, {"status": "UNKNOWN"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_invoices_are_paged_and_filtered(self):
+        for _ in range(3):
+            self.create_transaction("1.00", payment_method=PaymentMethods.ZAMTEL)
+        self.create_transaction("1.00")
+
+        seen, _ = self.follow(InvoiceListCreateAPIView, {"page_size": 2})
+        self.assertEqual(len(set(seen)), 4)
+
+        response = self.list(
+            InvoiceListCreateAPIView, {"payment_method": PaymentMethods.ZAMTEL}
+        )
+        self.assertEqual(len(response.data["results"]), 3)
+
+    def test_invalid_cursor(self):
+        response = self.list(TransactionListCreateAPIView, {"cursor": "bogus"})
+        self.assertEqual(response.status_code, 404)
+
+
+class ListSerializerTests(SalesTestCase):
+    def test_transaction_rows_match_model_serializer(self):
+        self.create_transaction("12.50", description="Coffee")
+        self.create_transaction("-3.00")
+
+        rows = TransactionListSerializer.get_queryset(
+            Transaction.objects.order_by("amount")
+        )
+        lean = json.loads(JSONRenderer().render(TransactionListSerializer(rows).data))
+        full = json.loads(
+            JSONRenderer().render(
+                TransactionSerializer(
+                    Transaction.objects.order_by("amount"), many=True
+                ).data
+            )
+        )
+
+        self.assertEqual(lean, full)
+
+    def test_lists_are_gzipped_for_clients_that_accept_it(self):
+        for _ in range(5):
+            self.create_transaction("1.00", description="Coffee")
+        request = APIRequestFactory().get("/", HTTP_ACCEPT_ENCODING="gzip")
+        force_authenticate(request, user=self.admin)
+
+        response = TransactionListCreateAPIView.as_view()(request).render()
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        rows = json.loads(gzip.decompress(response.content))["results"]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]["description"], "Coffee")
+
+    def test_invoice_rows_reference_parties_and_transactions(self):
+        transactions = [self.create_transaction("1.00") for _ in range(3)]
+        invoice = Invoice.objects.get(transactions=transactions[0])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(InvoiceListCreateAPIView)
+        row = next(
+            row for row in response.data["results"] if row["id"] == str(invoice.pk)
+        )
+
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(
+            row["client"],
+            {"id": str(self.client_user.pk), "email": self.client_user.email},
+        )
+        self.assertEqual(
+            row["merchant"],
+            {
+                "id": str(self.merchant.pk),
+                "email": self.merchant.email,
+                "company": None,
+            },
+        )
+        self.assertEqual(row["transactions"], [str(transactions[0].pk)])
+        self.assertEqual(row["total_amount"], "1.00")
+
+    def test_benchmark_leaves_no_rows_behind(self):
+        users = User.objects.count()
+        output = StringIO()
+
+        call_command(
+            "benchmark_list_serializers",
+            rows=20,
+            merchants=3,
+            clients=5,
+            repeat=1,
+            stdout=output,
+        )
+
+        for name in ("transactions", "invoices", "merchants", "clients"):
+            self.assertIn(name, output.getvalue())
+        self.assertEqual(User.objects.count(), users)
+        self.assertFalse(Transaction.objects.exists())
+
+
+class InvoiceExportTests(SalesTestCase):
+    def export(self, method="get", **data):
+        factory = APIRequestFactory()
+        if method == "post":
+            request = factory.post("/", data, format="json")
+        else:
+            request = factory.get("/", data)
+        force_authenticate(request, user=self.admin)
+        return ExportInvoicesToExcel.as_view()(request)
+
+    def test_csv_export_streams_rows_in_constant_queries(self):
+        for amount in range(1, 6):
+            self.create_transaction(f"{amount}.00")
+        other_merchant = create_user(User.Role.MERCHANT, 2)
+        Transaction.objects.create(
+            client_id=self.client_user.pk,
+            merchant_id=other_merchant.pk,
+            amount=Decimal("9.00"),
+        )
+
+        with self.assertNumQueries(2):
+            response = self.export(merchant=str(self.merchant.pk), file_format="csv")
+            lines = b"".join(response.streaming_content).decode().splitlines()
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(
+            lines[0], "Client,Merchant,Issue Date,Due Date,Total Amount,Status"
+        )
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(
+            lines[1].startswith(f"{self.client_user.email},{self.merchant.email},")
+        )
+
+    def test_xlsx_export_by_ids(self):
+        transactions = [self.create_transaction("1.00") for _ in range(3)]
+        invoice_ids = [
+            str(pk)
+            for pk in Invoice.objects.filter(
+                transactions__in=transactions[:2]
+            ).values_list("pk", flat=True)
+        ]
+
+        response = self.export("post", invoice_ids=invoice_ids)
+
+        self.assertEqual(response.status_code, 200)
+        workbook = openpyxl.load_workbook(BytesIO(b"".join(response.streaming_content)))
+        rows = list(workbook["Invoices"].values)
+        self.assertEqual(rows[0][0], "Client")
+        self.assertEqual(len(rows), 3)
+
+    def test_date_range_export(self):
+        self.create_transaction("1.00")
+        today = timezone.now().date()
+
+        response = self.export(
+            date_from=(today - timedelta(days=1)).isoformat(),
+            date_to=(today - timedelta(days=1)).isoformat(),
+            file_format="csv",
+        )
+        self.assertEqual(response.status_code, 404)
+
+        response = self.export(date_from=today.isoformat(), file_format="csv")
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 2)
+
+    def test_export_requires_a_selection(self):
+        self.create_transaction("1.00")
+        self.assertEqual(self.export("post").status_code, 400)
+        self.assertEqual(self.export("post", invoice_ids=[]).status_code, 400)
+
+
+class TransactionIngestTests(SalesTestCase):
+    def row(self, amount, **extra_fields):
+        return {
+            "client": str(self.client_user.pk),
+            "merchant": str(self.merchant.pk),
+            "amount": amount,
+            **extra_fields,
+        }
+
+    def post(self, body, content_type="application/json", user=None):
+        request = APIRequestFactory().post("/", body, content_type=content_type)
+        force_authenticate(request, user=user or self.admin)
+        return TransactionBulkCreateAPIView.as_view()(request)
+
+    def ledger(self, owner, account_type):
+        account = LedgerAccount.objects.get(owner=owner, account_type=account_type)
+        entries = list(
+            account.entries.order_by("sequence").values_list(
+                "sequence", "debit", "credit", "balance"
+            )
+        )
+        return account.balance, account.sequence, entries
+
+    def test_json_array(self):
+        rows = [
+            self.row("10.00", status=Transaction.STATUS_COMPLETED),
+            self.row("5.00", reference_number="SETTLE-1"),
+        ]
+        response = self.post(json.dumps(rows))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {"created": 2})
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertTrue(
+            Transaction.objects.filter(reference_number="SETTLE-1").exists()
+        )
+        for transaction in Transaction.objects.all():
+            invoice = transaction.invoices.get()
+            self.assertEqual(invoice.total_amount, transaction.amount)
+            self.assertEqual(invoice.merchant_id, self.merchant.pk)
+        self.assertEqual(
+            DailySalesRollup.objects.get(
+                status=Transaction.STATUS_PENDING
+            ).total_amount,
+            Decimal("5.00"),
+        )
+
+    def test_ndjson(self):
+        body = "\n".join(json.dumps(self.row(f"{amount}.00")) for amount in range(1, 4))
+        response = self.post(body + "\n", content_type="application/x-ndjson")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {"created": 3})
+
+    def test_ledger_matches_row_by_row_posting(self):
+        statuses = [
+            Transaction.STATUS_COMPLETED,
+            Transaction.STATUS_PENDING,
+            Transaction.STATUS_FAILED,
+            Transaction.STATUS_COMPLETED,
+        ]
+        for status in statuses:
+            self.create_transaction("7.50", status=status)
+        expected = [
+            self.ledger(self.merchant, LedgerAccount.AccountType.MERCHANT),
+            self.ledger(self.client_user, LedgerAccount.AccountType.CLIENT),
+        ]
+        LedgerEntry.objects.all().delete()
+        LedgerAccount.objects.all().delete()
+        Transaction.objects.all().delete()
+
+        TransactionIngestService.ingest(
+            [self.row("7.50", status=status) for status in statuses]
+        )
+
+        self.assertEqual(
+            [
+                self.ledger(self.merchant, LedgerAccount.AccountType.MERCHANT),
+                self.ledger(self.client_user, LedgerAccount.AccountType.CLIENT),
+            ],
+            expected,
+        )
+
+    def test_queries_are_per_chunk_not_per_row(self):
+        def ingest(count):
+            TransactionIngestService.ingest(
+                [
+                    self.row("1.00", status=Transaction.STATUS_COMPLETED)
+                    for _ in range(count)
+                ]
+            )
+
+        ingest(1)  # Warm the rollup row.
+        # Two existence checks, then per chunk: transactions, invoices,
+        # invoice links, account upsert, ledger entries and rollup bump.
+        with self.assertNumQueries(10):
+            ingest(1)
+        with self.assertNumQueries(10):
+            ingest(40)
+
+    def test_rows_keep_their_transaction_date(self):
+        settled = timezone.now() - timedelta(days=3)
+        TransactionIngestService.ingest(
+            [
+                self.row("4.00", transaction_date=settled.isoformat()),
+                self.row("6.00"),
+            ]
+        )
+
+        dated = Transaction.objects.get(amount=Decimal("4.00"))
+        self.assertEqual(dated.transaction_date, settled)
+        self.assertGreater(
+            Transaction.objects.get(amount=Decimal("6.00")).transaction_date,
+            settled + timedelta(days=2),
+        )
+        self.assertEqual(
+            DailySalesRollup.objects.get(
+                date=timezone.localtime(settled).date()
+            ).total_amount,
+            Decimal("4.00"),
+        )
+
+    def test_malformed_rows_are_reported(self):
+        response = self.post(
+            json.dumps([self.row("1.00", transaction_date="yesterday"), "oops"])
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(sorted(response.data[0]), ["transaction_date"])
+        self.assertEqual(sorted(response.data[1]), ["non_field_errors"])
+
+    def test_invalid_rows_create_nothing(self):
+        self.create_transaction("1.00", reference_number="TAKEN")
+        rows = [
+            self.row("1.00"),
+            self.row("abc"),
+            self.row("1.00", merchant=str(self.client_user.pk)),
+            self.row("1.00", reference_number="TAKEN"),
+            self.row("1.00", reference_number="DUP"),
+            self.row("1.00", reference_number="DUP"),
+        ]
+        response = self.post(json.dumps(rows))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            {index: sorted(errors) for index, errors in response.data.items()},
+            {
+                1: ["amount"],
+                2: ["merchant"],
+                3: ["reference_number"],
+                5: ["reference_number"],
+            },
+        )
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_requires_admin(self):
+        response = self.post(json.dumps([self.row("1.00")]), user=self.merchant)
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(INVOICING_PERIOD="daily")
+class PeriodInvoicingTests(SalesTestCase):
+    def test_transactions_share_the_period_invoice(self):
+        other_client = create_user(User.Role.CLIENT, 2)
+        transactions = [self.create_transaction(amount) for amount in ("1.50", "2.50")]
+        Transaction.objects.create(
+            client_id=other_client.pk, merchant_id=self.merchant.pk, amount=5
+        )
+
+        invoice = Invoice.objects.get(client=self.client_user)
+        self.assertEqual(invoice.total_amount, Decimal("4.00"))
+        self.assertCountEqual(invoice.transactions.all(), transactions)
+        start, end = InvoicingService.period_bounds(timezone.now(), "daily")
+        self.assertEqual((invoice.period_start, invoice.period_end), (start, end))
+        self.assertEqual(invoice.due_date, end + timedelta(days=30))
+        self.assertEqual(Invoice.objects.count(), 2)
+
+    def test_create_query_count(self):
+        self.create_transaction("1.00")
+        # Insert, invoice lookup, invoice update, invoice link, rollup bump.
+        with self.assertNumQueries(5):
+            self.create_transaction("1.00")
+
+    def test_amount_changes_and_deletes_move_the_total(self):
+        transaction = self.create_transaction("10.00")
+        self.create_transaction("1.00")
+        transaction = Transaction.objects.get(pk=transaction.pk)
+        transaction.amount = Decimal("4.00")
+        transaction.save()
+        invoice = Invoice.objects.get()
+        self.assertEqual(invoice.total_amount, Decimal("5.00"))
+
+        transaction.delete()
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.total_amount, Decimal("1.00"))
+
+    @override_settings(INVOICING_PERIOD="monthly")
+    def test_bulk_ingest_groups_by_pair(self):
+        row = {
+            "client": str(self.client_user.pk),
+            "merchant": str(self.merchant.pk),
+            "amount": "2.00",
+        }
+        self.create_transaction("1.00")
+        TransactionIngestService.ingest([row] * 3)
+
+        invoice = Invoice.objects.get()
+        self.assertEqual(invoice.total_amount, Decimal("7.00"))
+        self.assertEqual(invoice.transactions.count(), 4)
+        self.assertEqual(invoice.period_start.day, 1)
+
+    def test_period_bounds(self):
+        moment = timezone.make_aware(timezone.datetime(2024, 2, 29, 15, 30))
+        start, end = InvoicingService.period_bounds(moment, "monthly")
+        self.assertEqual(timezone.localtime(start).date().isoformat(), "2024-02-01")
+        self.assertEqual(timezone.localtime(end).date().isoformat(), "2024-03-01")
+        start, end = InvoicingService.period_bounds(moment, "daily")
+        self.assertEqual(end - start, timedelta(days=1))
+
+    def test_close_invoices(self):
+        self.create_transaction("1.00")
+        invoice = Invoice.objects.get()
+
+        self.assertEqual(InvoicingService.close_invoices(invoice.period_start), (0, 0))
+        self.assertEqual(InvoicingService.close_invoices(invoice.period_end), (1, 0))
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.closed_at, invoice.period_end)
+
+        # The next transaction in the same period opens a fresh invoice.
+        self.create_transaction("2.00")
+        self.assertEqual(Invoice.objects.filter(closed_at__isnull=True).count(), 1)
+
+        Invoice.objects.exclude(pk=invoice.pk).update(status=Invoice.STATUS_PAID)
+        out = StringIO()
+        call_command("close_invoices", stdout=out)
+        self.assertIn("Closed 0 invoice(s), marked 0 overdue.", out.getvalue())
+        self.assertEqual(
+            InvoicingService.close_invoices(invoice.due_date + timedelta(seconds=1)),
+            (1, 1),
+        )
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.status, Invoice.STATUS_OVERDUE)
+        self.assertEqual(
+            Invoice.objects.exclude(pk=invoice.pk).get().status, Invoice.STATUS_PAID
+        )
+
+
+class SeedLoadTestTests(TestCase):
+    def seed(self, **options):
+        call_command(
+            "seed_load_test",
+            clients=6,
+            merchants=3,
+            companies=2,
+            transactions=50,
+            days=30,
+            chunk_size=20,
+            seed=1,
+            stdout=StringIO(),
+            **options,
+        )
+
+    def test_seeds_a_consistent_dataset(self):
+        started = timezone.now()
+        self.seed()
+
+        merchants = User.objects.filter(role=User.Role.MERCHANT)
+        self.assertEqual(merchants.count(), 3)
+        self.assertEqual(merchants.values("company").distinct().count(), 2)
+        client = User.objects.filter(role=User.Role.CLIENT).first()
+        self.assertTrue(client.check_password("loadtest-password"))
+        self.assertEqual(Transaction.objects.count(), 50)
+        self.assertFalse(
+            Transaction.objects.filter(
+                transaction_date__lt=started - timedelta(days=30)
+            ).exists()
+        )
+        self.assertEqual(Invoice.objects.count(), 50)
+        self.assertFalse(Invoice.objects.filter(transactions=None).exists())
+        self.assertFalse(
+            Invoice.objects.exclude(
+                issue_date=F("transactions__transaction_date")
+            ).exists()
+        )
+        self.assertEqual(
+            DailySalesRollup.objects.aggregate(Sum("transaction_count"))[
+                "transaction_count__sum"
+            ],
+            50,
+        )
+        for account in LedgerAccount.objects.all():
+            net = account.entries.aggregate(net=Sum(F("debit") - F("credit")))["net"]
+            self.assertEqual(net, account.balance)
+            self.assertEqual(account.entries.count(), account.sequence)
+
+    def test_weights(self):
+        self.seed(status_weights="COMPLETED=1", payment_method_weights="AIRTEL_MONEY=1")
+
+        self.assertEqual(
+            set(Transaction.objects.values_list("status", "payment_method")),
+            {(Transaction.STATUS_COMPLETED, PaymentMethods.AIRTEL)},
+        )
+        self.assertEqual(
+            set(Invoice.objects.values_list("status", flat=True)),
+            {Invoice.STATUS_PAID},
+        )
+
+    def test_invalid_weights(self):
+        for weights in ("SETTLED=1", "COMPLETED=lots", "COMPLETED=0"):
+            with self.subTest(weights=weights), self.assertRaises(CommandError):
+                self.seed(status_weights=weights)
+
+    def test_without_invoices_or_ledger(self):
+        self.seed(no_invoices=True, no_ledger=True)
+
+        self.assertEqual(Transaction.objects.count(), 50)
+        self.assertFalse(Invoice.objects.exists())
+        self.assertFalse(LedgerEntry.objects.exists())
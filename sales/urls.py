@@ -2,7 +2,11 @@ from django.urls import path
 from .views import (
     DailyAnalyticsView,
     ExportInvoicesToExcel,
+    MerchantDailySalesView,
+    MerchantMonthlySalesView,
+    MerchantWeeklySalesView,
     MonthlyTrafficSalesView,
+    TransactionBulkCreateAPIView,
     TransactionListCreateAPIView,
     TransactionDetailAPIView,
     InvoiceListCreateAPIView,
@@ -16,6 +20,11 @@ urlpatterns = [
         TransactionListCreateAPIView.as_view(),
         name="transaction-list-create",
     ),
+    path(
+        "transactions/bulk/",
+        TransactionBulkCreateAPIView.as_view(),
+        name="transaction-bulk-create",
+    ),
     path(
         "transactions/<uuid:pk>/",
         TransactionDetailAPIView.as_view(),
@@ -24,6 +33,21 @@ urlpatterns = [
     path("invoices/", InvoiceListCreateAPIView.as_view(), name="invoice-list-create"),
     path("invoices/<uuid:pk>/", InvoiceDetailAPIView.as_view(), name="invoice-detail"),
     path("analytics/daily/", DailyAnalyticsView.as_view(), name="daily-analytics"),
+    path(
+        "merchant/analytics/daily/",
+        MerchantDailySalesView.as_view(),
+        name="merchant-daily-sales",
+    ),
+    path(
+        "merchant/analytics/weekly/",
+        MerchantWeeklySalesView.as_view(),
+        name="merchant-weekly-sales",
+    ),
+    path(
+        "merchant/analytics/monthly/",
+        MerchantMonthlySalesView.as_view(),
+        name="merchant-monthly-sales",
+    ),
     path(
         "weekly-active-users/",
         WeeklyActiveUsersView.as_view(),
@@ -1,29 +1,60 @@
 import calendar
-import openpyxl
-from django.http import HttpResponse, JsonResponse
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.gzip import gzip_page
 from rest_framework import status
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.db.models import Sum, F, Case, When, DecimalField
+from scanpay.routers import read_alias, replica_reads
+from django.db.models import Sum
 from rest_framework.permissions import IsAuthenticated
-from users.models import Client, User
-from .models import Transaction, Invoice
-from .serializers import TransactionSerializer, InvoiceSerializer
+from users.models import User
+from utils.permissions import IsAdminUser, IsMerchant
+from . import analytics
+from .cache import AnalyticsCache
+from .exports import InvoiceExporter, InvoiceExportFilterSerializer
+from .filters import (
+    AnalyticsDateSerializer,
+    AnalyticsFilterSerializer,
+    InvoiceFilterSerializer,
+    TransactionFilterSerializer,
+)
+from .models import DailySignupRollup, Transaction, Invoice
+from .pagination import InvoicePagination, TransactionPagination
+from .parsers import NDJSONParser
+from .serializers import (
+    InvoiceListSerializer,
+    InvoiceSerializer,
+    TransactionListSerializer,
+    TransactionSerializer,
+)
+from .services import TransactionIngestService
 from datetime import timedelta
 from django.utils import timezone
 
 
 class TransactionListCreateAPIView(APIView):
+    @method_decorator(gzip_page)
+    @replica_reads()
     def get(self, request):
-        today = timezone.now().date()
-        start_of_week = today - timedelta(days=today.weekday())
-        end_of_week = start_of_week + timedelta(days=6)
-
-        transactions = Transaction.objects.filter(
-            transaction_date__date__range=[start_of_week, end_of_week]
-        ).order_by("-transaction_date")
-        serializer = TransactionSerializer(transactions, many=True)
-        return Response(serializer.data)
+        filters = TransactionFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        if not {"date_from", "date_to"} & filters.validated_data.keys():
+            # Default to the current week, as before pagination was added.
+            today = timezone.now().date()
+            start_of_week = today - timedelta(days=today.weekday())
+            filters.validated_data["date_from"] = start_of_week
+            filters.validated_data["date_to"] = start_of_week + timedelta(days=6)
+
+        transactions = TransactionListSerializer.get_queryset(
+            filters.filter_queryset(Transaction.objects.all())
+        )
+        paginator = TransactionPagination()
+        page = paginator.paginate_queryset(transactions, request, view=self)
+        serializer = TransactionListSerializer(page)
+        return paginator.get_paginated_response(serializer.data)
 
     def post(self, request):
         serializer = TransactionSerializer(data=request.data)
@@ -33,6 +64,22 @@ class TransactionListCreateAPIView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class TransactionBulkCreateAPIView(APIView):
+    """
+    Import many transactions at once, posted as a JSON array or as NDJSON
+    (``application/x-ndjson``, one transaction per line). Rows may give
+    their ``transaction_date``; the others are dated at import. Nothing is
+    created unless every row is valid.
+    """
+
+    permission_classes = [IsAdminUser]
+    parser_classes = [JSONParser, NDJSONParser]
+
+    def post(self, request):
+        transactions = TransactionIngestService.ingest(request.data)
+        return Response({"created": len(transactions)}, status=status.HTTP_201_CREATED)
+
+
 class TransactionDetailAPIView(APIView):
     def get_object(self, pk):
         try:
@@ -66,12 +113,19 @@ class TransactionDetailAPIView(APIView):
 
 
 class InvoiceListCreateAPIView(APIView):
+    @method_decorator(gzip_page)
+    @replica_reads()
     def get(self, request):
-        invoices = Invoice.objects.select_related(
-            "merchant", "client"
-        ).prefetch_related("transactions")
-        serializer = InvoiceSerializer(invoices, many=True)
-        return Response(serializer.data)
+        filters = InvoiceFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+
+        invoices = InvoiceListSerializer.get_queryset(
+            filters.filter_queryset(Invoice.objects.all())
+        )
+        paginator = InvoicePagination()
+        page = paginator.paginate_queryset(invoices, request, view=self)
+        serializer = InvoiceListSerializer(page)
+        return paginator.get_paginated_response(serializer.data)
 
     def post(self, request):
         serializer = InvoiceSerializer(data=request.data)
@@ -114,128 +168,54 @@ class InvoiceDetailAPIView(APIView):
 
 
 class DailyAnalyticsView(APIView):
+    """
+    Dashboard figures for ``?date=`` (default today) compared with the day
+    before. Admins can narrow the sales figures to one merchant with
+    ``?merchant=``; merchants always get their own.
+    """
+
     permission_classes = [IsAuthenticated]
 
+    @replica_reads()
     def get(self, request):
-        today = timezone.now().date()
-        yesterday = today - timedelta(days=1)
-
-        daily_transactions = Transaction.objects.filter(transaction_date__date=today)
-        total_transactions = daily_transactions.count()
-
-        new_users = User.objects.filter(date_joined__date=today).count()
-        new_clients = Client.objects.filter(date_joined__date=today).count()
-
-        all_users = User.objects.count()
-        all_clients = Client.objects.count()
-
-        users_percentage = (
-            round((new_users / all_users) * 100, 2) if all_users > 0 else 0
-        )
-        clients_percentage = (
-            round((new_clients / all_clients) * 100, 2) if all_clients > 0 else 0
-        )
-
-        total_amount_made = round(
-            daily_transactions.aggregate(
-                total=Sum("amount", output_field=DecimalField())
-            )["total"]
-            or 0,
-            2,
-        )
-
-        total_profit = daily_transactions.aggregate(
-            profit=Sum(
-                Case(
-                    When(amount__gt=0, then=F("amount")),
-                    default=0,
-                    output_field=DecimalField(),
-                )
-            ),
-            loss=Sum(
-                Case(
-                    When(amount__lt=0, then=F("amount")),
-                    default=0,
-                    output_field=DecimalField(),
-                )
-            ),
-        )
-
-        profit = round(total_profit["profit"] or 0, 2)
-        loss = round(total_profit["loss"] or 0, 2)
-
-        profit_loss = round(profit - abs(loss), 2)
-
-        # Calculate yesterday's transactions
-        yesterday_transactions = Transaction.objects.filter(
-            transaction_date__date=yesterday
-        )
-        total_transactions_yesterday = yesterday_transactions.count()
-
-        # Calculate the percentage change in total transactions
-        if total_transactions_yesterday == 0:
-            transactions_percentage = round(100 if total_transactions > 0 else 0, 2)
-        else:
-            transactions_percentage = round(
-                (
-                    (total_transactions - total_transactions_yesterday)
-                    / total_transactions_yesterday
-                )
-                * 100,
-                2,
-            )
-
-        # Calculate the total amount made yesterday
-        total_amount_made_yesterday = round(
-            yesterday_transactions.aggregate(
-                total=Sum("amount", output_field=DecimalField())
-            )["total"]
-            or 0,
-            2,
+        filters = AnalyticsFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        day = filters.validated_data.get("date") or timezone.now().date()
+        merchant_id = filters.validated_data.get("merchant")
+        if request.user.role == User.Role.MERCHANT:
+            if merchant_id not in (None, request.user.pk):
+                raise PermissionDenied("Merchants can only see their own figures.")
+            merchant_id = request.user.pk
+        elif merchant_id is not None and request.user.role != User.Role.ADMIN:
+            raise PermissionDenied("Only admins can see a merchant's figures.")
+
+        data = AnalyticsCache.daily(
+            day, merchant_id, lambda: analytics.daily_summary(day, merchant_id)
         )
-
-        # Calculate the percentage change in total amount made
-        if total_amount_made_yesterday == 0:
-            amount_percentage_change = round(100 if total_amount_made > 0 else 0, 2)
-        else:
-            amount_percentage_change = round(
-                (
-                    (total_amount_made - total_amount_made_yesterday)
-                    / total_amount_made_yesterday
-                )
-                * 100,
-                2,
-            )
-
-        data = {
-            "date": today,
-            "total_transactions": total_transactions,
-            "total_transactions_percentage": transactions_percentage,
-            "new_users": new_users,
-            "total_amount_made": total_amount_made,
-            "total_amount_made_percentage": amount_percentage_change,
-            "profit_loss": profit_loss,
-            "new_clients": new_clients,
-            "users_percentage": users_percentage,
-            "clients_percentage": clients_percentage,
-        }
-
         return Response(data)
 
 
 class WeeklyActiveUsersView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @replica_reads()
     def get(self, request):
         today = timezone.now().date()
         start_of_week = today - timedelta(days=today.weekday())
         start_of_week -= timedelta(days=1)
 
         dates = [start_of_week + timedelta(days=i) for i in range(7)]
-
-        active_users_counts = [
-            User.objects.filter(date_joined__date=date).count() for date in dates
-        ]
+        return Response(AnalyticsCache.weekly(dates, lambda: self.compute(dates)))
+
+    def compute(self, dates):
+        signups = dict(
+            DailySignupRollup.objects.filter(date__range=[dates[0], dates[-1]])
+            .values("date")
+            .annotate(users=Sum("user_count"))
+            .values_list("date", "users")
+            .order_by()
+        )
+        active_users_counts = [signups.get(date, 0) for date in dates]
 
         days_of_week = list(calendar.day_abbr)
         data = [
@@ -243,87 +223,86 @@ class WeeklyActiveUsersView(APIView):
             for day, date, count in zip(days_of_week, dates, active_users_counts)
         ]
 
-        return Response(data)
+        return data
 
 
 class MonthlyTrafficSalesView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @replica_reads()
     def get(self, request):
-        today = timezone.now().date()
-        year_start = today.replace(month=1, day=1)
-        months = [calendar.month_abbr[i] for i in range(1, 13)]
+        year = timezone.now().year
+        return Response(
+            AnalyticsCache.monthly(year, None, lambda: analytics.monthly_sales(year))
+        )
 
-        monthly_data = []
 
-        for month in range(1, 13):
-            start_date = year_start.replace(month=month)
-            end_date = (start_date.replace(day=1) + timedelta(days=32)).replace(day=1)
+class MerchantAnalyticsView(APIView):
+    """Base for the signed-in merchant's own analytics; ``?date=`` picks the day."""
 
-            transactions = Transaction.objects.filter(
-                transaction_date__date__gte=start_date,
-                transaction_date__date__lt=end_date,
-            )
+    permission_classes = [IsMerchant]
 
-            sales = (
-                transactions.aggregate(total_sales=Sum("amount"))["total_sales"] or 0
-            )
-            traffic = transactions.count()
+    @replica_reads()
+    def get(self, request):
+        filters = AnalyticsDateSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        day = filters.validated_data.get("date") or timezone.now().date()
+        return Response(self.figures(day, request.user.pk))
+
+
+class MerchantDailySalesView(MerchantAnalyticsView):
+    def figures(self, day, merchant_id):
+        return AnalyticsCache.sales(
+            f"merchant-daily:{day.isoformat()}:{merchant_id}",
+            [day, day - timedelta(days=1)],
+            lambda: analytics.sales_summary(day, merchant_id),
+        )
+
+
+class MerchantWeeklySalesView(MerchantAnalyticsView):
+    def figures(self, day, merchant_id):
+        dates = analytics.week_dates(day)
+        return AnalyticsCache.sales(
+            f"merchant-weekly:{dates[0].isoformat()}:{merchant_id}",
+            dates,
+            lambda: analytics.daily_sales(dates, merchant_id),
+        )
 
-            monthly_data.append(
-                {
-                    "month": months[month - 1],
-                    "traffic": traffic,
-                    "sales": sales,
-                }
-            )
 
-        return Response(monthly_data)
+class MerchantMonthlySalesView(MerchantAnalyticsView):
+    def figures(self, day, merchant_id):
+        return AnalyticsCache.monthly(
+            day.year,
+            merchant_id,
+            lambda: analytics.monthly_sales(day.year, merchant_id),
+        )
 
 
 class ExportInvoicesToExcel(APIView):
+    """
+    Export invoices selected by ``invoice_ids`` and/or the invoice list
+    filters as a streamed download; ``file_format`` is ``xlsx`` (default)
+    or ``csv``.
+    """
+
     permission_classes = [IsAuthenticated]
 
+    @replica_reads()
+    def get(self, request, *args, **kwargs):
+        return self.export(request.query_params)
+
+    @replica_reads()
     def post(self, request, *args, **kwargs):
-        invoice_ids = request.data.get('invoice_ids', [])
-        if not invoice_ids:
-            return JsonResponse({'error': 'No invoice IDs provided.'}, status=400)
+        return self.export(request.data)
+
+    def export(self, data):
+        filters = InvoiceExportFilterSerializer(data=data)
+        if not filters.is_valid():
+            return JsonResponse({"error": filters.errors}, status=400)
 
-        invoices = Invoice.objects.filter(id__in=invoice_ids)
+        # Rows stream after the view returns, so bind the database now.
+        invoices = filters.filter_queryset(Invoice.objects.using(read_alias()))
         if not invoices.exists():
             return JsonResponse({'error': 'No matching invoices found.'}, status=404)
 
-        workbook = openpyxl.Workbook()
-        sheet = workbook.active
-        sheet.title = "Invoices"
-
-        headers = [
-            "Client",
-            "Merchant",
-            "Issue Date",
-            "Due Date",
-            "Total Amount",
-            "Status",
-        ]
-        sheet.append(headers)
-
-        for invoice in invoices:
-            sheet.append(
-                [
-                    str(invoice.client),
-                    str(invoice.merchant),
-                    invoice.issue_date.strftime("%Y-%m-%d %H:%M:%S"),
-                    invoice.due_date.strftime("%Y-%m-%d %H:%M:%S"),
-                    str(invoice.total_amount),
-                    invoice.get_status_display(),
-                ]
-            )
-
-        response = HttpResponse(
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-        response["Content-Disposition"] = "attachment; filename=invoices.xlsx"
-
-        workbook.save(response)
-
-        return response
+        return InvoiceExporter(invoices).response(filters.validated_data["file_format"])
@@ -0,0 +1,47 @@
+"""
+How connections to the default database are kept, chosen by
+``DB_CONNECTION_MODE``:
+
+``persistent``
+    Each worker thread keeps its connection for ``DB_CONN_MAX_AGE`` seconds
+    (600 by default) and checks it is still alive before a request reuses
+    it, instead of opening a new TLS connection per request.
+``serverless``
+    The default on Vercel. A warm function keeps its connection for a short
+    ``DB_CONN_MAX_AGE`` (60 by default) and health-checks it first, since a
+    frozen function's socket may have been dropped while it was idle.
+
+``DB_CONN_MAX_AGE=0`` restores a connection per request. Behind a
+transaction-mode pooler such as Neon's ``-pooler`` endpoints, server-side
+cursors cannot outlive a transaction, so they are disabled for those hosts
+unless ``DB_DISABLE_SERVER_SIDE_CURSORS`` says otherwise.
+"""
+
+from django.core.exceptions import ImproperlyConfigured
+
+PERSISTENT = "persistent"
+SERVERLESS = "serverless"
+
+DEFAULT_CONN_MAX_AGE = {PERSISTENT: 600, SERVERLESS: 60}
+
+
+def configure_connections(
+    database,
+    mode=PERSISTENT,
+    conn_max_age=None,
+    health_checks=True,
+    disable_server_side_cursors=None,
+):
+    """Return a copy of the ``database`` settings managed as ``mode`` says."""
+    database = {**database, "OPTIONS": {**database.get("OPTIONS", {})}}
+    if disable_server_side_cursors is None:
+        disable_server_side_cursors = "-pooler" in (database.get("HOST") or "")
+    database["DISABLE_SERVER_SIDE_CURSORS"] = disable_server_side_cursors
+
+    if mode not in DEFAULT_CONN_MAX_AGE:
+        raise ImproperlyConfigured(f"Unknown DB_CONNECTION_MODE {mode!r}.")
+    database["CONN_MAX_AGE"] = (
+        DEFAULT_CONN_MAX_AGE[mode] if conn_max_age is None else conn_max_age
+    )
+    database["CONN_HEALTH_CHECKS"] = health_checks
+    return database
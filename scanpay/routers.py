@@ -0,0 +1,69 @@
+"""
+Read-replica routing.
+
+Setting ``POSTGRES_REPLICA_URL`` adds a ``replica`` database. Reads go to
+it only inside ``replica_reads()``, which wraps the dashboard analytics,
+listings and exports, and only until the request writes: the first write
+pins the rest of the request to the primary so it reads its own writes.
+Everything else reads and writes the primary, and without a replica every
+query goes to the primary as before.
+
+Two SQLite files are enough to try it locally: copy ``db.sqlite3`` to
+``replica.sqlite3`` and run with ``POSTGRES_URL=`` and
+``POSTGRES_REPLICA_URL=sqlite:///replica.sqlite3``.
+"""
+
+import contextvars
+from contextlib import contextmanager
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = "replica"
+
+_replica_reads = contextvars.ContextVar("replica_reads", default=False)
+_pinned = contextvars.ContextVar("pinned_to_primary", default=False)
+
+
+def read_alias():
+    """The database reads go to at this point of the request."""
+    if _replica_reads.get() and not _pinned.get() and REPLICA in connections.settings:
+        return REPLICA
+    return DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def replica_reads():
+    """Send reads to the replica; usable as ``@replica_reads()`` on a view method."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = read_alias()
+        return alias if alias == REPLICA else None
+
+    def db_for_write(self, model, **hints):
+        _pinned.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPLICA}:
+            return True
+        return None
+
+
+class PrimaryPinMiddleware:
+    """Start every request unpinned; worker threads outlive requests."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _pinned.set(False)
+        try:
+            return self.get_response(request)
+        finally:
+            _pinned.reset(token)
@@ -2,6 +2,7 @@ import os
 from pathlib import Path
 import environ
 import dj_database_url
+from scanpay.database import PERSISTENT, SERVERLESS, configure_connections
 from corsheaders.defaults import default_headers
 
 env = environ.Env()
@@ -34,10 +35,14 @@ INSTALLED_APPS = [
     "sales",
     "ledger",
     "app_api",
+    "jobs",
 ]
 
 MIDDLEWARE = [
+    "utils.metrics.MetricsMiddleware",
+    "utils.profiling.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "scanpay.routers.PrimaryPinMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "oauth2_provider.middleware.OAuth2TokenMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -86,9 +91,73 @@ postgres_url = os.environ.get(
 )
 
 if postgres_url:
-    DATABASES = {"default": dj_database_url.parse(postgres_url)}
-else:
-    DATABASES = {"default": default_database}
+    default_database = dj_database_url.parse(postgres_url)
+
+# See scanpay/database.py for the connection modes.
+connection_options = {
+    "mode": env(
+        "DB_CONNECTION_MODE",
+        default=SERVERLESS if env.bool("VERCEL", default=False) else PERSISTENT,
+    ),
+    "conn_max_age": env.int("DB_CONN_MAX_AGE", default=None),
+    "health_checks": env.bool("DB_CONN_HEALTH_CHECKS", default=True),
+    "disable_server_side_cursors": env.bool(
+        "DB_DISABLE_SERVER_SIDE_CURSORS", default=None
+    ),
+}
+DATABASES = {"default": configure_connections(default_database, **connection_options)}
+
+# Analytics, listings and exports read from a replica when one is set; see
+# scanpay/routers.py.
+replica_url = env("POSTGRES_REPLICA_URL", default="")
+if replica_url:
+    DATABASES["replica"] = {
+        **configure_connections(
+            dj_database_url.parse(replica_url), **connection_options
+        ),
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["scanpay.routers.ReplicaRouter"]
+
+# Local memory by default; point CACHE_URL at a file or Redis cache (e.g.
+# filecache:///var/tmp/scanpay or rediscache://host:6379/1) so every worker
+# process shares MoMo credentials, tokens and idempotency keys.
+CACHES = {
+    "default": env.cache_url("CACHE_URL", default="locmemcache://"),
+    # Dashboard analytics responses; entries are invalidated on write, so
+    # deployments with several processes need a shared file or Redis cache.
+    "analytics": env.cache_url(
+        "ANALYTICS_CACHE_URL", default="locmemcache://analytics"
+    ),
+    # Validated OAuth2 access tokens. Revocations only reach other processes
+    # through a shared cache; a per-process one honours them within
+    # ACCESS_TOKEN_EXPIRE_SECONDS.
+    "tokens": env.cache_url("TOKEN_CACHE_URL", default="locmemcache://tokens"),
+}
+
+# Seconds an analytics entry is kept; invalidation does not rely on it, it
+# only lets entries for past dates age out.
+ANALYTICS_CACHE_TIMEOUT = env.int("ANALYTICS_CACHE_TIMEOUT", default=7 * 24 * 60 * 60)
+# Entries computed from the replica may predate the write that invalidated
+# them if it lagged, so they are kept for at most this many seconds.
+ANALYTICS_REPLICA_CACHE_TIMEOUT = env.int("ANALYTICS_REPLICA_CACHE_TIMEOUT", default=60)
+
+# Seconds a response to an Idempotency-Key request is kept for replay.
+IDEMPOTENCY_KEY_TTL = env.int("IDEMPOTENCY_KEY_TTL", default=24 * 60 * 60)
+
+# Opt-in request profiling (utils/profiling.py). Requests slower than
+# PROFILING_SLOW_REQUEST_MS are sampled every PROFILING_SAMPLE_INTERVAL
+# seconds and kept; leave it unset to only profile requests sent with a
+# signed X-Scanpay-Profile header. PROFILING_DIR (a temporary directory by
+# default) keeps the newest PROFILING_MAX_PROFILES.
+PROFILING_ENABLED = env.bool("PROFILING_ENABLED", default=False)
+PROFILING_SLOW_REQUEST_MS = env.int("PROFILING_SLOW_REQUEST_MS", default=None)
+PROFILING_SAMPLE_INTERVAL = env.float("PROFILING_SAMPLE_INTERVAL", default=0.005)
+PROFILING_DIR = env("PROFILING_DIR", default="")
+PROFILING_MAX_PROFILES = env.int("PROFILING_MAX_PROFILES", default=100)
+# Seconds a token from POST /profiles/token/ is accepted.
+PROFILING_TOKEN_MAX_AGE = env.int("PROFILING_TOKEN_MAX_AGE", default=60 * 60)
 
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -123,6 +192,17 @@ STATIC_URL = "static/"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Image format ("png" or "svg") for generated merchant QR codes.
+QR_CODE_FORMAT = env("QR_CODE_FORMAT", default="png")
+
+# How transactions are invoiced: "transaction" issues one invoice per
+# transaction, "daily" or "monthly" collect each merchant/client pair's
+# transactions on one invoice per billing period.
+INVOICING_PERIOD = env("INVOICING_PERIOD", default="transaction")
+
+# Days after issue (or after the billing period ends) an invoice falls due.
+INVOICE_DUE_DAYS = env.int("INVOICE_DUE_DAYS", default=30)
+
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 AUTH_USER_MODEL = "users.User"
@@ -135,6 +215,7 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_HEADERS = list(default_headers) + [
     "x-client-identifier",
+    "x-scanpay-profile",
 ]
 
 
@@ -156,6 +237,7 @@ OAUTH2_PROVIDER = {
     "AUTHORIZATION_CODE_EXPIRE_SECONDS": 300,
     "REFRESH_TOKEN_EXPIRE_SECONDS": 6000,
     "ROTATE_REFRESH_TOKEN": True,
+    "OAUTH2_VALIDATOR_CLASS": "users.oauth.CachedOAuth2Validator",
     "SCOPES": {
         "read": "Read scope",
         "write": "Write scope",
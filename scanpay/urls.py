@@ -3,6 +3,8 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from oauth2_provider import urls as oauth2_urls
+from utils.metrics import MetricsView
+from utils.profiling import ProfileDownloadView, ProfileListView, ProfileTokenView
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -12,4 +14,12 @@ urlpatterns = [
     path("accounts/", include("django.contrib.auth.urls")),
     path("o/", include(oauth2_urls)),
     path("api-auth/", include("rest_framework.urls")),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
+    path("profiles/", ProfileListView.as_view(), name="profiles"),
+    path("profiles/token/", ProfileTokenView.as_view(), name="profile-token"),
+    path(
+        "profiles/<slug:profile_id>.<slug:output>",
+        ProfileDownloadView.as_view(),
+        name="profile-download",
+    ),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,25 @@
+"""Background job handlers for user side effects, run by ``run_jobs``."""
+
+import logging
+from users.models import Merchant, User
+from users.services import AccountActivationService
+from utils.qr_code_generator import store_qr
+
+logger = logging.getLogger(__name__)
+
+
+def generate_merchant_qr_code(merchant_id):
+    merchant = Merchant.objects.filter(pk=merchant_id).first()
+    if merchant is None:
+        return
+
+    Merchant.objects.filter(pk=merchant.pk).update(qr_code=store_qr(str(merchant.pk)))
+
+    logger.debug("QR code generated and saved successfully.")
+
+
+def send_activation_email(user_id):
+    user = User.objects.filter(pk=user_id).first()
+    if user is None:
+        return
+    AccountActivationService.send_activation_email(user, fail_silently=False)
@@ -0,0 +1,75 @@
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from users.models import Merchant
+from utils.qr_code_generator import IMAGE_FACTORIES, qr_code_name, render_qr
+
+
+class Command(BaseCommand):
+    help = "Regenerate QR codes for all merchants across a process pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format",
+            choices=sorted(IMAGE_FACTORIES),
+            default=None,
+            help="Image format (defaults to the QR_CODE_FORMAT setting)",
+        )
+        parser.add_argument("--processes", type=int, default=None)
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Merchants rendered and saved per batch",
+        )
+
+    def handle(self, *args, **options):
+        image_format = options["format"] or settings.QR_CODE_FORMAT
+        chunk_size = options["chunk_size"]
+        merchant_ids = [
+            str(pk)
+            for pk in Merchant.objects.order_by("pk").values_list("pk", flat=True)
+        ]
+
+        rendered = updated = 0
+        # Workers only render bytes; storage writes and database updates stay
+        # in this process, so any storage backend works and no worker touches
+        # the database connection.
+        with ProcessPoolExecutor(max_workers=options["processes"]) as executor:
+            for start in range(0, len(merchant_ids), chunk_size):
+                chunk = merchant_ids[start : start + chunk_size]
+                names = {
+                    merchant_id: qr_code_name(merchant_id, image_format=image_format)
+                    for merchant_id in chunk
+                }
+                missing = [
+                    merchant_id
+                    for merchant_id in chunk
+                    if not default_storage.exists(names[merchant_id])
+                ]
+                images = executor.map(
+                    render_qr,
+                    missing,
+                    [image_format] * len(missing),
+                    chunksize=max(len(missing) // 32, 1),
+                )
+                for merchant_id, content in zip(missing, images):
+                    names[merchant_id] = default_storage.save(
+                        names[merchant_id], ContentFile(content)
+                    )
+                rendered += len(missing)
+
+                Merchant.objects.bulk_update(
+                    [Merchant(pk=pk, qr_code=name) for pk, name in names.items()],
+                    ["qr_code"],
+                )
+                updated += len(names)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Updated {updated} merchant(s), rendered {rendered} "
+                f"new {image_format} QR code(s)."
+            )
+        )
@@ -127,6 +127,28 @@ class User(AbstractUser):
 
     role = models.CharField(max_length=10, choices=Role.choices, default=Role.CLIENT)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    @property
+    def loaded_values(self):
+        """Field values as last read from or written to the database."""
+        return getattr(self, "_loaded_values", None)
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        # Reading one deferred field loads them all in the same query, so a
+        # user built from cached token data (users.oauth) costs one query
+        # however many other fields a view reads.
+        if fields is not None:
+            fields = set(fields)
+            deferred = self.get_deferred_fields()
+            if fields & deferred:
+                fields |= deferred
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+
     def save(self, *args, **kwargs):
         if not self.mfa_token:
             self.mfa_token = get_random_string(50)
@@ -134,6 +156,10 @@ class User(AbstractUser):
         if not self.pk:
             self.role = self.base_role
         super().save(*args, **kwargs)
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+        }
 
     def clean(self):
         if (
@@ -0,0 +1,132 @@
+import hashlib
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction as db_transaction
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from oauth2_provider.models import get_access_token_model
+from oauth2_provider.oauth2_validators import OAuth2Validator
+from oauth2_provider.settings import oauth2_settings
+from .models import User
+
+
+def _deferred_instance(model, values):
+    """A ``model`` instance with ``values`` loaded and every other field deferred."""
+    field_names = [
+        field.attname
+        for field in model._meta.concrete_fields
+        if field.attname in values
+    ]
+    return model.from_db(
+        DEFAULT_DB_ALIAS, field_names, [values[name] for name in field_names]
+    )
+
+
+class TokenCache:
+    """
+    Validated access tokens in the ``tokens`` cache, keyed by the token's
+    SHA-256 so raw tokens never reach the cache.
+
+    An entry holds what authentication needs: the token's id, application,
+    scopes and expiry and the user's id, role and flags. It lives no longer
+    than the token. Revoking a token or changing its user replaces the entry
+    with a tombstone once the write commits. Entries are only ever added,
+    never overwritten, so a request that read the token before the write
+    cannot cache it again afterwards.
+    """
+
+    ALIAS = "tokens"
+    TOKEN_FIELDS = ("id", "user_id", "application_id", "expires", "scope")
+    USER_FIELDS = ("id", "role", "is_active", "is_staff", "is_superuser")
+
+    @staticmethod
+    def cache():
+        return caches[TokenCache.ALIAS]
+
+    @staticmethod
+    def _key(token):
+        return f"oauth2:token:{hashlib.sha256(token.encode()).hexdigest()}"
+
+    @staticmethod
+    def get(token):
+        """Return the cached ``AccessToken`` for ``token`` with its user, or None."""
+        entry = TokenCache.cache().get(TokenCache._key(token))
+        if not entry:
+            return None
+        access_token = _deferred_instance(
+            get_access_token_model(), {**entry["token"], "token": token}
+        )
+        access_token.user = _deferred_instance(User, entry["user"])
+        return access_token
+
+    @staticmethod
+    def add(token, access_token):
+        timeout = int((access_token.expires - timezone.now()).total_seconds())
+        if timeout <= 0:
+            return
+        entry = {
+            "token": {
+                name: getattr(access_token, name) for name in TokenCache.TOKEN_FIELDS
+            },
+            "user": {
+                name: getattr(access_token.user, name)
+                for name in TokenCache.USER_FIELDS
+            },
+        }
+        TokenCache.cache().add(TokenCache._key(token), entry, timeout)
+
+    @staticmethod
+    def invalidate(tokens):
+        """Tombstone ``tokens`` once the surrounding transaction commits."""
+        keys = [TokenCache._key(token) for token in tokens]
+
+        def tombstone():
+            TokenCache.cache().set_many(
+                dict.fromkeys(keys, False),
+                oauth2_settings.ACCESS_TOKEN_EXPIRE_SECONDS,
+            )
+
+        if keys:
+            db_transaction.on_commit(tombstone)
+
+    @staticmethod
+    def invalidate_user(user_id):
+        """Tombstone every access token of the user once the write commits."""
+
+        def tombstone():
+            TokenCache.cache().set_many(
+                {
+                    TokenCache._key(token): False
+                    for token in get_access_token_model()
+                    .objects.filter(user_id=user_id)
+                    .values_list("token", flat=True)
+                },
+                oauth2_settings.ACCESS_TOKEN_EXPIRE_SECONDS,
+            )
+
+        db_transaction.on_commit(tombstone)
+
+
+class CachedOAuth2Validator(OAuth2Validator):
+    """
+    Answers bearer token checks from ``TokenCache`` and falls back to the
+    database on a miss. A cached token's user has only ``USER_FIELDS``
+    loaded; the rest are read from the database in one query when the first
+    of them is accessed.
+    """
+
+    def validate_bearer_token(self, token, scopes, request):
+        access_token = TokenCache.get(token) if token else None
+        if access_token is None:
+            valid = super().validate_bearer_token(token, scopes, request)
+            if valid:
+                TokenCache.add(token, request.access_token)
+            return valid
+
+        if not access_token.is_valid(scopes):
+            self._set_oauth2_error_on_request(request, access_token, scopes)
+            return False
+        request.client = SimpleLazyObject(lambda: access_token.application)
+        request.user = access_token.user
+        request.scopes = list(access_token.scopes)
+        request.access_token = access_token
+        return True
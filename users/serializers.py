@@ -1,8 +1,18 @@
+from django.core.files.storage import default_storage
 from rest_framework import serializers
+from utils.serializers import ValuesSerializer
 from .models import Address, Client, Company, Merchant, User
 from .services import UserService, CompanyService
 
 
+def format_date_joined(value):
+    return value.strftime("%d %B, %Y")
+
+
+def format_file_url(name):
+    return default_storage.url(name) if name else None
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -79,6 +89,45 @@ class ClientSerializer(serializers.ModelSerializer):
         )
 
 
+class ClientListSerializer(ValuesSerializer):
+    """Public client fields only; no password hash, MFA token or permissions."""
+
+    fields = (
+        "id",
+        "email",
+        "username",
+        "first_name",
+        "last_name",
+        "phone_number",
+        "is_active",
+        "date_joined",
+    )
+    formatters = {"id": str, "date_joined": format_date_joined}
+
+
+class MerchantListSerializer(ValuesSerializer):
+    """Public merchant fields with the company's id, name and status."""
+
+    fields = ClientListSerializer.fields + (
+        "qr_code",
+        "company",
+        "company__name",
+        "company__status",
+    )
+    formatters = {
+        **ClientListSerializer.formatters,
+        "qr_code": format_file_url,
+        "company": str,
+    }
+
+    def to_representation(self, row):
+        row = super().to_representation(row)
+        name, status = row.pop("company__name"), row.pop("company__status")
+        if row["company"] is not None:
+            row["company"] = {"id": row["company"], "name": name, "status": status}
+        return row
+
+
 class StaffUserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
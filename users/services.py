@@ -1,5 +1,12 @@
 # services.py
+import copy
+import json
 from django.conf import settings
+from django.http import QueryDict
+from oauth2_provider.models import get_access_token_model
+from oauth2_provider.oauth2_backends import get_oauthlib_core
+from oauth2_provider.settings import oauth2_settings
+from oauth2_provider.signals import app_authorized
 from utils.email_client import EmailClient
 from .models import Address, Client, Company, Merchant, User
 from django.core.exceptions import ObjectDoesNotExist
@@ -40,8 +47,16 @@ class UserService:
             "role": user.role,
         }
 
+    @staticmethod
+    def list_staff():
+        return User.objects.filter(is_staff=True).order_by("email")
+
 
 class CompanyService:
+    @staticmethod
+    def list_companies():
+        return Company.objects.select_related("address").order_by("name")
+
     @staticmethod
     def create_company(address_data, company_data):
         address = Address.objects.create(**address_data)
@@ -68,7 +83,7 @@ class CompanyService:
 class MerchantService:
     @staticmethod
     def list_merchants():
-        return Merchant.all_merchants()
+        return Merchant.all_merchants().select_related("company__address")
 
     @staticmethod
     def create_merchant(
@@ -171,7 +186,7 @@ class PasswordService:
 
 class AccountActivationService:
     @staticmethod
-    def send_activation_email(user):
+    def send_activation_email(user, fail_silently=True):
         token_generator = PasswordResetTokenGenerator()
         token = token_generator.make_token(user)
         uid = urlsafe_base64_encode(force_bytes(user.pk))
@@ -185,10 +200,12 @@ class AccountActivationService:
             html_body=f"<p>Use the link below to activate your account:</p><p><a href='{reset_url}'>Activate Account</a></p>",
         )
         try:
-            email_client.send()
+            email_client.send(fail_silently=fail_silently)
             logger.info("Confirmation Email Sent successfully.")
         except Exception as e:
             logger.error(f"Error sending email: {e}")
+            if not fail_silently:
+                raise
 
     @staticmethod
     def activate_account(uid, token):
@@ -209,3 +226,89 @@ class AccountActivationService:
         except (TypeError, ValueError, OverflowError, User.DoesNotExist) as e:
             logger.error(f"Error activating account: {e}")
             return {"message": "Invalid or expired token."}
+
+
+class TokenService:
+    """
+    Runs token grants and revocations in-process through django-oauth-toolkit's
+    OAuthLibCore, as our own client, instead of POSTing them to ``/o/``. A
+    login or refresh then costs the token writes and no second request to a
+    worker.
+
+    Each call takes the Django request and returns ``(status, data, headers)``
+    as the token endpoint would have answered.
+    """
+
+    _core = None
+
+    @staticmethod
+    def core():
+        if TokenService._core is None or oauth2_settings.ALWAYS_RELOAD_OAUTHLIB_CORE:
+            TokenService._core = get_oauthlib_core()
+        return TokenService._core
+
+    @staticmethod
+    def _client_request(request, params):
+        """A copy of ``request`` posting ``params`` with the client's credentials."""
+        client_request = copy.copy(request)
+        # The caller's bearer token must not be read as client credentials.
+        client_request.META = {
+            key: value
+            for key, value in request.META.items()
+            if key != "HTTP_AUTHORIZATION"
+        }
+        client_request.POST = QueryDict(mutable=True)
+        client_request.POST.update(
+            {
+                "client_id": settings.CLIENT_ID,
+                "client_secret": settings.CLIENT_SECRET,
+                **params,
+            }
+        )
+        return client_request
+
+    @staticmethod
+    def _response(headers, body, status):
+        headers = {
+            name: value
+            for name, value in headers.items()
+            if name.lower() != "content-type"
+        }
+        return status, json.loads(body) if body else {}, headers
+
+    @staticmethod
+    def _token_response(request, params):
+        _, headers, body, status = TokenService.core().create_token_response(
+            TokenService._client_request(request, params)
+        )
+        if status == 200 and app_authorized.has_listeners():
+            token = get_access_token_model().objects.get(
+                token=json.loads(body)["access_token"]
+            )
+            app_authorized.send(sender=TokenService, request=request, token=token)
+        return TokenService._response(headers, body, status)
+
+    @staticmethod
+    def exchange_code(request, code, redirect_uri, code_verifier):
+        return TokenService._token_response(
+            request,
+            {
+                "grant_type": "authorization_code",
+                "code": code,
+                "redirect_uri": redirect_uri,
+                "code_verifier": code_verifier,
+            },
+        )
+
+    @staticmethod
+    def refresh(request, refresh_token):
+        return TokenService._token_response(
+            request, {"grant_type": "refresh_token", "refresh_token": refresh_token}
+        )
+
+    @staticmethod
+    def revoke(request, token):
+        _, headers, body, status = TokenService.core().create_revocation_response(
+            TokenService._client_request(request, {"token": token})
+        )
+        return TokenService._response(headers, body, status)
@@ -1,35 +1,41 @@
-from django.conf import settings
-from users.models import Merchant
-from users.services import AccountActivationService
-from utils.email_client import EmailClient
-from utils.qr_code_generator import convert_base64, generate_qr
-from django.contrib.auth.tokens import PasswordResetTokenGenerator
-from django.utils.http import urlsafe_base64_encode
-from django.utils.encoding import force_bytes
-from django.db.models.signals import post_save
+from jobs.services import JobService
+from oauth2_provider.models import AccessToken
+from users.models import Client, Merchant, User
+from users.oauth import TokenCache
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-import logging
-
-logger = logging.getLogger(__name__)
 
 
 @receiver(post_save, sender=Merchant)
-def create_merchant_qr_code(sender, instance, created, **kwargs):
+def enqueue_merchant_onboarding(sender, instance, created, **kwargs):
+    """Defer the merchant's QR code and activation email to the job worker."""
     if created:
+        merchant_id = str(instance.pk)
+        JobService.enqueue_many(
+            [
+                ("users.jobs.generate_merchant_qr_code", {"merchant_id": merchant_id}),
+                ("users.jobs.send_activation_email", {"user_id": merchant_id}),
+            ]
+        )
 
-        qr_data = generate_qr(instance.pk)
-        qr_code_dict = generate_qr(qr_data)
-        base64_str = qr_code_dict["image_base64"]
-
-        img = convert_base64(base64_str, instance.pk)
-
-        instance.qr_code = img
-        instance.save()
 
-        logger.debug("QR code generated and saved successfully.")
+@receiver(post_save, sender=AccessToken)
+@receiver(post_delete, sender=AccessToken)
+def invalidate_cached_token(sender, instance, created=False, **kwargs):
+    if not created:
+        TokenCache.invalidate([instance.token])
 
 
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Client)
 @receiver(post_save, sender=Merchant)
-def send_confirmation_email(sender, instance, created, **kwargs):
+def invalidate_cached_user_tokens(sender, instance, created, **kwargs):
+    """Cached tokens carry the user's role and flags; drop them on change."""
     if created:
-        AccountActivationService.send_activation_email(instance)
+        return
+    loaded = instance.loaded_values
+    if loaded is None or any(
+        name not in loaded or loaded[name] != getattr(instance, name)
+        for name in TokenCache.USER_FIELDS
+    ):
+        TokenCache.invalidate_user(instance.pk)
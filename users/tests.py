@@ -1,3 +1,455 @@
-from django.test import TestCase
+import base64
+import hashlib
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from datetime import timedelta
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from oauth2_provider.contrib.rest_framework import OAuth2Authentication
+from oauth2_provider.models import AccessToken, Application, Grant, RefreshToken
+from rest_framework.request import Request
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+from jobs.models import Job
+from utils.testing import QueryBudgetMixin
+from utils.qr_code_generator import qr_code_name, render_qr, store_qr
+from .models import Address, Company, Merchant, User
+from .oauth import TokenCache
+from .serializers import MerchantListSerializer
+from .services import MerchantService
+from .views import (
+    AddressListCreateAPIView,
+    Clients,
+    CompanyListCreateAPIView,
+    ExchangeToken,
+    Merchants,
+    RefreshToken as RefreshTokenView,
+    RevokeToken,
+    StaffUsers,
+)
 
-# Create your tests here.
+
+class MediaTestCase(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class MerchantOnboardingTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch("utils.email_client.EmailClient.send")
+        self.send = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_merchant(self):
+        return Merchant.objects.create(
+            email="merchant@example.com", username="merchant", role=User.Role.MERCHANT
+        )
+
+    def test_signup_only_enqueues_side_effects(self):
+        with CaptureQueriesContext(connection) as queries:
+            merchant = self.create_merchant()
+
+        job_inserts = [q for q in queries if 'INSERT INTO "jobs_job"' in q["sql"]]
+        self.assertEqual(len(job_inserts), 1)
+        self.assertEqual(Job.objects.filter(status=Job.Status.PENDING).count(), 2)
+        self.send.assert_not_called()
+        merchant.refresh_from_db()
+        self.assertFalse(merchant.qr_code)
+
+    def test_worker_generates_qr_code_and_sends_email(self):
+        merchant = self.create_merchant()
+
+        call_command("run_jobs", "--once", stdout=StringIO())
+
+        merchant.refresh_from_db()
+        self.assertEqual(merchant.qr_code.name, qr_code_name(str(merchant.pk)))
+        self.assertTrue(default_storage.exists(merchant.qr_code.name))
+        self.send.assert_called_once_with(fail_silently=False)
+        self.assertEqual(Job.objects.filter(status=Job.Status.SUCCEEDED).count(), 2)
+
+    def test_failed_email_is_retried(self):
+        self.send.side_effect = RuntimeError("mail down")
+        self.create_merchant()
+
+        call_command("run_jobs", "--once", stdout=StringIO())
+
+        job = Job.objects.get(handler="users.jobs.send_activation_email")
+        self.assertEqual(job.status, Job.Status.PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn("mail down", job.last_error)
+
+
+class QrCodeTests(MediaTestCase):
+    def test_render_formats(self):
+        self.assertTrue(render_qr("merchant").startswith(b"\x89PNG"))
+        self.assertIn(b"<svg", render_qr("merchant", image_format="svg"))
+        with self.assertRaises(ValueError):
+            render_qr("merchant", image_format="gif")
+
+    def test_identical_payloads_are_rendered_once(self):
+        with mock.patch("utils.qr_code_generator.render_qr", wraps=render_qr) as render:
+            first = store_qr("merchant-1")
+            second = store_qr("merchant-1")
+            svg = store_qr("merchant-1", image_format="svg")
+
+        self.assertEqual(first, second)
+        self.assertTrue(svg.endswith(".svg"))
+        self.assertEqual(render.call_count, 2)
+
+    def test_bulk_regeneration(self):
+        merchants = [
+            Merchant.objects.create(
+                email=f"merchant{i}@example.com",
+                username=f"merchant{i}",
+                role=User.Role.MERCHANT,
+            )
+            for i in range(5)
+        ]
+        store_qr(str(merchants[0].pk), image_format="svg")
+
+        out = StringIO()
+        call_command(
+            "regenerate_qr_codes",
+            "--format=svg",
+            "--processes=2",
+            "--chunk-size=2",
+            stdout=out,
+        )
+
+        self.assertIn("Updated 5 merchant(s), rendered 4 new svg", out.getvalue())
+        for merchant in merchants:
+            merchant.refresh_from_db()
+            name = qr_code_name(str(merchant.pk), image_format="svg")
+            self.assertEqual(merchant.qr_code.name, name)
+            self.assertTrue(default_storage.exists(name))
+
+
+class MerchantListTests(TestCase):
+    def test_rows_nest_company_and_omit_credentials(self):
+        address = Address.objects.create(
+            street="1 Cairo Road",
+            city="Lusaka",
+            province="Lusaka",
+            postal_code="10101",
+            country="Zambia",
+        )
+        company = Company.objects.create(
+            name="Acme", address=address, phone_number="+260970000000"
+        )
+        with_company = Merchant.objects.create(
+            email="acme@example.com",
+            username="acme",
+            role=User.Role.MERCHANT,
+            company=company,
+            mfa_token="secret",
+        )
+        Merchant.objects.create(
+            email="solo@example.com", username="solo", role=User.Role.MERCHANT
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            data = MerchantListSerializer(
+                MerchantListSerializer.get_queryset(MerchantService.list_merchants())
+            ).data
+
+        self.assertEqual(len(queries), 1)
+        rows = {row["email"]: row for row in data}
+        self.assertEqual(
+            rows["acme@example.com"]["company"],
+            {"id": str(company.pk), "name": "Acme", "status": company.status},
+        )
+        self.assertEqual(rows["acme@example.com"]["id"], str(with_company.pk))
+        self.assertIsNone(rows["solo@example.com"]["company"])
+        for row in data:
+            self.assertNotIn("password", row)
+            self.assertNotIn("mfa_token", row)
+
+
+class ListQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.admin = User.objects.create(
+            email="admin@example.com", role=User.Role.ADMIN, is_staff=True
+        )
+        self.created = 0
+
+    def get(self, view_class):
+        request = APIRequestFactory().get("/")
+        force_authenticate(request, user=self.admin)
+        return lambda: view_class.as_view()(request)
+
+    def seed_companies(self, count):
+        addresses = Address.objects.bulk_create(
+            [
+                Address(
+                    street=f"{index} Cairo Road",
+                    city="Lusaka",
+                    province="Lusaka",
+                    postal_code="10101",
+                    country="Zambia",
+                )
+                for index in range(count)
+            ]
+        )
+        return Company.objects.bulk_create(
+            [
+                Company(name=f"Company {address.street}", address=address)
+                for address in addresses
+            ]
+        )
+
+    def seed_users(self, count, **fields):
+        start, self.created = self.created, self.created + count
+        return User.objects.bulk_create(
+            [
+                User(
+                    email=f"user{index}@example.com",
+                    username=f"user{index}",
+                    **{
+                        name: value(index) if callable(value) else value
+                        for name, value in fields.items()
+                    },
+                )
+                for index in range(start, self.created)
+            ]
+        )
+
+    def seed_merchants(self, count):
+        companies = self.seed_companies(count)
+        self.seed_users(
+            count,
+            role=User.Role.MERCHANT,
+            company=lambda index: companies[index % count],
+            qr_code=lambda index: f"qr_codes/{index}.png",
+        )
+
+    def test_merchants(self):
+        self.assertQueryBudget(1, self.seed_merchants, self.get(Merchants))
+
+    def test_clients(self):
+        self.assertQueryBudget(
+            1,
+            lambda count: self.seed_users(count, role=User.Role.CLIENT),
+            self.get(Clients),
+        )
+
+    def test_staff_users(self):
+        self.assertQueryBudget(
+            1,
+            lambda count: self.seed_users(count, is_staff=True),
+            self.get(StaffUsers),
+        )
+
+    def test_companies(self):
+        self.assertQueryBudget(
+            1, self.seed_companies, self.get(CompanyListCreateAPIView)
+        )
+
+    def test_addresses(self):
+        self.assertQueryBudget(
+            1, self.seed_companies, self.get(AddressListCreateAPIView)
+        )
+
+
+@override_settings(CLIENT_ID="web", CLIENT_SECRET="web-secret", CLIENT_IDENTIFIER="spa")
+class TokenEndpointTests(TestCase):
+    redirect_uri = "https://app.example.com/callback"
+
+    def setUp(self):
+        # Tokens are issued in-process; nothing may call back over HTTP.
+        patcher = mock.patch("requests.post", side_effect=AssertionError)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create(email="user@example.com", username="user")
+        self.application = Application.objects.create(
+            client_id="web",
+            client_secret="web-secret",
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE,
+            redirect_uris=self.redirect_uri,
+        )
+
+    def post(self, view_class, data, user=None, **headers):
+        request = APIRequestFactory().post("/", data, format="json", **headers)
+        if user:
+            force_authenticate(request, user=user)
+        return view_class.as_view()(request)
+
+    def issue_tokens(self):
+        access_token = AccessToken.objects.create(
+            user=self.user,
+            application=self.application,
+            token="access-token",
+            expires=timezone.now() + timedelta(minutes=5),
+            scope="read write",
+        )
+        refresh_token = RefreshToken.objects.create(
+            user=self.user,
+            application=self.application,
+            token="refresh-token",
+            access_token=access_token,
+        )
+        return access_token, refresh_token
+
+    def test_authorization_code_is_exchanged(self):
+        verifier = "v" * 64
+        challenge = (
+            base64.urlsafe_b64encode(hashlib.sha256(verifier.encode()).digest())
+            .decode()
+            .rstrip("=")
+        )
+        Grant.objects.create(
+            user=self.user,
+            application=self.application,
+            code="auth-code",
+            expires=timezone.now() + timedelta(minutes=5),
+            redirect_uri=self.redirect_uri,
+            scope="read write",
+            code_challenge=challenge,
+            code_challenge_method=Grant.CODE_CHALLENGE_S256,
+        )
+
+        response = self.post(
+            ExchangeToken,
+            {
+                "code": "auth-code",
+                "redirect_uri": self.redirect_uri,
+                "code_verifier": verifier,
+            },
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], "no-store")
+        token = AccessToken.objects.get(token=response.data["access_token"])
+        self.assertEqual(token.user, self.user)
+        self.assertFalse(Grant.objects.exists())
+
+    def test_refresh_token_is_rotated(self):
+        self.issue_tokens()
+
+        response = self.post(
+            RefreshTokenView,
+            {"refresh_token": "refresh-token"},
+            HTTP_X_CLIENT_IDENTIFIER="spa",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data["refresh_token"], "refresh-token")
+        self.assertTrue(
+            AccessToken.objects.filter(token=response.data["access_token"]).exists()
+        )
+
+    def test_invalid_refresh_token_is_rejected(self):
+        response = self.post(
+            RefreshTokenView, {"refresh_token": "bogus"}, HTTP_X_CLIENT_IDENTIFIER="spa"
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["error"], "invalid_grant")
+
+    def test_token_is_revoked(self):
+        self.issue_tokens()
+
+        response = self.post(
+            RevokeToken,
+            {"token": "access-token"},
+            user=self.user,
+            HTTP_AUTHORIZATION="Bearer access-token",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"detail": "Token revoked successfully"})
+        self.assertFalse(AccessToken.objects.filter(token="access-token").exists())
+
+
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        TokenCache.cache().clear()
+        self.user = Merchant.objects.create(
+            email="merchant@example.com", username="merchant", role=User.Role.MERCHANT
+        )
+        self.application = Application.objects.create(
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_AUTHORIZATION_CODE,
+        )
+        self.access_token = AccessToken.objects.create(
+            user=self.user,
+            application=self.application,
+            token="access-token",
+            expires=timezone.now() + timedelta(minutes=5),
+            scope="read write",
+        )
+
+    def authenticate(self, token="access-token"):
+        request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        return OAuth2Authentication().authenticate(Request(request))
+
+    def test_repeat_requests_skip_the_database(self):
+        self.authenticate()
+
+        with self.assertNumQueries(0):
+            user, access_token = self.authenticate()
+
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user.role, User.Role.MERCHANT)
+        self.assertEqual(access_token.pk, self.access_token.pk)
+        self.assertTrue(access_token.allow_scopes(["read"]))
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, "merchant@example.com")
+            self.assertEqual(user.username, "merchant")
+            self.assertIsNone(user.company_id)
+
+    def test_raw_token_is_not_a_cache_key(self):
+        self.authenticate()
+
+        key = TokenCache._key("access-token")
+        self.assertNotIn("access-token", key)
+        self.assertEqual(TokenCache.cache().get(key)["user"]["id"], self.user.pk)
+
+    def test_revoked_token_is_rejected(self):
+        self.authenticate()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.access_token.revoke()
+
+        self.assertIsNone(self.authenticate())
+
+    def test_user_change_is_seen(self):
+        self.authenticate()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.role = User.Role.CLIENT
+            self.user.save()
+
+        user, _ = self.authenticate()
+        self.assertEqual(user.role, User.Role.CLIENT)
+
+    def test_unrelated_user_change_keeps_tokens(self):
+        self.authenticate()
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            user = User.objects.get(pk=self.user.pk)
+            user.first_name = "Renamed"
+            user.save()
+
+        self.assertEqual(callbacks, [])
+        with self.assertNumQueries(0):
+            self.authenticate()
+
+    def test_expired_token_is_not_cached(self):
+        AccessToken.objects.filter(pk=self.access_token.pk).update(
+            expires=timezone.now() - timedelta(seconds=1)
+        )
+
+        self.assertIsNone(self.authenticate())
+        with self.assertNumQueries(1):
+            self.assertIsNone(self.authenticate())
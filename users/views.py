@@ -1,8 +1,10 @@
 # views.py
 from django.conf import settings
-import requests
+from django.utils.decorators import method_decorator
+from django.views.decorators.gzip import gzip_page
 from rest_framework import status
 from rest_framework.views import APIView
+from scanpay.routers import replica_reads
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
@@ -14,11 +16,14 @@ from users.services import (
     ClientService,
     CompanyService,
     PasswordService,
+    TokenService,
 )
 from users.serializers import (
     AddressSerializer,
+    ClientListSerializer,
     ClientSerializer,
     CompanySerializer,
+    MerchantListSerializer,
     MerchantSerializer,
     PasswordResetRequestSerializer,
     PasswordResetSerializer,
@@ -39,9 +44,13 @@ class UserDetailView(APIView):
 class Merchants(APIView):
     permission_classes = [AllowAnyPostPermission]
 
+    @method_decorator(gzip_page)
+    @replica_reads()
     def get(self, request):
-        merchants = MerchantService.list_merchants()
-        serializer = MerchantSerializer(merchants, many=True)
+        merchants = MerchantListSerializer.get_queryset(
+            MerchantService.list_merchants()
+        )
+        serializer = MerchantListSerializer(merchants)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def post(self, request):
@@ -86,9 +95,11 @@ class Merchants(APIView):
 class Clients(APIView):
     permission_classes = [IsAuthenticated, IsAdminUser]
 
+    @method_decorator(gzip_page)
+    @replica_reads()
     def get(self, request):
-        clients = ClientService.list_clients()
-        serializer = ClientSerializer(clients, many=True)
+        clients = ClientListSerializer.get_queryset(ClientService.list_clients())
+        serializer = ClientListSerializer(clients)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def post(self, request):
@@ -132,129 +143,82 @@ class Clients(APIView):
 
 class ExchangeToken(APIView):
     def post(self, request, *args, **kwargs):
-        try:
-            code = request.data.get("code")
-            redirect_uri = request.data.get("redirect_uri")
-            code_verifier = request.data.get("code_verifier")
-
-            if not all([code, redirect_uri, code_verifier]):
-                return Response(
-                    {"error": "Missing code, redirect_uri, or code_verifier"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            response = requests.post(
-                f"{settings.BASE_URL}/o/token/",
-                data={
-                    "grant_type": "authorization_code",
-                    "code": code,
-                    "redirect_uri": redirect_uri,
-                    "code_verifier": code_verifier,
-                    "client_id": settings.CLIENT_ID,
-                    "client_secret": settings.CLIENT_SECRET,
-                },
-            )
+        code = request.data.get("code")
+        redirect_uri = request.data.get("redirect_uri")
+        code_verifier = request.data.get("code_verifier")
 
-            if response.status_code == 200:
-                return Response(response.json())
-            return Response(response.json(), status=response.status_code)
-
-        except requests.exceptions.RequestException as e:
+        if not all([code, redirect_uri, code_verifier]):
             return Response(
-                {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {"error": "Missing code, redirect_uri, or code_verifier"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
+        status_code, data, headers = TokenService.exchange_code(
+            request._request, code, redirect_uri, code_verifier
+        )
+        return Response(data, status=status_code, headers=headers)
+
 
 class RevokeToken(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
-        try:
-            token = request.data.get("token")
-
-            if not token:
-                return Response(
-                    {"error": "Missing token"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            response = requests.post(
-                f"{settings.BASE_URL}/o/revoke_token/",
-                data={
-                    "token": token,
-                    "client_id": settings.CLIENT_ID,
-                    "client_secret": settings.CLIENT_SECRET,
-                },
-                headers={"Content-Type": "application/x-www-form-urlencoded"},
-            )
+        token = request.data.get("token")
 
-            if response.status_code == 200:
-                return Response(
-                    {"detail": "Token revoked successfully"}, status=status.HTTP_200_OK
-                )
-            return Response(response.json(), status=response.status_code)
+        if not token:
+            return Response(
+                {"error": "Missing token"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        except requests.exceptions.RequestException as e:
+        status_code, data, headers = TokenService.revoke(request._request, token)
+        if status_code == 200:
             return Response(
-                {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {"detail": "Token revoked successfully"}, status=status.HTTP_200_OK
             )
+        return Response(data, status=status_code, headers=headers)
 
 
 class RefreshToken(APIView):
     def post(self, request, *args, **kwargs):
-        try:
-            refresh_token = request.data.get("refresh_token")
-            client_identifier = request.headers.get("X-Client-Identifier")
-
-            if not refresh_token:
-                return Response(
-                    {"error": "Missing refresh_token"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            if not client_identifier:
-                return Response(
-                    {"error": "Missing client identifier"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            if client_identifier != settings.CLIENT_IDENTIFIER:
-                return Response(
-                    {"error": "Invalid client identifier"},
-                    status=status.HTTP_403_FORBIDDEN,
-                )
-
-            response = requests.post(
-                f"{settings.BASE_URL}/o/token/",
-                data={
-                    "grant_type": "refresh_token",
-                    "refresh_token": refresh_token,
-                    "client_id": settings.CLIENT_ID,
-                    "client_secret": settings.CLIENT_SECRET,
-                },
-                headers={"Content-Type": "application/x-www-form-urlencoded"},
+        refresh_token = request.data.get("refresh_token")
+        client_identifier = request.headers.get("X-Client-Identifier")
+
+        if not refresh_token:
+            return Response(
+                {"error": "Missing refresh_token"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
-            if response.status_code == 200:
-                return Response(response.json())
-            return Response(response.json(), status=response.status_code)
+        if not client_identifier:
+            return Response(
+                {"error": "Missing client identifier"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        except requests.exceptions.RequestException as e:
+        if client_identifier != settings.CLIENT_IDENTIFIER:
             return Response(
-                {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {"error": "Invalid client identifier"},
+                status=status.HTTP_403_FORBIDDEN,
             )
 
+        status_code, data, headers = TokenService.refresh(
+            request._request, refresh_token
+        )
+        return Response(data, status=status_code, headers=headers)
+
 
 class StaffUsers(APIView):
     permission_classes = [IsAuthenticated, IsAdminUser]
 
+    @replica_reads()
     def get(self, request, pk=None):
         if pk:
             user = get_object_or_404(User, pk=pk, is_staff=True)
             serializer = StaffUserSerializer(user)
             return Response(serializer.data, status=status.HTTP_200_OK)
         else:
-            users = User.objects.filter(is_staff=True)
+            users = UserService.list_staff()
             serializer = StaffUserSerializer(users, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -339,6 +303,7 @@ class ActivateAccount(APIView):
 class AddressListCreateAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @replica_reads()
     def get(self, request):
         addresses = Address.objects.all()
         serializer = AddressSerializer(addresses, many=True)
@@ -355,6 +320,7 @@ class AddressListCreateAPIView(APIView):
 class CompanyListCreateAPIView(APIView):
     permission_classes = [IsAuthenticated, IsMerchant | IsAdminUser]
 
+    @replica_reads()
     def get(self, request):
         companies = CompanyService.list_companies()
         serializer = CompanySerializer(companies, many=True)
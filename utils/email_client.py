@@ -1,4 +1,5 @@
 import mailtrap as mt
+from utils.metrics import outbound
 
 
 class EmailClient:
@@ -9,7 +10,7 @@ class EmailClient:
         self.subject = subject
         self.html_body = html_body
 
-    def send(self):
+    def send(self, fail_silently=True):
         mail = mt.Mail(
             sender=mt.Address(email=self.sender, name="SCANPAY"),
             to=[mt.Address(email=self.receiver)],
@@ -18,7 +19,10 @@ class EmailClient:
         )
 
         try:
-            self.client.send(mail)
+            with outbound("mailtrap"):
+                self.client.send(mail)
             print("Email sent successfully!")
         except Exception as e:
             print(f"Failed to send email: {e}")
+            if not fail_silently:
+                raise
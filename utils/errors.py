@@ -11,6 +11,10 @@ class AccessTokenError(Exception):
     pass
 
 
+class PaymentUnconfirmedError(Exception):
+    """A request to MoMo failed after it may already have been acted on."""
+
+
 class TransferRequestError(Exception):
     def __init__(
         self, message="Transfer request failed", status_code=None, response_text=None
@@ -0,0 +1,161 @@
+import functools
+import hashlib
+import json
+import time
+from django.conf import settings
+from django.core.cache import cache as default_cache
+from rest_framework import status
+from rest_framework.exceptions import NotAuthenticated
+from rest_framework.response import Response
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+class IdempotencyStore:
+    """
+    Cache-backed record of responses to ``Idempotency-Key`` requests.
+
+    Each key holds a ``(fingerprint, status, data)`` tuple: ``status`` is
+    None while the first request is still running, so a duplicate that
+    arrives meanwhile waits for it instead of running the view again.
+    Finished responses are kept for ``IDEMPOTENCY_KEY_TTL`` seconds, and an
+    unfinished claim lapses after ``lock_timeout`` seconds.
+    """
+
+    KEY_PREFIX = "idempotency"
+    LOCK_TIMEOUT = 60
+    COALESCE_TIMEOUT = 30
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, ttl=None, cache=None, lock_timeout=None):
+        self.ttl = ttl or getattr(settings, "IDEMPOTENCY_KEY_TTL", 24 * 60 * 60)
+        self.cache = cache or default_cache
+        self.lock_timeout = lock_timeout or self.LOCK_TIMEOUT
+
+    def cache_key(self, scope, key):
+        digest = hashlib.sha256(f"{scope}:{key}".encode()).hexdigest()
+        return f"{self.KEY_PREFIX}:{digest}"
+
+    def claim(self, cache_key, fingerprint):
+        """
+        Claim ``cache_key`` for a new request and return None, or return the
+        record that already holds it. A record for the same request that is
+        still in flight is waited on for up to ``COALESCE_TIMEOUT`` seconds.
+        """
+        deadline = time.monotonic() + self.COALESCE_TIMEOUT
+        while True:
+            if self.cache.add(cache_key, (fingerprint, None, None), self.lock_timeout):
+                return None
+            record = self.cache.get(cache_key)
+            if record is None:
+                continue
+            stored_fingerprint, stored_status, _ = record
+            if stored_status is not None or stored_fingerprint != fingerprint:
+                return record
+            if time.monotonic() > deadline:
+                return record
+            time.sleep(self.POLL_INTERVAL)
+
+    def complete(self, cache_key, fingerprint, response):
+        self.cache.set(
+            cache_key, (fingerprint, response.status_code, response.data), self.ttl
+        )
+
+    def release(self, cache_key):
+        self.cache.delete(cache_key)
+
+    @staticmethod
+    def replay(record, fingerprint):
+        stored_fingerprint, stored_status, data = record
+        if stored_fingerprint != fingerprint:
+            return Response(
+                {"error": f"{IDEMPOTENCY_HEADER} was already used for another request"},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        if stored_status is None:
+            return Response(
+                {"error": f"A request with this {IDEMPOTENCY_HEADER} is in progress"},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response(data, status=stored_status, headers={REPLAYED_HEADER: "true"})
+
+
+def request_fingerprint(request):
+    data = request.data
+    if hasattr(data, "lists"):
+        data = dict(data.lists())
+    payload = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def user_scope(request):
+    user = request.user
+    return str(user.pk) if user and user.is_authenticated else "anonymous"
+
+
+def idempotent(scope=user_scope, lock_timeout=None, replay_errors=False):
+    """
+    Make a view method replay its response for a repeated ``Idempotency-Key``.
+
+    Keys are namespaced by ``scope(request)`` and tied to a hash of the
+    parsed request data; a scope of None refuses the key as unauthenticated.
+    Requests without the header run as usual; 5xx responses and exceptions
+    release the key so the client can retry.
+
+    Views whose side effects may outlive a failure, such as a charge sent to
+    a payment provider, pass ``replay_errors`` to have 5xx responses and
+    exceptions (as a 500) replayed instead. ``lock_timeout()``, if given,
+    is how long in seconds the view can run, so that a slow first request
+    is never mistaken for an abandoned one.
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return method(view, request, *args, **kwargs)
+            if len(key) > 255:
+                return Response(
+                    {"error": f"{IDEMPOTENCY_HEADER} must be at most 255 characters"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            key_scope = scope(request)
+            if key_scope is None:
+                raise NotAuthenticated(
+                    f"{IDEMPOTENCY_HEADER} requires an authenticated caller"
+                )
+
+            store = IdempotencyStore(lock_timeout=lock_timeout and lock_timeout())
+            fingerprint = request_fingerprint(request)
+            cache_key = store.cache_key(key_scope, key)
+            record = store.claim(cache_key, fingerprint)
+            if record is not None:
+                return store.replay(record, fingerprint)
+
+            try:
+                response = method(view, request, *args, **kwargs)
+            except Exception:
+                if replay_errors:
+                    store.complete(
+                        cache_key,
+                        fingerprint,
+                        Response(
+                            {"error": "The request failed"},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                        ),
+                    )
+                else:
+                    store.release(cache_key)
+                raise
+            if response.status_code >= 500 and not replay_errors:
+                store.release(cache_key)
+            else:
+                store.complete(cache_key, fingerprint, response)
+            return response
+
+        return wrapper
+
+    return decorator
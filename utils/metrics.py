@@ -0,0 +1,258 @@
+"""
+In-process request metrics, exposed in the Prometheus text format.
+
+``MetricsMiddleware`` times every request and records, per route and
+method, its latency, database queries and query time, time spent calling
+MTN or Mailtrap, and response size. ``MetricsView`` serves the registry
+to admins. Figures are per process: with several workers, each one
+reports its own requests.
+
+A streaming response is recorded when the view returns it, before its
+content is generated. Its duration stops there, and the queries it runs
+while streaming (the invoice exports, for one) are not counted.
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from django.db import connections
+from django.http import HttpResponse
+from django.views import View
+from rest_framework.views import APIView
+from utils.permissions import IsAdminUser
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+UNMATCHED_ROUTE = "<unmatched>"
+# Any other method a client sends is counted under this one label value.
+OTHER_METHOD = "other"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels, lock):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._lock = lock
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_number(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels, lock, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = lock
+        # label values -> [per-bucket counts..., sum, count]
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self):
+        for key, state in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                labels = _format_labels(self.labels, key, ("le", _format_number(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, key, ("le", "+Inf"))
+            yield f"{self.name}_bucket{labels} {state[-1]}"
+            labels = _format_labels(self.labels, key)
+            yield f"{self.name}_sum{labels} {_format_number(state[-2])}"
+            yield f"{self.name}_count{labels} {state[-1]}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(name, documentation, labels, self._lock))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(
+            Histogram(name, documentation, labels, self._lock, buckets)
+        )
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for metric in self._metrics:
+                lines.append(f"# HELP {metric.name} {metric.documentation}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+                lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+ROUTE_LABELS = ("method", "route")
+REQUESTS = registry.counter(
+    "scanpay_http_requests_total",
+    "Requests by route, method and status code.",
+    ROUTE_LABELS + ("status",),
+)
+REQUEST_DURATION = registry.histogram(
+    "scanpay_http_request_duration_seconds",
+    "Time from the first middleware to the response.",
+    ROUTE_LABELS,
+)
+REQUEST_QUERIES = registry.histogram(
+    "scanpay_http_request_db_queries",
+    "Database queries per request.",
+    ROUTE_LABELS,
+    QUERY_BUCKETS,
+)
+REQUEST_DB_DURATION = registry.histogram(
+    "scanpay_http_request_db_duration_seconds",
+    "Time per request spent executing database queries.",
+    ROUTE_LABELS,
+)
+REQUEST_OUTBOUND_DURATION = registry.histogram(
+    "scanpay_http_request_outbound_duration_seconds",
+    "Time per request spent calling external services, by service.",
+    ROUTE_LABELS + ("service",),
+)
+RESPONSE_SIZE = registry.histogram(
+    "scanpay_http_response_size_bytes",
+    "Response body size; streamed responses are not counted.",
+    ROUTE_LABELS,
+    SIZE_BUCKETS,
+)
+OUTBOUND_DURATION = registry.histogram(
+    "scanpay_outbound_request_duration_seconds",
+    "Duration of each call to an external service, in or out of requests.",
+    ("service",),
+)
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_time", "outbound")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.outbound = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+@contextmanager
+def outbound(service):
+    """Time a call to ``service`` (``mtn``, ``mailtrap``)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        OUTBOUND_DURATION.observe(elapsed, service=service)
+        stats = _current.get()
+        if stats is not None:
+            stats.outbound[service] = stats.outbound.get(service, 0.0) + elapsed
+
+
+class MetricsMiddleware:
+    """Records each request into ``registry``; keep it first in MIDDLEWARE."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def record(request, response, stats, duration):
+        match = request.resolver_match
+        method = request.method
+        if method.lower() not in View.http_method_names:
+            method = OTHER_METHOD
+        labels = {
+            "method": method,
+            "route": match.route if match else UNMATCHED_ROUTE,
+        }
+        REQUESTS.inc(status=response.status_code, **labels)
+        REQUEST_DURATION.observe(duration, **labels)
+        REQUEST_QUERIES.observe(stats.queries, **labels)
+        REQUEST_DB_DURATION.observe(stats.db_time, **labels)
+        for service, elapsed in stats.outbound.items():
+            REQUEST_OUTBOUND_DURATION.observe(elapsed, service=service, **labels)
+        if not response.streaming:
+            RESPONSE_SIZE.observe(len(response.content), **labels)
+
+
+class MetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(
+            registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
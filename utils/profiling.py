@@ -0,0 +1,448 @@
+"""
+Opt-in profiling of slow requests.
+
+With ``PROFILING_ENABLED``, ``ProfilingMiddleware`` samples the stack of
+each request's thread every ``PROFILING_SAMPLE_INTERVAL`` seconds and keeps
+the samples of requests that took at least ``PROFILING_SLOW_REQUEST_MS``.
+A request carrying an ``X-Scanpay-Profile`` header issued by
+``POST /profiles/token/`` is run under cProfile instead, and always kept.
+A streaming response is profiled until its content has been consumed.
+
+cProfile hooks the whole process (``sys.monitoring`` from Python 3.12), so
+only one request per process runs under it at a time; a requested profile
+that overlaps it is sampled instead. From 3.12 a cProfile profile also
+counts calls made by other threads while it runs.
+
+Profiles are written to ``PROFILING_DIR``, which holds the newest
+``PROFILING_MAX_PROFILES``. Admins list them at ``/profiles/`` and download
+``/profiles/<id>.pstats`` (``python -m pstats``, snakeviz) or, for sampled
+profiles, ``/profiles/<id>.collapsed`` (flamegraph.pl, speedscope).
+"""
+
+import collections
+import cProfile
+import json
+import logging
+import marshal
+import os
+import re
+import secrets
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signing import BadSignature, TimestampSigner
+from django.http import FileResponse
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from users.models import User
+from utils.permissions import IsAdminUser
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Scanpay-Profile"
+SAMPLED = "sampled"
+CPROFILE = "cprofile"
+PSTATS = "pstats"
+COLLAPSED = "collapsed"
+
+_signer = TimestampSigner(salt="utils.profiling")
+# Held by the one request a process runs under cProfile.
+_cprofile_lock = threading.Lock()
+
+
+def issue_token(user):
+    """A value for ``PROFILE_HEADER``, valid for ``PROFILING_TOKEN_MAX_AGE``."""
+    return _signer.sign(str(user.pk))
+
+
+def token_user(token):
+    """
+    The pk of the admin ``token`` was issued to, or None if it is invalid or
+    its holder is no longer an active admin.
+    """
+    try:
+        pk = _signer.unsign(
+            token, max_age=getattr(settings, "PROFILING_TOKEN_MAX_AGE", 60 * 60)
+        )
+    except BadSignature:
+        return None
+    if not User.objects.filter(pk=pk, role=User.Role.ADMIN, is_active=True).exists():
+        return None
+    return pk
+
+
+class StackSampler:
+    """
+    A daemon thread that records the stacks of the threads registered with
+    it, from each thread's ``root`` frame down, as ``(filename, line,
+    function)`` tuples counted in a ``Counter``. It idles while no thread is
+    registered.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._targets = {}
+        self._thread = None
+
+    def start(self, root, samples=None):
+        if samples is None:
+            samples = collections.Counter()
+        with self._lock:
+            self._targets[threading.get_ident()] = (root, samples)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="stack-sampler", daemon=True
+                )
+                self._thread.start()
+        self._active.set()
+        return samples
+
+    def stop(self):
+        with self._lock:
+            self._targets.pop(threading.get_ident(), None)
+
+    def _run(self):
+        while True:
+            self._active.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                if not self._targets:
+                    self._active.clear()
+                for ident, (root, samples) in self._targets.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        samples[self._stack(frame, root)] += 1
+
+    @staticmethod
+    def _stack(frame, root):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            if frame is root:
+                break
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+
+class ProfiledContent:
+    """
+    Wraps a streaming response's content to keep profiling while it is
+    generated: ``resume(frame)`` and ``pause()`` run around each chunk, and
+    ``finish()`` once, when the content is exhausted, fails or is closed.
+    """
+
+    def __init__(self, content, resume, pause, finish):
+        self._iterator = iter(content)
+        self._resume = resume
+        self._pause = pause
+        self._finish = finish
+        self._finished = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self._resume(sys._getframe())
+        try:
+            chunk = next(self._iterator)
+        except BaseException:
+            self._pause()
+            self.close()
+            raise
+        self._pause()
+        return chunk
+
+    def close(self):
+        if not self._finished:
+            self._finished = True
+            self._finish()
+
+
+def sampled_stats(samples, interval):
+    """
+    Turn stack samples into the ``pstats`` format: each sample stands for
+    ``interval`` seconds of its leaf function's own time and of every
+    caller's cumulative time; call counts are sample counts.
+    """
+    stats = {}
+    for stack, count in samples.items():
+        elapsed = count * interval
+        caller = None
+        seen = set()
+        for func in stack:
+            entry = stats.setdefault(func, [0, 0, 0.0, 0.0, {}])
+            if func not in seen:
+                # A recursive function's time is only counted once.
+                seen.add(func)
+                entry[0] += count
+                entry[1] += count
+                entry[3] += elapsed
+            if caller is not None:
+                edge = entry[4].setdefault(caller, [0, 0, 0.0, 0.0])
+                edge[0] += count
+                edge[1] += count
+                edge[3] += elapsed
+            caller = func
+        stats[stack[-1]][2] += elapsed
+        edge = stats[stack[-1]][4].get(stack[-2]) if len(stack) > 1 else None
+        if edge is not None:
+            edge[2] += elapsed
+    return {
+        func: (
+            cc,
+            nc,
+            tt,
+            ct,
+            {caller: tuple(edge) for caller, edge in callers.items()},
+        )
+        for func, (cc, nc, tt, ct, callers) in stats.items()
+    }
+
+
+def collapsed_stacks(samples):
+    """Samples as Brendan Gregg's collapsed stacks, one ``a;b;c count`` per line."""
+    lines = []
+    for stack, count in samples.most_common():
+        frames = ";".join(
+            f"{name} ({filename}:{line})".replace(";", ":")
+            for filename, line, name in stack
+        )
+        lines.append(f"{frames} {count}")
+    return "\n".join(lines) + "\n"
+
+
+class ProfileStore:
+    """
+    A ring buffer of profiles on disk: each save drops the oldest beyond
+    ``max_profiles``. A profile is ``<id>.json`` metadata, written last,
+    next to ``<id>.pstats`` and, if sampled, ``<id>.collapsed``.
+    """
+
+    ID_PATTERN = re.compile(r"\d{20}-[0-9a-f]{8}")
+
+    def __init__(self, directory=None, max_profiles=None):
+        self.directory = Path(
+            directory
+            or getattr(settings, "PROFILING_DIR", None)
+            or Path(tempfile.gettempdir()) / "scanpay-profiles"
+        )
+        self.max_profiles = max_profiles or getattr(
+            settings, "PROFILING_MAX_PROFILES", 100
+        )
+
+    def save(self, meta, stats, samples=None):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profile_id = f"{time.time_ns():020d}-{secrets.token_hex(4)}"
+        with open(self.directory / f"{profile_id}.{PSTATS}", "wb") as f:
+            marshal.dump(stats, f)
+        outputs = [PSTATS]
+        if samples is not None:
+            (self.directory / f"{profile_id}.{COLLAPSED}").write_text(
+                collapsed_stacks(samples)
+            )
+            outputs.append(COLLAPSED)
+        meta = {"id": profile_id, **meta, "outputs": outputs}
+        partial = self.directory / f"{profile_id}.json.tmp"
+        partial.write_text(json.dumps(meta))
+        os.replace(partial, self.directory / f"{profile_id}.json")
+        self.prune()
+        return meta
+
+    def _ids(self):
+        if not self.directory.is_dir():
+            return []
+        return sorted(
+            (path.stem for path in self.directory.glob("*.json")), reverse=True
+        )
+
+    def prune(self):
+        for profile_id in self._ids()[self.max_profiles :]:
+            for output in ("json", PSTATS, COLLAPSED):
+                (self.directory / f"{profile_id}.{output}").unlink(missing_ok=True)
+
+    def list(self):
+        profiles = []
+        for profile_id in self._ids()[: self.max_profiles]:
+            try:
+                profiles.append(
+                    json.loads((self.directory / f"{profile_id}.json").read_text())
+                )
+            except FileNotFoundError:
+                # Pruned by another process meanwhile.
+                continue
+        return profiles
+
+    def path(self, profile_id, output):
+        """The file holding ``profile_id`` as ``output``, or None."""
+        if not self.ID_PATTERN.fullmatch(profile_id) or output not in (
+            PSTATS,
+            COLLAPSED,
+        ):
+            return None
+        path = self.directory / f"{profile_id}.{output}"
+        return path if path.is_file() else None
+
+
+class ProfilingMiddleware:
+    """Profiles slow and explicitly requested requests; see the module docstring."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, "PROFILING_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.store = ProfileStore()
+        self.interval = getattr(settings, "PROFILING_SAMPLE_INTERVAL", 0.005)
+        slow_ms = getattr(settings, "PROFILING_SLOW_REQUEST_MS", None)
+        self.threshold = None if slow_ms is None else slow_ms / 1000
+        self.sampler = StackSampler(self.interval)
+
+    def __call__(self, request):
+        token = request.headers.get(PROFILE_HEADER)
+        requested_by = token_user(token) if token else None
+        if requested_by is not None:
+            if _cprofile_lock.acquire(blocking=False):
+                return self.run_cprofile(request, requested_by)
+            return self.run_sampled(request, requested_by)
+        if self.threshold is None:
+            return self.get_response(request)
+        return self.run_sampled(request)
+
+    def run_cprofile(self, request, requested_by):
+        """Runs holding ``_cprofile_lock``, and releases it once done."""
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            response = profiler.runcall(self.get_response, request)
+        except BaseException:
+            _cprofile_lock.release()
+            raise
+
+        def finish():
+            try:
+                duration = time.perf_counter() - started
+                profiler.create_stats()
+                self.save(
+                    request,
+                    response,
+                    duration,
+                    {"kind": CPROFILE, "requested_by": requested_by},
+                    profiler.stats,
+                )
+            finally:
+                _cprofile_lock.release()
+
+        return self.finish_after_content(
+            response, lambda frame: profiler.enable(), profiler.disable, finish
+        )
+
+    def run_sampled(self, request, requested_by=None):
+        samples = self.sampler.start(sys._getframe())
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            self.sampler.stop()
+
+        def finish():
+            duration = time.perf_counter() - started
+            if requested_by is None and (duration < self.threshold or not samples):
+                return
+            meta = {
+                "kind": SAMPLED,
+                "samples": sum(samples.values()),
+                "interval": self.interval,
+            }
+            if requested_by is not None:
+                meta["requested_by"] = requested_by
+            self.save(
+                request,
+                response,
+                duration,
+                meta,
+                sampled_stats(samples, self.interval),
+                samples,
+            )
+
+        return self.finish_after_content(
+            response,
+            lambda frame: self.sampler.start(frame, samples),
+            self.sampler.stop,
+            finish,
+        )
+
+    @staticmethod
+    def finish_after_content(response, resume, pause, finish):
+        """
+        Call ``finish`` now or, for a streaming response, once its content has
+        been consumed. Async content is not followed.
+        """
+        if response.streaming and not response.is_async:
+            response.streaming_content = ProfiledContent(
+                response.streaming_content, resume, pause, finish
+            )
+        else:
+            finish()
+        return response
+
+    def save(self, request, response, duration, meta, stats, samples=None):
+        match = request.resolver_match
+        meta = {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "method": request.method,
+            "path": request.path,
+            "route": match.route if match else None,
+            "status": response.status_code,
+            "duration_ms": round(duration * 1000, 1),
+            **meta,
+        }
+        try:
+            self.store.save(meta, stats, samples)
+        except OSError:
+            # A full or read-only disk must not fail the request itself.
+            logger.exception(f"Could not save profile of {request.path}.")
+
+
+class ProfileListView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(ProfileStore().list())
+
+
+class ProfileTokenView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        return Response(
+            {
+                "header": PROFILE_HEADER,
+                "token": issue_token(request.user),
+                "expires_in": getattr(settings, "PROFILING_TOKEN_MAX_AGE", 60 * 60),
+            }
+        )
+
+
+class ProfileDownloadView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, profile_id, output):
+        path = ProfileStore().path(profile_id, output)
+        if path is None:
+            raise NotFound()
+        return FileResponse(
+            open(path, "rb"),
+            as_attachment=True,
+            filename=path.name,
+            content_type="application/octet-stream",
+        )
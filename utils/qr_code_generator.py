@@ -1,12 +1,16 @@
-import base64
-import os
-import qrcode
+import hashlib
 import io
-from PIL import Image
+import qrcode
 from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from qrcode.image.svg import SvgPathImage
+
+QR_CODE_DIR = "qr_codes"
+IMAGE_FACTORIES = {"png": None, "svg": SvgPathImage}
 
 
-def generate_qr_code(data, size=10, border=0):
+def generate_qr_code(data, size=10, border=0, image_factory=None):
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -15,33 +19,41 @@ def generate_qr_code(data, size=10, border=0):
     )
     qr.add_data(data)
     qr.make(fit=True)
-    img = qr.make_image()
+    img = qr.make_image(image_factory=image_factory)
     return img
 
 
-def generate_qr(url_text):
-    generated_code = generate_qr_code(data=url_text, size=10, border=1)
-    bio = io.BytesIO()
-    img_save = generated_code.save(bio)
-    png_qr = bio.getvalue()
-    base64qr = base64.b64encode(png_qr)
-    img_name = base64qr.decode("utf-8")
-    context_dict = dict()
-    context_dict["file_type"] = "png"
-    context_dict["image_base64"] = img_name
-    return context_dict
-
-
-def convert_base64(base64_str, id):
-    decoded_data = base64.b64decode(base64_str)
-
-    img = Image.open(io.BytesIO(decoded_data))
-
-    file_name = f"{id}-image.png"
-    file_path = os.path.join(settings.MEDIA_ROOT, "qr_codes", file_name)
-
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-
-    img.save(file_path)
-
-    return os.path.join("qr_codes", file_name)
+def render_qr(data, image_format="png", size=10, border=1):
+    """Render ``data`` as a PNG or SVG QR code and return the file bytes."""
+    if image_format not in IMAGE_FACTORIES:
+        raise ValueError(f"Unsupported QR code format: {image_format}")
+    img = generate_qr_code(
+        data, size=size, border=border, image_factory=IMAGE_FACTORIES[image_format]
+    )
+    buffer = io.BytesIO()
+    img.save(buffer)
+    return buffer.getvalue()
+
+
+def qr_code_name(data, image_format="png", size=10, border=1):
+    """Storage name derived from everything that affects the rendered image."""
+    digest = hashlib.sha256(
+        f"{image_format}:{size}:{border}:{data}".encode()
+    ).hexdigest()
+    return f"{QR_CODE_DIR}/{digest}.{image_format}"
+
+
+def store_qr(data, image_format=None, size=10, border=1, storage=None):
+    """
+    Render ``data`` to Django storage and return the stored name.
+
+    Names are content addressed, so a payload that was rendered before is
+    found with a single ``exists`` check and not rendered again.
+    """
+    image_format = image_format or settings.QR_CODE_FORMAT
+    storage = storage or default_storage
+    name = qr_code_name(data, image_format=image_format, size=size, border=border)
+    if storage.exists(name):
+        return name
+    content = render_qr(data, image_format=image_format, size=size, border=border)
+    return storage.save(name, ContentFile(content))
@@ -0,0 +1,35 @@
+class ValuesSerializer:
+    """
+    Read-only list representation built from ``.values()`` rows.
+
+    ``fields`` lists the columns to read, including lookups such as
+    ``merchant__email``. ``formatters`` maps column names to callables
+    applied to non-null values, so each value is formatted once with no
+    model instances or per-field serializer objects in between. Subclasses
+    may override ``to_representation`` to reshape a row.
+
+        rows = InvoiceListSerializer.get_queryset(Invoice.objects.all())
+        InvoiceListSerializer(rows).data
+    """
+
+    fields = ()
+    formatters = {}
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    @classmethod
+    def get_queryset(cls, queryset):
+        return queryset.values(*cls.fields)
+
+    def to_representation(self, row):
+        for name, formatter in self.formatters.items():
+            value = row[name]
+            if value is not None:
+                row[name] = formatter(value)
+        return row
+
+    @property
+    def data(self):
+        # Rows are copied: paginators still read raw values from the page.
+        return [self.to_representation(dict(row)) for row in self.rows]
@@ -0,0 +1,34 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """
+    ``TestCase`` mixin asserting that an endpoint's query count stays within
+    a fixed budget however many rows it lists.
+
+    ``seed(count)`` must create ``count`` more rows for the endpoint and
+    ``request()`` must return its response. The endpoint is requested once
+    the table holds each of ``query_budget_sizes`` rows, so a per-row query
+    shows up as a budget overrun at the larger size.
+
+        self.assertQueryBudget(1, self.seed_merchants, self.list_merchants)
+    """
+
+    query_budget_sizes = (10, 1000)
+
+    def assertQueryBudget(self, budget, seed, request, sizes=None):
+        seeded = 0
+        for size in sizes or self.query_budget_sizes:
+            seed(size - seeded)
+            seeded = size
+            with self.subTest(rows=size):
+                with CaptureQueriesContext(connection) as queries:
+                    response = request()
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(
+                    len(queries),
+                    budget,
+                    f"{len(queries)} queries listing {size} rows, budget {budget}:\n"
+                    + "\n".join(query["sql"] for query in queries),
+                )